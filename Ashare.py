@@ -1,13 +1,89 @@
 # -*- coding:utf-8 -*-    --------------Ashare 股票行情数据双核心版修复版( https://github.com/ShiroRikka/ApexSignal )
 import datetime
+import functools
 import json
+import operator
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd  #
-import requests
+import numpy as np
 
+from lazy import lazy
+from metrics import stage
+from provider_router import ProviderRouter
 
-# 腾讯日线
-def get_price_day_tx(code, end_date="", count=10, frequency="1d"):  # 日线获取
+pd = lazy("pandas")  # 导入Ashare时不加载pandas和requests, 用到时才导入
+POOL_SIZE = 16  # 每个主机保持的长连接数, 与get_prices的并发数匹配
+session = None  # 所有请求共用连接池, 避免每次重新握手; 第一次请求时创建
+_session_lock = threading.Lock()
+TIMEOUTS = {"tx": (3.05, 5), "sina": (3.05, 8)}  # 各线路(连接, 读取)超时秒数
+router = ProviderRouter()  # 线路健康统计与熔断, 替代裸except切换
+UPSTREAM = {  # 各线路的接口地址
+    "tx_day": "http://web.ifzq.gtimg.cn",
+    "tx_min": "http://ifzq.gtimg.cn",
+    "sina": "http://money.finance.sina.com.cn",
+}
+# 非空时所有线路都改为请求这个地址, 如本地回放录制响应的 upstream_stub.py
+BASE_URL = os.environ.get("ASHARE_BASE_URL", "").rstrip("/")
+
+
+# 紧凑模式: 价格用float32、成交量用int64, 行情占用的内存约减半
+# MyTT对float32输入也返回float32, 指标同样减半
+COMPACT = os.environ.get("ASHARE_COMPACT", "") == "1"
+COMPACT_DTYPES = {
+    "open": np.float32,
+    "close": np.float32,
+    "high": np.float32,
+    "low": np.float32,
+    "volume": np.int64,
+}
+
+
+def set_compact(flag=True):
+    global COMPACT
+    COMPACT = bool(flag)
+
+
+# 安静模式: 不打印每次请求走了哪条线路, 多进程批量拉取时避免刷屏; 获取失败等提示照常打印
+QUIET = os.environ.get("ASHARE_QUIET", "") == "1"
+
+
+def set_quiet(flag=True):
+    global QUIET
+    QUIET = bool(flag)
+
+
+def notice(line):  # 线路提示
+    if not QUIET:
+        print(line)
+
+
+def compact(bars):  # numpy列字典或DataFrame -> 紧凑类型, 成交量四舍五入取整
+    if bars is None:
+        return bars
+    columns = {}
+    for f, dtype in COMPACT_DTYPES.items():
+        if f in bars:
+            v = np.asarray(bars[f])
+            if dtype == np.int64:
+                v = np.rint(np.nan_to_num(v))
+            columns[f] = v.astype(dtype)
+    return dict(bars, **columns) if isinstance(bars, dict) else bars.assign(**columns)
+
+
+def set_base_url(url):  # 运行时切换上游地址, 空字符串恢复真实接口
+    global BASE_URL
+    BASE_URL = url.rstrip("/")
+
+
+def upstream(line):
+    return BASE_URL or UPSTREAM[line]
+
+
+def tx_day_params(
+    code, end_date="", count=10, frequency="1d", start_date=""
+):  # 腾讯日线param参数, 给出start_date时只返回start_date到end_date之间的K线
     unit = (
         "week" if frequency in "1w" else "month" if frequency in "1M" else "day"
     )  # 判断日线，周线，月线
@@ -20,44 +96,100 @@ def get_price_day_tx(code, end_date="", count=10, frequency="1d"):  # 日线获
     end_date = (
         "" if end_date == datetime.datetime.now().strftime("%Y-%m-%d") else end_date
     )  # 如果日期今天就变成空
-    URL = f"http://web.ifzq.gtimg.cn/appstock/app/fqkline/get?param={code},{unit},,{end_date},{count},qfq"
-    st = json.loads(requests.get(URL).content)
+    return f"{code},{unit},{start_date},{end_date},{count},qfq", unit
+
+
+BAR_FIELDS = ["open", "close", "high", "low", "volume"]
+
+
+def parse_time(s):  # 时间字符串数组 -> datetime64[ns], 兼容腾讯分钟线的202401021030格式
+    if s.size and len(s[0]) == 12 and s[0].isdigit():
+        v = s.astype(np.int64)
+        months = (v // 100000000 - 1970) * 12 + v // 1000000 % 100 - 1
+        days = months.astype("M8[M]").astype("M8[D]") + (v // 10000 % 100 - 1)
+        return days.astype("M8[ns]") + (v // 100 % 100 * 60 + v % 100).astype("m8[m]")
+    return s.astype("M8[ns]")
+
+
+def parse_bars(
+    rows, keys
+):  # 上游K线行数据 -> {time, open, close, high, low, volume} numpy列
+    pick = operator.itemgetter(*keys)  # keys按 时间,开,收,高,低,量 的顺序取值
+    table = np.array(list(map(pick, rows)), dtype=str).reshape(-1, 6)
+    values = np.ascontiguousarray(table[:, 1:].astype(float).T)  # 一次转换全部数值列
+    bars = {"time": parse_time(table[:, 0])}
+    bars.update(zip(BAR_FIELDS, values))
+    return compact(bars) if COMPACT else bars
+
+
+def bars_frame(bars, fields=BAR_FIELDS, index_name=""):  # numpy列 -> DataFrame
+    index = pd.DatetimeIndex(bars["time"], name=index_name)
+    return pd.DataFrame({f: bars[f] for f in fields}, index=index)
+
+
+def frame_bars(df):  # DataFrame -> numpy列, as_arrays模式下统一返回格式
+    bars = {"time": df.index.values}
+    bars.update((f, df[f].values) for f in BAR_FIELDS)
+    return bars
+
+
+def get_session():  # 第一次请求时才导入requests并创建连接池
+    global session
+    if session is None:
+        with _session_lock:
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                s = requests.Session()
+                for prefix in ("http://", "https://"):
+                    s.mount(
+                        prefix, HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                    )
+                session = s
+    return session
+
+
+def get_json(line, url, timeout):  # 请求和JSON解码分开计时
+    with stage(f"upstream.{line}"):
+        response = get_session().get(url, timeout=timeout)
+        response.raise_for_status()  # 5xx算线路故障, 4xx是请求本身的问题
+        content = response.content
+    with stage(f"decode.{line}"):
+        return json.loads(content)
+
+
+# 腾讯日线
+def get_price_day_tx(
+    code, end_date="", count=10, frequency="1d", as_arrays=False, start_date=""
+):  # 日线获取
+    param, unit = tx_day_params(code, end_date, count, frequency, start_date)
+    URL = f"{upstream('tx_day')}/appstock/app/fqkline/get?param={param}"
+    st = get_json("tx_day", URL, TIMEOUTS["tx"])
+    with stage("build.tx_day"):
+        df = tx_day_frame(st["data"][code], unit, as_arrays)
+    notice("当前线路为：腾讯日线\n")
+    return df
+
+
+def tx_day_frame(stk, unit, as_arrays=False):  # 腾讯日线单只股票数据 -> DataFrame
     ms = "qfq" + unit
-    stk = st["data"][code]
     buf = stk[ms] if ms in stk else stk[unit]  # 指数返回不是qfqday,是day
-    cleaned_buf = []
     for item in buf:
-        if isinstance(item, (list, tuple)) and len(item) >= 6:
-            # 只取前6个元素，不管后面是什么
-            cleaned_item = item[:6]
-            cleaned_buf.append(cleaned_item)
         # 可以选择记录包含额外信息的行
-        if (
-            isinstance(item, (list, tuple))
-            and len(item) > 6
-            and any(isinstance(x, dict) for x in item[6:])
-        ):
+        if len(item) > 6 and any(isinstance(x, dict) for x in item[6:]):
             print(f"Info: 发现带附加信息的记录: {item[0]}")
-    data = {
-        "time": [item[0] for item in cleaned_buf],
-        "open": [item[1] for item in cleaned_buf],
-        "close": [item[2] for item in cleaned_buf],
-        "high": [item[3] for item in cleaned_buf],
-        "low": [item[4] for item in cleaned_buf],
-        "volume": [item[5] for item in cleaned_buf],
-    }
-    df = pd.DataFrame(data)
-    df[["open", "close", "high", "low", "volume"]] = df[
-        ["open", "close", "high", "low", "volume"]
-    ].astype(float)
-    df.time = pd.to_datetime(df.time)
-    df.set_index(["time"], inplace=True)
-    print("当前线路为：腾讯日线\n")
-    return df
+    try:
+        bars = parse_bars(buf, range(6))  # 只取前6个元素，不管后面是什么
+    except IndexError:
+        bars = parse_bars([item for item in buf if len(item) >= 6], range(6))
+    return bars if as_arrays else bars_frame(bars, index_name="time")
 
 
 # 腾讯分钟线
-def get_price_min_tx(code, end_date=None, count=1, frequency="1d"):  # 分钟线获取
+def get_price_min_tx(
+    code, end_date=None, count=1, frequency="1d", as_arrays=False
+):  # 分钟线获取
     ts = int(frequency[:-1]) if frequency[:-1].isdigit() else 1  # 解析K线周期数
     if end_date:
         end_date = (
@@ -65,27 +197,21 @@ def get_price_min_tx(code, end_date=None, count=1, frequency="1d"):  # 分钟线
             if isinstance(end_date, datetime.date)
             else end_date.split(" ")[0]
         )
-    URL = f"http://ifzq.gtimg.cn/appstock/app/kline/mkline?param={code},m{ts},,{count}"
-    st = json.loads(requests.get(URL).content)
-    buf = st["data"][code]["m" + str(ts)]
-    df = pd.DataFrame(
-        buf, columns=["time", "open", "close", "high", "low", "volume", "n1", "n2"]
-    )
-    df = df[["time", "open", "close", "high", "low", "volume"]]
-    df[["open", "close", "high", "low", "volume"]] = df[
-        ["open", "close", "high", "low", "volume"]
-    ].astype("float")
-    df.time = pd.to_datetime(df.time)
-    df.set_index(["time"], inplace=True)
-    df.index.name = ""  # 处理索引
-    df.iloc[-1, df.columns.get_loc("close")] = float(st["data"][code]["qt"][code][3])
-    # df["close"][-1] = float(st["data"][code]["qt"][code][3])  # 最新基金数据是3位的
-    print("当前线路为：腾讯分钟线\n")
+    URL = f"{upstream('tx_min')}/appstock/app/kline/mkline?param={code},m{ts},,{count}"
+    st = get_json("tx_min", URL, TIMEOUTS["tx"])
+    with stage("build.tx_min"):
+        bars = parse_bars(st["data"][code]["m" + str(ts)], range(6))
+        if len(bars["close"]):
+            bars["close"][-1] = float(st["data"][code]["qt"][code][3])  # 最新价
+        df = bars if as_arrays else bars_frame(bars)  # 处理索引
+    notice("当前线路为：腾讯分钟线\n")
     return df
 
 
 # sina新浪全周期获取函数，分钟线 5m,15m,30m,60m  日线1d=240m   周线1w=1200m  1月=7200m
-def get_price_sina(code, end_date="", count=10, frequency="60m"):  # 新浪全周期获取函数
+def get_price_sina(
+    code, end_date="", count=10, frequency="60m", as_arrays=False
+):  # 新浪全周期获取函数
     frequency = (
         frequency.replace("1d", "240m").replace("1w", "1200m").replace("1M", "7200m")
     )
@@ -104,61 +230,195 @@ def get_price_sina(code, end_date="", count=10, frequency="60m"):  # 新浪全
             count + (datetime.datetime.now() - end_date).days // unit
         )  # 结束时间到今天有多少天自然日(肯定 >交易日)
         # print(code,end_date,count)
-    URL = f"http://money.finance.sina.com.cn/quotes_service/api/json_v2.php/CN_MarketData.getKLineData?symbol={code}&scale={ts}&ma=5&datalen={count}"
-    dstr = json.loads(requests.get(URL).content)
-    # df=pd.DataFrame(dstr,columns=['day','open','high','low','close','volume'],dtype='float')
-    df = pd.DataFrame(dstr, columns=["day", "open", "high", "low", "close", "volume"])
-    df["open"] = df["open"].astype(float)
-    df["high"] = df["high"].astype(float)  # 转换数据类型
-    df["low"] = df["low"].astype(float)
-    df["close"] = df["close"].astype(float)
-    df["volume"] = df["volume"].astype(float)
-    df.day = pd.to_datetime(df.day)
-    df.set_index(["day"], inplace=True)
-    df.index.name = ""  # 处理索引
-    if (end_date != "") & (frequency in ["240m", "1200m", "7200m"]):
-        return df[df.index <= end_date][-mcount:]  # 日线带结束时间先返回
-    print("当前线路为：新浪\n")
-    return df
+    URL = f"{upstream('sina')}/quotes_service/api/json_v2.php/CN_MarketData.getKLineData?symbol={code}&scale={ts}&ma=5&datalen={count}"
+    dstr = get_json("sina", URL, TIMEOUTS["sina"])
+    with stage("build.sina"):
+        bars = parse_bars(dstr or [], ["day", "open", "close", "high", "low", "volume"])
+        if (end_date != "") & (frequency in ["240m", "1200m", "7200m"]):
+            keep = bars["time"] <= np.datetime64(pd.Timestamp(end_date), "ns")
+            # 日线带结束时间先返回
+            bars = {k: v[keep][-mcount:] for k, v in bars.items()}
+        else:
+            notice("当前线路为：新浪\n")
+        if as_arrays:
+            return bars
+        return bars_frame(bars, ["open", "high", "low", "close", "volume"])  # 处理索引
 
 
-def get_price(
-    code, end_date="", count=10, frequency="1d", fields=[]
-):  # 对外暴露只有唯一函数，这样对用户才是最友好的
-    xcode = code.replace(".XSHG", "").replace(".XSHE", "")  # 证券代码编码兼容处理
-    xcode = (
+def normalize_code(code):  # 证券代码编码兼容处理 600000.XSHG -> sh600000
+    xcode = code.replace(".XSHG", "").replace(".XSHE", "")
+    return (
         "sh" + xcode if ("XSHG" in code) else "sz" + xcode if ("XSHE" in code) else code
     )
 
+
+def get_price(
+    code,
+    end_date="",
+    count=10,
+    frequency="1d",
+    fields=[],
+    store=None,
+    hedged=False,
+    hedge_delay=None,
+    as_arrays=False,
+):  # 对外暴露只有唯一函数，这样对用户才是最友好的; as_arrays=True返回numpy列字典
+    xcode = normalize_code(code)
+    fetch = functools.partial(
+        fetch_price, frequency=frequency, hedged=hedged, hedge_delay=hedge_delay
+    )
+    if store is not None and not end_date:  # 本地K线缓存, 只拉取缺失的尾部
+        df = store.get_price(xcode, count, frequency, fetch)
+        if COMPACT:  # 本地缓存按float64保存, 取出后再转换
+            df = compact(df)
+        return frame_bars(df) if as_arrays and df is not None else df
+    return fetch(xcode, end_date=end_date, count=count, as_arrays=as_arrays)
+
+
+def normalize_frame(df):  # 统一不同线路的列顺序和索引名, 与腾讯日线主线路一致
+    if isinstance(df, dict):
+        return df  # numpy列字典本身就是统一格式
+    return df[["open", "close", "high", "low", "volume"]].rename_axis("time")
+
+
+def fetch_price(
+    xcode,
+    end_date="",
+    count=10,
+    frequency="1d",
+    hedged=False,
+    hedge_delay=None,
+    as_arrays=False,
+):  # 直接从行情接口获取; hedged=True时日线主线路慢则同时请求备用线路
     if frequency in ["1d", "1w", "1M"]:  # 1d日线  1w周线  1M月线
-        try:
-            return get_price_day_tx(
-                xcode, end_date=end_date, count=count, frequency=frequency
-            )  # 主力
-        except:
-            return get_price_sina(
-                xcode, end_date=end_date, count=count, frequency=frequency
-            )  # 备用
-
-    if frequency in [
-        "1m",
-        "5m",
-        "15m",
-        "30m",
-        "60m",
-    ]:  # 分钟线 ,1m只有腾讯接口  5分钟5m   60分钟60m
-        if frequency in "1m":
-            return get_price_min_tx(
-                xcode, end_date=end_date, count=count, frequency=frequency
+        # 主力, 备用; 腾讯日线和分钟线是不同的接口, 分别统计健康状况
+        providers = [("tx_day", get_price_day_tx), ("sina", get_price_sina)]
+    elif frequency == "1m":  # 1m只有腾讯接口
+        providers = [("tx_min", get_price_min_tx)]
+    elif frequency in ["5m", "15m", "30m", "60m"]:  # 5分钟5m   60分钟60m
+        providers = [("tx_min", get_price_min_tx), ("sina", get_price_sina)]
+    else:
+        return None
+    calls = [
+        (name, functools.partial(fn, xcode, end_date, count, frequency, as_arrays))
+        for name, fn in providers
+    ]
+    if hedged and frequency in ["1d", "1w", "1M"]:
+        return normalize_frame(router.hedged_call(calls, delay=hedge_delay))
+    return router.call(calls)
+
+
+def get_prices(
+    codes,
+    end_date="",
+    count=10,
+    frequency="1d",
+    max_workers=8,
+    long=False,
+    pack=0,
+    store=None,
+):  # 批量获取, 共用连接池并发请求; long=True返回带code列的长表
+    codes = list(codes)
+    result = {}
+    if pack > 1 and frequency in ["1d", "1w", "1M"] and store is None:
+        for i in range(0, len(codes), pack):  # 多只股票打包进一次腾讯日线请求
+            result.update(
+                _get_price_day_tx_packed(
+                    codes[i : i + pack], end_date, count, frequency
+                )
             )
+    todo = [c for c in codes if c not in result]
+
+    def fetch(code):
         try:
-            return get_price_min_tx(
-                xcode, end_date=end_date, count=count, frequency=frequency
-            )  # 主力
-        except:
-            return get_price_sina(
-                xcode, end_date=end_date, count=count, frequency=frequency
-            )  # 备用
+            return code, get_price(code, end_date, count, frequency, store=store)
+        except Exception as e:
+            print(f"Info: {code} 获取失败: {e}")
+            return code, None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, POOL_SIZE)) as pool:
+        for code, df in pool.map(fetch, todo):
+            if df is not None:
+                result[code] = df
+    result = {c: result[c] for c in codes if c in result}  # 保持输入顺序
+    if not long:
+        return result
+    if not result:
+        return pd.DataFrame()
+    return pd.concat([df.assign(code=c) for c, df in result.items()])  # 索引为时间
+
+
+RANGE_LIMIT = 640  # 腾讯日线一次请求最多返回的K线数
+# 每根K线至少对应的自然日数, 按此切分的每段都不会超过上限
+RANGE_SPAN = {"1d": 7 / 5, "1w": 7, "1M": 28}
+
+
+def range_chunks(
+    start, end, frequency, limit=RANGE_LIMIT
+):  # [start, end]切成首尾相接的日期段
+    span = datetime.timedelta(days=int(limit * RANGE_SPAN[frequency]) - 1)
+    chunks, day = [], start
+    while day <= end:
+        stop = min(day + span, end)
+        chunks.append((day, stop))
+        day = stop + datetime.timedelta(days=1)
+    return chunks
+
+
+def get_price_range(
+    code, start, end="", frequency="1d", max_workers=4, limit=RANGE_LIMIT
+):  # 取start到end(含)之间的K线, 切成腾讯单次能返回的段并发获取, 新浪为备用
+    if frequency not in RANGE_SPAN:
+        raise ValueError(f"get_price_range只支持日线、周线、月线: {frequency}")
+    xcode = normalize_code(code)
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end or datetime.date.today()).normalize()
+    if end < start:
+        return pd.DataFrame(columns=BAR_FIELDS)
+
+    def fetch(chunk):
+        lo, hi = (d.strftime("%Y-%m-%d") for d in chunk)
+        calls = [  # 新浪没有起始日期参数, 只在腾讯失败时按结束日期多取再截取
+            (
+                "tx_day",
+                functools.partial(
+                    get_price_day_tx, xcode, hi, limit, frequency, start_date=lo
+                ),
+            ),
+            ("sina", functools.partial(get_price_sina, xcode, hi, limit, frequency)),
+        ]
+        df = normalize_frame(router.call(calls))
+        return df[(df.index >= chunk[0]) & (df.index < chunk[1] + pd.Timedelta(days=1))]
+
+    chunks = range_chunks(start, end, frequency, limit)
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(chunks), POOL_SIZE)
+    ) as pool:
+        frames = [df for df in pool.map(fetch, chunks) if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=BAR_FIELDS)
+    df = pd.concat(frames).sort_index()
+    return df[~df.index.duplicated(keep="last")]  # 备用线路的段可能与相邻段重叠
+
+
+def _get_price_day_tx_packed(codes, end_date, count, frequency):  # 返回取到的部分
+    params = [
+        tx_day_params(normalize_code(c), end_date, count, frequency) for c in codes
+    ]
+    URL = f"{upstream('tx_day')}/appstock/app/fqkline/get?" + "&".join(
+        f"param={p}" for p, _ in params
+    )
+    try:
+        data = get_json("tx_day_packed", URL, TIMEOUTS["tx"])["data"]
+    except Exception:
+        return {}  # 打包请求失败时逐只获取
+    result = {}
+    with stage("build.tx_day_packed"):
+        for c, (p, unit) in zip(codes, params):
+            stk = data.get(p.split(",")[0]) if isinstance(data, dict) else None
+            if stk:  # 接口没有返回的股票交给逐只获取
+                result[c] = tx_day_frame(stk, unit)
+    return result
 
 
 if __name__ == "__main__":
@@ -15,22 +15,46 @@
 
 # 以下所有函数如无特别说明，输入参数S均为numpy序列或者列表list，N为整型int
 # 应用层1级函数完美兼容通达信或同花顺，具体使用方法请参考通达信
+# 面板模式: S也可以是 (K线数 x 股票数) 的二维数组, 每列一只股票, 逐列计算, 结果与逐只计算一致
+# float32输入的结果仍为float32: 逐元素运算直接按float32算, 滚动和递推在float64下算完再转回
+# out=: 带这个参数的函数把结果写入给定数组并返回它, 长期运行的程序每次更新可以复用同一块内存
 
 import numpy as np
-import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from lazy import lazy
+
+pd = lazy("pandas")  # 只用到numpy的函数不必等pandas导入
 
 
 # ------------------ 0级：核心工具函数 --------------------------------------------
-def RD(N, D=3):
-    return np.round(N, D)  # 四舍五入取3位小数
+def _PD(S):  # 一维用Series, 二维面板用DataFrame, pandas按列计算语义相同
+    return pd.DataFrame(S) if np.ndim(S) == 2 else pd.Series(S)
+
+
+def _I(S, start=0):  # K线序号, 二维时为列向量以便按列广播
+    return np.arange(start, len(S) + start).reshape((-1,) + (1,) * (np.ndim(S) - 1))
+
+
+def _OUT(R, out=None, S=None):  # 结果写入out; 没有out时float32输入的结果转回float32
+    if out is not None:
+        np.copyto(out, R, casting="same_kind")
+        return out
+    if getattr(S, "dtype", None) == np.float32 and R.dtype == np.float64:
+        return R.astype(np.float32)
+    return R
+
+
+def RD(N, D=3, out=None):
+    return np.round(N, D, out=out)  # 四舍五入取3位小数
 
 
 def RET(S, N=1):
     return np.array(S)[-N]  # 返回序列倒数第N个值,默认返回最后一个
 
 
-def ABS(S):
-    return np.abs(S)  # 返回N的绝对值
+def ABS(S, out=None):
+    return np.abs(S, out=out)  # 返回N的绝对值
 
 
 def LN(S):
@@ -57,120 +81,158 @@ def TAN(S):
     return np.tan(S)  # 求S的正切值（弧度)
 
 
-def MAX(S1, S2):
-    return np.maximum(S1, S2)  # 序列max
+def MAX(S1, S2, out=None):
+    return np.maximum(S1, S2, out=out)  # 序列max
 
 
-def MIN(S1, S2):
-    return np.minimum(S1, S2)  # 序列min
+def MIN(S1, S2, out=None):
+    return np.minimum(S1, S2, out=out)  # 序列min
 
 
 def IF(S, A, B):
     return np.where(S, A, B)  # 序列布尔判断 return=A  if S==True  else  B
 
 
-def REF(S, N=1):  # 对序列整体下移动N,返回序列(shift后会产生NAN)
-    return pd.Series(S).shift(N).values
+def REF(S, N=1, out=None):  # 对序列整体下移动N,返回序列(shift后会产生NAN)
+    S = np.asarray(S)
+    if S.dtype.kind != "f" or N < 0:  # 整数和布尔序列补nan要改类型, 交给pandas
+        return _OUT(_PD(S).shift(N).values, out)
+    R = np.empty_like(S) if out is None else out
+    N = min(N, len(S))
+    R[N:] = S[: len(S) - N]  # 直接切片移位, 不经过pandas多拷贝一次
+    R[:N] = np.nan
+    return R
 
 
-def DIFF(S, N=1):  # 前一个值减后一个值,前面会产生nan
-    return pd.Series(S).diff(N).values  # np.diff(S)直接删除nan，会少一行
+def DIFF(S, N=1, out=None):  # 前一个值减后一个值,前面会产生nan
+    S = np.asarray(S)
+    if S.dtype.kind != "f" or N < 0:
+        return _OUT(_PD(S).diff(N).values, out)  # np.diff(S)直接删除nan，会少一行
+    R = np.empty_like(S) if out is None else out
+    N = min(N, len(S))
+    np.subtract(S[N:], S[: len(S) - N], out=R[N:])
+    R[:N] = np.nan
+    return R
 
 
-def STD(S, N):  # 求序列的N日标准差，返回序列
-    return pd.Series(S).rolling(N).std(ddof=0).values
+def STD(S, N, out=None):  # 求序列的N日标准差，返回序列
+    return _OUT(_PD(S).rolling(N).std(ddof=0).values, out, S)
 
 
-def SUM(S, N):  # 对序列求N天累计和，返回序列    N=0对序列所有依次求和
-    return (
-        pd.Series(S).rolling(N).sum().values if N > 0 else pd.Series(S).cumsum().values
-    )
+def SUM(S, N, out=None):  # 对序列求N天累计和，返回序列    N=0对序列所有依次求和
+    R = _PD(S).rolling(N).sum().values if N > 0 else _PD(S).cumsum().values
+    return _OUT(R, out, S)
 
 
 def CONST(S):  # 返回序列S最后的值组成常量序列
-    return np.full(len(S), S[-1])
+    return np.full(np.shape(S), np.asarray(S)[-1])
+
+
+def HHV(S, N, out=None):  # HHV(C, 5) 最近5天收盘最高价
+    return _OUT(_EXTREME(S, N, "max"), out, S)
+
+
+def LLV(S, N, out=None):  # LLV(C, 5) 最近5天收盘最低价
+    return _OUT(_EXTREME(S, N, "min"), out, S)
 
 
-def HHV(S, N):  # HHV(C, 5) 最近5天收盘最高价
-    return pd.Series(S).rolling(N).max().values
+def _EXTREME(S, N, how):  # 最值与计算顺序无关, 面板各列首尾相接成一条序列一次算完
+    if np.ndim(S) != 2:
+        return getattr(pd.Series(S).rolling(N), how)().values
+    S = np.asarray(S, dtype=float)
+    R = getattr(pd.Series(S.ravel("F")).rolling(N), how)().to_numpy(copy=True)
+    R = R.reshape(S.shape, order="F")
+    R[: max(N - 1, 0)] = np.nan  # 每列前N-1个窗口跨到了上一列
+    return R
 
 
-def LLV(S, N):  # LLV(C, 5) 最近5天收盘最低价
-    return pd.Series(S).rolling(N).min().values
+def ROLLING(S, N, F, CHUNK=1 << 16):  # 代替rolling.apply, F(W)在最后一维的窗口上求值
+    S = np.asarray(S, dtype=float)  # W为(窗口数,N)视图, 含nan的窗口为nan
+    R = np.full(S.shape, np.nan)
+    if N < 1 or N > len(S):
+        return R
+    if S.ndim == 2:  # 面板逐列算: 窗口内求和、点积的顺序随内存布局而变
+        for j in range(S.shape[1]):
+            R[:, j] = ROLLING(S[:, j], N, F, CHUNK)
+        return R
+    W = sliding_window_view(np.ascontiguousarray(S), N)
+    K = max(1, CHUNK // N)  # 分块计算, 限制临时数组大小
+    for i in range(0, len(W), K):
+        R[N - 1 + i : N - 1 + i + K] = F(W[i : i + K])
+    C = np.concatenate(([0], np.cumsum(np.isnan(S))))
+    R[N - 1 :][C[N:] > C[:-N]] = np.nan
+    return R
 
 
 def HHVBARS(S, N):  # 求N周期内S最高值到当前周期数, 返回序列
-    return pd.Series(S).rolling(N).apply(lambda x: np.argmax(x[::-1]), raw=True).values
+    return ROLLING(S, N, lambda W: np.argmax(W[..., ::-1], axis=-1))
 
 
 def LLVBARS(S, N):  # 求N周期内S最低值到当前周期数, 返回序列
-    return pd.Series(S).rolling(N).apply(lambda x: np.argmin(x[::-1]), raw=True).values
+    return ROLLING(S, N, lambda W: np.argmin(W[..., ::-1], axis=-1))
 
 
-def MA(S, N):  # 求序列的N日简单移动平均值，返回序列
-    return pd.Series(S).rolling(N).mean().values
+def MA(S, N, out=None):  # 求序列的N日简单移动平均值，返回序列
+    return _OUT(_PD(S).rolling(N).mean().values, out, S)
 
 
-def EMA(S, N):  # 指数移动平均,为了精度 S>4*N  EMA至少需要120周期     alpha=2/(span+1)
-    return pd.Series(S).ewm(span=N, adjust=False).mean().values
+def EMA(
+    S, N, out=None
+):  # 指数移动平均,为了精度 S>4*N  EMA至少需要120周期     alpha=2/(span+1)
+    return _OUT(_PD(S).ewm(span=N, adjust=False).mean().values, out, S)
 
 
 def SMA(
-    S, N, M=1
+    S, N, M=1, out=None
 ):  # 中国式的SMA,至少需要120周期才精确 (雪球180周期)    alpha=1/(1+com)
-    return pd.Series(S).ewm(alpha=M / N, adjust=False).mean().values  # com=N-M/M
+    R = _PD(S).ewm(alpha=M / N, adjust=False).mean().values  # com=N-M/M
+    return _OUT(R, out, S)
 
 
 def WMA(
     S, N
 ):  # 通达信S序列的N日加权移动平均 Yn = (1*X1+2*X2+3*X3+...+n*Xn)/(1+2+3+...+Xn)
-    return (
-        pd.Series(S)
-        .rolling(N)
-        .apply(lambda x: x[::-1].cumsum().sum() * 2 / N / (N + 1), raw=True)
-        .values
-    )
+    return ROLLING(S, N, lambda W: W[..., ::-1].cumsum(-1).sum(-1) * 2 / N / (N + 1))
 
 
 def DMA(S, A):  # 求S的动态移动平均，A作平滑因子,必须 0<A<1  (此为核心函数，非指标）
     if isinstance(A, (int, float)):
-        return pd.Series(S).ewm(alpha=A, adjust=False).mean().values
-    A = np.array(A)
+        return _PD(S).ewm(alpha=A, adjust=False).mean().values
+    A = np.array(A, dtype=float)
     A[np.isnan(A)] = 1.0
-    Y = np.zeros(len(S))
-    Y[0] = S[0]
-    for i in range(1, len(S)):
-        Y[i] = A[i] * S[i] + (1 - A[i]) * Y[i - 1]  # A支持序列 by jqz1226
-    return Y
+    S = np.asarray(S, dtype=float)
+    AS, A1 = A * S, 1 - A  # Y[i] = A[i]*S[i] + (1-A[i])*Y[i-1]  A支持序列 by jqz1226
+    # 每步依赖上一步的结果, 改写成累乘累加会改变舍入, 仍逐行递推; 二维时每行一次算完所有列
+    if S.ndim == 2:
+        Y = np.empty_like(S)
+        Y[0] = S[0]
+        for i in range(1, len(S)):
+            Y[i] = AS[i] + A1[i] * Y[i - 1]
+        return Y
+    Y, y = [S[0]], float(S[0])
+    for a, b in zip(AS[1:].tolist(), A1[1:].tolist()):
+        y = a + b * y
+        Y.append(y)
+    return np.array(Y)
 
 
 def AVEDEV(S, N):  # 平均绝对偏差  (序列与其平均值的绝对差的平均值)
-    return pd.Series(S).rolling(N).apply(lambda x: (np.abs(x - x.mean())).mean()).values
+    return ROLLING(S, N, lambda W: np.abs(W - W.mean(-1, keepdims=True)).mean(-1))
 
 
-def SLOPE(S, N):  # 返S序列N周期回线性回归斜率
-    return (
-        pd.Series(S)
-        .rolling(N)
-        .apply(lambda x: np.polyfit(range(N), x, deg=1)[0], raw=True)
-        .values
-    )
+def SLOPE(S, N):  # 返S序列N周期回线性回归斜率  (最小二乘闭式解, 窗口与中心化的x做点积)
+    X = np.arange(N) - (N - 1) / 2
+    return ROLLING(S, N, lambda W: W @ X) / (X @ X)
 
 
 def FORCAST(S, N):  # 返回S序列N周期回线性回归后的预测值， jqz1226改进成序列出
-    return (
-        pd.Series(S)
-        .rolling(N)
-        .apply(lambda x: np.polyval(np.polyfit(range(N), x, deg=1), N - 1), raw=True)
-        .values
-    )
+    return MA(S, N) + SLOPE(S, N) * (N - 1) / 2  # 回归线过(均值x, 均值y), 预测x=N-1处
 
 
 def LAST(S, A, B):  # 从前A日到前B日一直满足S_BOOL条件, 要求A>B & A>0 & B>=0
     return np.array(
-        pd.Series(S).rolling(A + 1).apply(lambda x: np.all(x[::-1][B:]), raw=True),
-        dtype=bool,
-    )
+        ROLLING(S, A + 1, lambda W: np.all(W[..., : A + 1 - B], axis=-1)), dtype=bool
+    )  # 前A个周期为nan,转成bool后为True
 
 
 # ------------------   1级：应用层函数(通过0级核心函数实现）使用方法请参考通达信--------------------------------
@@ -187,43 +249,47 @@ def EXIST(S, N):  # EXIST(CLOSE>3010, N=5)  n日内是否存在一天大于3000
 
 
 def FILTER(S, N):  # FILTER函数，S满足条件后，将其后N周期内的数据置为0, FILTER(C==H,5)
-    for i in range(len(S)):
-        S[i + 1 : i + 1 + N] = 0 if S[i] else S[i + 1 : i + 1 + N]
+    S = np.array(S)  # 不修改传入的序列
+    if S.ndim == 2:  # 面板按行推进, 每列记录上次保留信号的位置
+        last = np.full(S.shape[1], -N - 1)
+        for i in range(len(S)):
+            S[i, i <= last + N] = 0
+            last[S[i] != 0] = i
+        return S
+    T, i = np.flatnonzero(S), 0  # 只在成立的位置之间跳转
+    while i < len(T):
+        S[T[i] + 1 : T[i] + 1 + N] = 0
+        i = np.searchsorted(T, T[i] + N, side="right")
     return S  # 例：FILTER(C==H,5) 涨停后，后5天不再发出信号
 
 
 def BARSLAST(
     S,
 ):  # 上一次条件成立到当前的周期, BARSLAST(C/REF(C,1)>=1.1) 上一次涨停到今天的天数
-    M = np.concatenate(([0], np.where(S, 1, 0)))
-    for i in range(1, len(M)):
-        M[i] = 0 if M[i] else M[i - 1] + 1
-    return M[1:]
+    I = _I(S)  # 从未成立时为到序列开头的周期数+1
+    return I - np.maximum.accumulate(np.where(S, I, -1))
 
 
 def BARSLASTCOUNT(S):  # 统计连续满足S条件的周期数        by jqz1226
-    rt = np.zeros(len(S) + 1)  # BARSLASTCOUNT(CLOSE>OPEN)表示统计连续收阳的周期数
-    for i in range(len(S)):
-        rt[i + 1] = rt[i] + 1 if S[i] else rt[i + 1]
-    return rt[1:]
+    I = _I(S, 1)  # BARSLASTCOUNT(CLOSE>OPEN)表示统计连续收阳的周期数
+    return (I - np.maximum.accumulate(np.where(S, 0, I))).astype(float)
 
 
 def BARSSINCEN(S, N):  # N周期内第一次S条件成立到现在的周期数,N为常量  by jqz1226
-    return (
-        pd.Series(S)
-        .rolling(N)
-        .apply(lambda x: N - 1 - np.argmax(x) if np.argmax(x) or x[0] else 0, raw=True)
-        .fillna(0)
-        .values.astype(int)
-    )
+    def F(W):
+        I = np.argmax(W, axis=-1)
+        return np.where((I != 0) | (W[..., 0] != 0), N - 1 - I, 0)
+
+    return np.nan_to_num(ROLLING(S, N, F), nan=0).astype(int)
 
 
 def CROSS(
     S1, S2
 ):  # 判断向上金叉穿越 CROSS(MA(C,5),MA(C,10))  判断向下死叉穿越 CROSS(MA(C,10),MA(C,5))
-    return np.concatenate(
-        ([False], np.logical_not((S1 > S2)[:-1]) & (S1 > S2)[1:])
-    )  # 不使用0级函数,移植方便  by jqz1226
+    X = np.asarray(S1 > S2)  # 不使用0级函数,移植方便  by jqz1226
+    R = np.zeros(X.shape, dtype=bool)  # 第一根K线不算交叉
+    R[1:] = np.logical_not(X[:-1]) & X[1:]
+    return R
 
 
 def LONGCROSS(
@@ -237,7 +303,7 @@ def LONGCROSS(
 def VALUEWHEN(
     S, X
 ):  # 当S条件成立时,取X的当前值,否则取VALUEWHEN的上个成立时的X值   by jqz1226
-    return pd.Series(np.where(S, X, np.nan)).ffill().values
+    return _PD(np.where(S, X, np.nan)).ffill().values
 
 
 def BETWEEN(S, A, B):  # S处于A和B之间时为真。 包括 A<S<B 或 A>S>B
@@ -245,38 +311,51 @@ def BETWEEN(S, A, B):  # S处于A和B之间时为真。 包括 A<S<B 或 A>S>B
 
 
 def TOPRANGE(S):  # TOPRANGE(HIGH)表示当前最高价是近多少周期内最高价的最大值 by jqz1226
-    rt = np.zeros(len(S))
-    for i in range(1, len(S)):
-        rt[i] = np.argmin(np.flipud(S[:i] < S[i]))
-    return rt.astype("int")
+    return _RANGE(S, lambda a, b: a < b)
 
 
 def LOWRANGE(S):  # LOWRANGE(LOW)表示当前最低价是近多少周期内最低价的最小值 by jqz1226
-    rt = np.zeros(len(S))
-    for i in range(1, len(S)):
-        rt[i] = np.argmin(np.flipud(S[:i] > S[i]))
-    return rt.astype("int")
+    return _RANGE(S, lambda a, b: a > b)
+
+
+def _RANGE(S, beaten):  # 单调栈: 向前连续满足beaten(S[j],S[i])的周期数,全部满足时为0
+    if np.ndim(S) == 2:  # 栈依赖前面的全部K线, 面板只能逐列计算
+        return np.column_stack([_RANGE(s, beaten) for s in np.asarray(S).T])
+    S, rt, stack = np.asarray(S).tolist(), np.zeros(len(S), dtype=int), []
+    for i, x in enumerate(S):
+        while stack and beaten(S[stack[-1]], x):
+            stack.pop()  # 被当前值超过的位置以后也不会再挡住
+        rt[i] = i - 1 - stack[-1] if stack else 0
+        stack.append(i)
+    return rt
 
 
 # ------------------   2级：技术指标函数(全部通过0级，1级函数实现） ------------------------------
-def MACD(CLOSE, SHORT=12, LONG=26, M=9):  # EMA的关系，S取120日，和雪球小数点2位相同
+# out为各输出的缓冲区组成的元组, 如 MACD(C, out=(DIF, DEA, BAR))
+def MACD(
+    CLOSE, SHORT=12, LONG=26, M=9, out=None
+):  # EMA的关系，S取120日，和雪球小数点2位相同
     DIF = EMA(CLOSE, SHORT) - EMA(CLOSE, LONG)
     DEA = EMA(DIF, M)
     MACD = (DIF - DEA) * 2
-    return RD(DIF), RD(DEA), RD(MACD)
+    return (
+        RD(DIF, out=out and out[0]),
+        RD(DEA, out=out and out[1]),
+        RD(MACD, out=out and out[2]),
+    )
 
 
-def KDJ(CLOSE, HIGH, LOW, N=9, M1=3, M2=3):  # KDJ指标
+def KDJ(CLOSE, HIGH, LOW, N=9, M1=3, M2=3, out=None):  # KDJ指标
     RSV = (CLOSE - LLV(LOW, N)) / (HHV(HIGH, N) - LLV(LOW, N)) * 100
-    K = EMA(RSV, (M1 * 2 - 1))
-    D = EMA(K, (M2 * 2 - 1))
-    J = K * 3 - D * 2
+    K = EMA(RSV, (M1 * 2 - 1), out=out and out[0])
+    D = EMA(K, (M2 * 2 - 1), out=out and out[1])
+    J = _OUT(K * 3 - D * 2, out and out[2])
     return K, D, J
 
 
-def RSI(CLOSE, N=24):  # RSI指标,和通达信小数点2位相同
-    DIF = CLOSE - REF(CLOSE, 1)
-    return RD(SMA(MAX(DIF, 0), N) / SMA(ABS(DIF), N) * 100)
+def RSI(CLOSE, N=24, out=None):  # RSI指标,和通达信小数点2位相同
+    DIF = DIFF(CLOSE, 1)  # 与 CLOSE-REF(CLOSE,1) 相同, 少一个临时数组
+    return RD(SMA(MAX(DIF, 0), N) / SMA(ABS(DIF), N) * 100, out=out)
 
 
 def WR(CLOSE, HIGH, LOW, N=10, N1=6):  # W&R 威廉指标
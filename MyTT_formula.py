@@ -0,0 +1,132 @@
+# -*- coding:utf-8 -*-    --------------通达信公式编译( https://github.com/ShiroRikka/ApexSignal )
+# 把通达信(麦语言)公式文本编译成MyTT_pipeline的计算计划, 同一公式只解析、展开一次
+# 常量和常量变量(N:=9)在编译时算好, 相同的子表达式(如两处LLV(L,9))只算一次, 输出用不到的语句不算
+# 编译好的计划按公式的哈希缓存, 对几千只股票计算同一公式时只有第一次付出编译的代价
+#
+#   f = compile_formula("RSV:=(C-LLV(L,9))/(HHV(H,9)-LLV(L,9))*100; K:SMA(RSV,3,1); D:SMA(K,3,1);")
+#   f.run(df)                 # {'K': array, 'D': array}, 也可以 f.run(CLOSE=close, HIGH=high, LOW=low)
+#   print(f.describe())       # 编译后的计划, 每行一个运算
+#
+# 支持 := 定义变量、: 定义输出(不带名字的表达式也是输出)、{...}和//注释, AND OR NOT = <> 以及
+# MyTT里的全部函数; 名字不区分大小写, 输出语句逗号后的画线属性(COLORRED, NODRAW...)忽略
+import hashlib
+import re
+
+from MyTT_pipeline import ALIASES, FUNCS, INPUTS, Graph, Pipeline
+
+COMMENT = re.compile(r"\{[^}]*\}|//[^\n]*")
+TOKEN = re.compile(
+    r"\s+|(?P<number>\d+\.?\d*|\.\d+)|(?P<name>[^\W\d]\w*)"
+    r"|(?P<op>:=|<>|>=|<=|!=|==|&&|\|\||[-+*/(),;:<>=\[\]])"
+)
+OPERATORS = {"=": "==", "<>": "!=", "&&": "and", "||": "or"}
+KEYWORDS = {"AND": "and", "OR": "or", "NOT": "not"}
+RENAMES = {"VOLUME": "VOL", "IFF": "IF"}  # 通达信里的别名
+PLAN_CACHE = 256  # 缓存的公式数, 超过时丢掉最早编译的
+
+_plans = {}  # 公式哈希 -> Formula
+
+
+def tokens(text):
+    """公式文本 -> 记号列表, 去掉注释和空白, 名字转成大写"""
+    text, result, pos = COMMENT.sub(" ", text), [], 0
+    while pos < len(text):
+        m = TOKEN.match(text, pos)
+        if m is None:
+            raise ValueError(
+                f"公式中无法识别的字符 {text[pos]!r}: {text[pos : pos + 20]}"
+            )
+        if m.lastgroup == "name":
+            result.append(m.group().upper())
+        elif m.lastgroup:
+            result.append(m.group())
+        pos = m.end()
+    return result
+
+
+def _text(items):  # 不带名字的输出语句以表达式本身为名, 如 CROSS(K,D)
+    text = ""
+    for t in items:
+        if t in ("AND", "OR"):
+            text += f" {t} "
+        elif text[-1:].isalnum() and t[0].isalnum():
+            text += " " + t
+        else:
+            text += t
+    return text
+
+
+def _python(items):  # 一条语句的表达式记号 -> MyTT_pipeline能计算的Python表达式
+    words = []
+    for t in items:
+        t = RENAMES.get(t, t)
+        words.append(KEYWORDS.get(t) or OPERATORS.get(t, t))
+    return " ".join(words)
+
+
+def parse(text):
+    """公式 -> [(名字, Python表达式, 是否输出)]"""
+    statements, current = [], []
+    for t in tokens(text) + [";"]:
+        if t != ";":
+            current.append(t)
+            continue
+        if current:
+            statements.append(_statement(current))
+        current = []
+    return statements
+
+
+def _statement(items):
+    name, output = "", True
+    if len(items) >= 2 and items[1] in (":=", ":") and items[0][0].isidentifier():
+        name, output, items = items[0], items[1] == ":", items[2:]
+        if name in FUNCS or name in INPUTS or name in ALIASES or name in KEYWORDS:
+            raise ValueError(f"变量名 {name} 与函数或行情重名")
+    depth = 0
+    for i, t in enumerate(items):  # 括号外的逗号之后是画线属性
+        depth += {"(": 1, ")": -1}.get(t, 0)
+        if t == "," and depth == 0:
+            items = items[:i]
+            break
+    if not items:
+        raise ValueError(f"语句 {name} 没有表达式")
+    return name or _text(items), _python(items), output
+
+
+class Formula(Pipeline):  # 编译好的公式, run/stats/describe与Pipeline相同
+    def __init__(self, text):
+        self.source = text
+        self.graph = Graph()
+        self.outputs = {}
+        names = {}  # 已定义的变量 -> 节点, 常量变量直接是数值
+        for name, expr, output in parse(text):
+            value = self.graph.request(expr, names)
+            names[name] = value
+            if output:
+                self.outputs[name] = value  # 输出按语句的名字
+        if not self.outputs:
+            raise ValueError("公式没有输出: 输出语句写成 名字:表达式 或只写表达式")
+        self.specs = list(self.outputs)
+        self._plan()
+
+
+# 去掉注释、空白并统一大小写后的哈希, 排版不同的同一公式共用计划
+def formula_hash(text):
+    return hashlib.blake2b(" ".join(tokens(text)).encode(), digest_size=16).hexdigest()
+
+
+def compile_formula(text):
+    """编译通达信公式, 已编译过的直接返回缓存的计划"""
+    key = formula_hash(text)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = Formula(text)
+        if len(_plans) >= PLAN_CACHE:
+            _plans.pop(next(iter(_plans)))
+        _plans[key] = plan
+    return plan
+
+
+def evaluate(text, data=None, **inputs):  # 只算一次时的便捷写法
+    return compile_formula(text).run(data, **inputs)
@@ -0,0 +1,334 @@
+# -*- coding:utf-8 -*-    --------------MyTT指标流水线( https://github.com/ShiroRikka/ApexSignal )
+# 把要计算的多个指标展开成基础运算的有向无环图, 相同的子表达式只算一次
+# 例: KDJ里的LLV(LOW,9)、BOLL里的STD(CLOSE,20)、RSI和PSY共用的REF(CLOSE,1)
+#
+#   pipe = Pipeline(["KDJ(9,3,3)", "MACD(12,26,9)", "RSI(14)", "BOLL(20,2)"])
+#   result = pipe.run(df)                 # {'KDJ(9,3,3)': (K, D, J), ...}
+#   Pipeline(["CROSS(MA(C,5), MA(C,20))", "RSI < 30"])   # 也可以是公式, C/O/H/L/V为行情
+#
+# 指标公式直接取自MyTT: 只调用其他MyTT函数的函数(KDJ, MACD, COUNT...)用符号节点重放展开,
+# 其余函数(MA, EMA, REF...)作为基础运算, 由MyTT原函数计算, 结果与直接调用逐位一致
+import ast
+import inspect
+import operator
+import time
+import types
+
+import MyTT
+
+INPUTS = {
+    "CLOSE": "close",
+    "OPEN": "open",
+    "HIGH": "high",
+    "LOW": "low",
+    "VOL": "volume",
+}
+FUNCS = {
+    name: f
+    for name, f in vars(MyTT).items()
+    if inspect.isfunction(f) and f.__module__ == MyTT.__name__
+}
+SIGNATURES = {name: inspect.signature(f) for name, f in FUNCS.items()}
+OPERATORS = {
+    "add": operator.add,
+    "sub": operator.sub,
+    "mul": operator.mul,
+    "truediv": operator.truediv,
+    "pow": operator.pow,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "and_": operator.and_,
+    "or_": operator.or_,
+    "neg": operator.neg,
+    "invert": operator.invert,
+}
+
+
+def is_composite(
+    f,
+):  # 函数体只调用MyTT函数(且没有lambda)时可以展开, 否则作为一个基础运算
+    code = f.__code__
+    nested = any(isinstance(c, types.CodeType) for c in code.co_consts)
+    return not nested and set(code.co_names) <= FUNCS.keys()
+
+
+class Node:  # 图中的一个序列, 运算符重载把表达式记录成新的节点
+    __slots__ = ("graph", "id")
+    __hash__ = None
+
+    def __init__(self, graph, id):
+        self.graph = graph
+        self.id = id
+
+    def __bool__(self):
+        raise TypeError("指标公式展开时不能对序列做条件判断")
+
+    def __neg__(self):
+        return self.graph.add("neg", self)
+
+    def __invert__(self):
+        return self.graph.add("invert", self)
+
+
+def _binary(op, reflected=False):
+    if reflected:
+        return lambda self, other: self.graph.add(op, other, self)
+    return lambda self, other: self.graph.add(op, self, other)
+
+
+for _op in ["add", "sub", "mul", "truediv", "pow", "and_", "or_"]:
+    _name = _op.rstrip("_")
+    setattr(Node, f"__{_name}__", _binary(_op))
+    setattr(Node, f"__r{_name}__", _binary(_op, reflected=True))
+for _op in ["gt", "ge", "lt", "le", "eq", "ne"]:
+    setattr(Node, f"__{_op}__", _binary(_op))
+
+
+class Graph:  # 按创建顺序保存节点, 创建顺序即拓扑顺序; 结构相同的节点只保存一次
+    def __init__(self):
+        self.nodes = []  # [(运算名, 参数)], 参数为Node或常量
+        self.calls = 0  # 展开过程中请求的运算次数(去重前)
+        self._index = {}  # 结构键 -> 节点序号
+        self._traced = {}  # 函数名 -> 用符号节点重放的函数
+
+    def add(self, op, *args):
+        self.calls += 1
+        key = (op,) + tuple(self._key(a) for a in args)
+        if key not in self._index:
+            self._index[key] = len(self.nodes)
+            self.nodes.append((op, args))
+        return Node(self, self._index[key])
+
+    @staticmethod
+    def _key(a):  # 节点按序号区分, 常量连类型一起比较(1和1.0、True不算同一个参数)
+        if isinstance(a, Node):
+            return ("node", a.id)
+        try:
+            hash(a)
+        except TypeError:
+            return ("const", id(a))
+        return ("const", type(a).__name__, a)
+
+    def input(self, name):
+        return self.add("input", name)
+
+    def call(self, name, *args, **kwargs):  # MA(S,5)与MA(S,N=5)视为同一节点
+        bound = SIGNATURES[name].bind(*args, **kwargs)
+        bound.apply_defaults()
+        args = tuple(bound.arguments.values())
+        if name == "_OUT" and bound.arguments["out"] is None:
+            return args[0]  # 没有外部缓冲区时什么也不做, 不必成为一个节点
+        if is_composite(FUNCS[name]):
+            return self._trace(name)(*args)
+        return self.add(name, *args)
+
+    def _trace(self, name):  # 同一份字节码换一套全局名字: 函数体内的MyTT调用都变成call
+        if name not in self._traced:
+            f = FUNCS[name]
+            scope = {n: self._caller(n) for n in FUNCS}
+            scope["__builtins__"] = __builtins__
+            self._traced[name] = types.FunctionType(
+                f.__code__, scope, name, f.__defaults__, f.__closure__
+            )
+        return self._traced[name]
+
+    def _caller(self, name):
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def request(self, spec, names=None):  # 指标或公式 -> 输出节点
+        # 如 "KDJ(9,3,3)"、"CROSS(MA(C,5),MA(C,20))"、"RSI < 30"
+        # names为公式里可用的其他名字 -> 节点或常量, 如通达信公式前面语句定义的变量
+        names = names or {}
+        tree = _Formula().visit(ast.parse(spec.strip(), mode="eval"))
+        for node in ast.walk(tree):
+            if not isinstance(node, FORMULA_NODES):
+                raise ValueError(f"公式中不支持 {type(node).__name__}: {spec}")
+            if isinstance(node, ast.Name) and node.id not in FUNCS:
+                known = node.id in INPUTS or node.id in ALIASES or node.id in names
+                if not known:
+                    raise ValueError(f"未知的名字 {node.id}: {spec}")
+        scope = {n: self._filler(n) for n in FUNCS}
+        scope.update(names)
+        # 只为用到的行情建输入节点
+        for name in {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}:
+            if name not in names and (name in INPUTS or name in ALIASES):
+                scope[name] = self.input(ALIASES.get(name, name))
+        code = compile(ast.fix_missing_locations(tree), "<formula>", "eval")
+        return eval(code, {"__builtins__": {}}, scope)
+
+    def _filler(self, name):  # 省略开头的序列参数时按名字接行情, S接收盘价
+        def fill(*args, **kwargs):
+            if not args or not isinstance(args[0], Node):
+                series = []
+                for p in SIGNATURES[name].parameters:
+                    if p not in INPUTS and p != "S" or p in kwargs:
+                        break
+                    series.append(self.input(p if p in INPUTS else "CLOSE"))
+                args = (*series, *args)
+            return self.call(name, *args, **kwargs)
+
+        return fill
+
+
+ALIASES = {"C": "CLOSE", "O": "OPEN", "H": "HIGH", "L": "LOW", "V": "VOL"}
+FORMULA_NODES = (
+    ast.Expression,
+    ast.Call,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+    ast.keyword,
+    ast.Subscript,
+    ast.Tuple,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Compare,
+    ast.operator,
+    ast.unaryop,
+    ast.cmpop,
+)
+
+
+class _Formula(ast.NodeTransformer):  # and/or/not改成& | ~, 单独的指标名视为调用
+    def visit_Call(self, node):
+        node.args = [self.visit(a) for a in node.args]
+        node.keywords = [self.visit(k) for k in node.keywords]
+        return node  # 函数名本身保持不变
+
+    def visit_Name(self, node):
+        if node.id in FUNCS:
+            return ast.Call(node, [], [])  # RSI < 30 即 RSI() < 30
+        return node
+
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(v) for v in node.values]
+        result = values[0]
+        for v in values[1:]:
+            result = ast.BinOp(result, op, v)
+        return result
+
+    def visit_UnaryOp(self, node):
+        node = self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            node.op = ast.Invert()
+        return node
+
+    def visit_Compare(self, node):  # 20 < RSI < 80 拆成 (20 < RSI) & (RSI < 80)
+        node = self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        items = [node.left, *node.comparators]
+        parts = [
+            ast.Compare(items[i], [op], [items[i + 1]]) for i, op in enumerate(node.ops)
+        ]
+        result = parts[0]
+        for p in parts[1:]:
+            result = ast.BinOp(result, ast.BitAnd(), p)
+        return result
+
+
+class Pipeline:  # 一次展开, 多次计算
+    def __init__(self, specs):
+        self.specs = list(specs)
+        self.graph = Graph()
+        self.outputs = {spec: self.graph.request(spec) for spec in self.specs}
+        self._plan()
+
+    def _plan(self):  # 输出确定后, 找出要算的节点和各节点最后一次被用到的位置
+        self._keep = {n.id for n in _flatten(self.outputs.values())}
+        # 只算输出用得到的节点, 如 MACD(...)[0] 不必算DEA和MACD柱
+        self._live = set(self._keep)
+        for i in range(len(self.graph.nodes) - 1, -1, -1):
+            if i in self._live:
+                args = self.graph.nodes[i][1]
+                self._live.update(a.id for a in args if isinstance(a, Node))
+        self._owner = {}  # 节点序号 -> 计时归属的输出, 共用的节点算在最先请求它的输出上
+        for spec, out in self.outputs.items():
+            stack = [n.id for n in _flatten([out])]
+            while stack:
+                i = stack.pop()
+                if i not in self._owner:
+                    self._owner[i] = spec
+                    args = self.graph.nodes[i][1]
+                    stack.extend(a.id for a in args if isinstance(a, Node))
+        self._last_use = {}  # 节点序号 -> 最后一次被用到的节点序号, 之后即可释放
+        for i, (op, args) in enumerate(self.graph.nodes):
+            for a in args:
+                if isinstance(a, Node) and i in self._live:
+                    self._last_use[a.id] = i
+
+    def run(
+        self, data=None, timings=None, **inputs
+    ):  # data为DataFrame, 或者直接传CLOSE=...(可为二维面板); timings字典按输出累计耗时
+        values = {}
+        for i, (op, args) in enumerate(self.graph.nodes):
+            if i not in self._live:
+                continue
+            if op == "input":
+                name = args[0]
+                values[i] = (
+                    inputs[name] if name in inputs else data[INPUTS[name]].values
+                )
+                continue
+            args = [values[a.id] if isinstance(a, Node) else a for a in args]
+            fn = OPERATORS.get(op) or FUNCS[op]
+            if timings is None:
+                values[i] = fn(*args)
+            else:
+                t0 = time.perf_counter()
+                values[i] = fn(*args)
+                spec = self._owner[i]
+                timings[spec] = timings.get(spec, 0.0) + time.perf_counter() - t0
+            for a in self.graph.nodes[i][1]:  # 中间结果用完即丢, 控制内存占用
+                if isinstance(a, Node) and a.id not in self._keep:
+                    if self._last_use[a.id] == i:
+                        values.pop(a.id, None)
+        return {spec: _resolve(out, values) for spec, out in self.outputs.items()}
+
+    # calls为逐个指标单独计算时的运算次数, nodes为去重后的, computed为输出用得到而实际计算的
+    def stats(self):
+        return {
+            "indicators": len(self.specs),
+            "calls": self.graph.calls,
+            "nodes": len(self.graph.nodes),
+            "computed": len(self._live),
+        }
+
+    def describe(self):  # 计算计划: 每行一个要算的节点, 最后是各输出对应的节点
+        lines = []
+        for i, (op, args) in enumerate(self.graph.nodes):
+            if i in self._live:
+                text = ", ".join(_describe(a) for a in args)
+                lines.append(f"t{i} = {op}({text})")
+        for spec, out in self.outputs.items():
+            lines.append(f"{spec} = {_describe(out)}")
+        return "\n".join(lines)
+
+
+def _flatten(outputs):
+    for out in outputs:
+        if isinstance(out, (tuple, list)):
+            yield from _flatten(out)
+        elif isinstance(out, Node):
+            yield out
+
+
+def _describe(a):
+    if isinstance(a, (tuple, list)):
+        return "(" + ", ".join(_describe(x) for x in a) + ")"
+    return f"t{a.id}" if isinstance(a, Node) else repr(a)
+
+
+def _resolve(out, values):
+    if isinstance(out, (tuple, list)):
+        return tuple(_resolve(o, values) for o in out)
+    return values[out.id] if isinstance(out, Node) else out
+
+
+def compute(specs, data=None, **inputs):  # 只算一次时的便捷写法
+    return Pipeline(specs).run(data, **inputs)
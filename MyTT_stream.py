@@ -0,0 +1,489 @@
+# -*- coding:utf-8 -*-    --------------MyTT流式指标( https://github.com/ShiroRikka/ApexSignal )
+# 每来一根K线增量更新(不重算历史), 结果与MyTT批量函数逐位一致
+# update(x) 追加一根新K线, update(x, new_bar=False) 修正最后一根(盘中未收盘的K线)
+# 0级核心对象复刻pandas ewm/rolling的累加顺序(含Kahan补偿), 所以浮点结果与批量计算完全相同
+# 用法:  m = StreamMACD(12, 26, 9);  m.feed(CLOSE[:-1]);  DIF, DEA, MACD = m.update(CLOSE[-1])
+
+import copy
+import math
+from collections import deque
+
+import numpy as np
+
+NAN = np.float64(np.nan)
+
+
+def _max(a, b):  # 与np.maximum相同: 任一为nan则返回nan
+    return a if math.isnan(a) or a >= b else b
+
+
+def _rd(x, D=3):
+    return np.round(x, D)
+
+
+class Stream:  # 流式指标基类, 子类实现_step
+    value = None
+
+    def update(self, *bar, new_bar=True):
+        if new_bar or self._saved is None:
+            self._saved = self._save()
+        else:
+            self._load(self._saved)  # 回到上一根K线之前的状态再重算
+        self.value = self._step(*(np.float64(x) for x in bar))
+        return self.value
+
+    def feed(self, *series):  # 用历史序列预热, 返回最后一根的结果
+        for bar in zip(*series):
+            self.update(*bar)
+        return self.value
+
+    _saved = None
+
+    def _save(self):  # 只保存自身状态(下划线开头的除外), 子指标各自保存
+        return {
+            k: copy.copy(v)
+            for k, v in vars(self).items()
+            if not k.startswith("_") and not isinstance(v, Stream)
+        }
+
+    def _load(self, state):
+        vars(self).update({k: copy.copy(v) for k, v in state.items()})
+
+    def _step(self, *bar):
+        raise NotImplementedError
+
+
+# ------------------ 0级：核心工具函数 --------------------------------------------
+class StreamEWM(Stream):  # pandas ewm(com, adjust=False).mean() 的逐点版本
+    def __init__(self, com):
+        self.com = com  # pandas内部把span/alpha都先换算成com再求alpha
+        self.alpha = 1.0 / (1.0 + com)
+        self.weighted = NAN
+        self.old_wt = 1.0
+
+    def _step(self, x):
+        obs = not math.isnan(x)
+        if not math.isnan(self.weighted):
+            self.old_wt *= 1.0 - self.alpha
+            if obs:
+                if self.weighted != x:  # 常数序列不做运算, 避免误差
+                    new_wt = 1.0 - self.old_wt if self.com == 1 else self.alpha
+                    w = self.old_wt * self.weighted + new_wt * x
+                    self.weighted = w / (self.old_wt + new_wt)
+                self.old_wt = 1.0
+        elif obs:
+            self.weighted = x
+        return self.weighted
+
+
+class StreamEMA(StreamEWM):  # 指数移动平均 alpha=2/(span+1)
+    def __init__(self, N):
+        super().__init__((N - 1) / 2.0)
+
+
+class StreamSMA(StreamEWM):  # 中国式的SMA alpha=M/N
+    def __init__(self, N, M=1):
+        super().__init__((1.0 - M / N) / (M / N))
+
+
+class StreamREF(Stream):  # REF(S, N)
+    def __init__(self, N=1):
+        self.buf = deque(maxlen=N + 1)
+
+    def _step(self, x):
+        self.buf.append(x)
+        return self.buf[0] if len(self.buf) == self.buf.maxlen else NAN
+
+
+class _Window(Stream):  # 定长窗口, 记录进出窗口的值
+    def __init__(self, N):
+        self.N = N
+        self.buf = deque()
+        self.count = 0  # 已处理的K线数
+
+    def _slide(self, x):  # 返回被移出窗口的值(没有则为None)
+        self.buf.append(x)
+        self.count += 1
+        return self.buf.popleft() if len(self.buf) > self.N else None
+
+
+class StreamSUM(_Window):  # SUM(S, N): rolling(N).sum(), N=0时为cumsum
+    def __init__(self, N):
+        super().__init__(N)
+        self.nobs = 0
+        self.sum = self.comp_add = self.comp_remove = 0.0
+        self.same = 0  # 连续相同值的个数, pandas用它消除浮点误差
+        self.prev = NAN
+
+    def _add(self, x):
+        if math.isnan(x):
+            return
+        self.nobs += 1
+        y = x - self.comp_add
+        t = self.sum + y
+        self.comp_add = t - self.sum - y
+        self.sum = t
+        self.same = self.same + 1 if x == self.prev else 1
+        self.prev = x
+
+    def _remove(self, x):
+        if math.isnan(x):
+            return
+        self.nobs -= 1
+        y = -x - self.comp_remove
+        t = self.sum + y
+        self.comp_remove = t - self.sum - y
+        self.sum = t
+
+    def _step(self, x):
+        if self.N == 0:  # cumsum为简单顺序累加, nan位置输出nan
+            if not math.isnan(x):
+                self.sum += x
+                return np.float64(self.sum)
+            return NAN
+        if self.count == 0 or self.N == 1:
+            self._reset(x)
+        old = self._slide(x)
+        if old is not None:
+            self._remove(old)
+        self._add(x)
+        if self.nobs < self.N:
+            return NAN
+        return self.prev * self.nobs if self.same >= self.nobs else self.sum
+
+    def _reset(self, x):
+        self.nobs = 0
+        self.sum = self.comp_add = self.comp_remove = 0.0
+        self.same = 0
+        self.prev = x
+        self.buf.clear()
+
+
+class StreamMA(StreamSUM):  # MA(S, N): rolling(N).mean()
+    def __init__(self, N):
+        super().__init__(N)
+        self.neg = 0  # 窗口内负数个数
+
+    def _add(self, x):
+        super()._add(x)
+        if not math.isnan(x) and np.signbit(x):
+            self.neg += 1
+
+    def _remove(self, x):
+        super()._remove(x)
+        if not math.isnan(x) and np.signbit(x):
+            self.neg -= 1
+
+    def _reset(self, x):
+        super()._reset(x)
+        self.neg = 0
+
+    def _step(self, x):
+        if self.count == 0 or self.N == 1:
+            self._reset(x)
+        old = self._slide(x)
+        if old is not None:
+            self._remove(old)
+        self._add(x)
+        if self.nobs < self.N or self.nobs == 0:
+            return NAN
+        if self.same >= self.nobs:
+            return self.prev
+        result = self.sum / self.nobs
+        if self.neg == 0 and result < 0 or self.neg == self.nobs and result > 0:
+            return np.float64(0.0)
+        return result
+
+
+class StreamSTD(_Window):  # STD(S, N): rolling(N).std(ddof=0), Welford + Kahan
+    def __init__(self, N):
+        super().__init__(N)
+        self._reset(NAN)
+
+    def _reset(self, x):
+        self.nobs = 0
+        self.mean = self.ssq = self.comp_add = self.comp_remove = 0.0
+        self.same = 0
+        self.prev = x
+        self.buf.clear()
+
+    def _add(self, x):
+        if math.isnan(x):
+            return
+        self.nobs += 1
+        self.same = self.same + 1 if x == self.prev else 1
+        self.prev = x
+        prev_mean = self.mean - self.comp_add
+        y = x - self.comp_add
+        t = y - self.mean
+        self.comp_add = t + self.mean - y
+        self.mean = self.mean + t / self.nobs
+        self.ssq = self.ssq + (x - prev_mean) * (x - self.mean)
+
+    def _remove(self, x):
+        if math.isnan(x):
+            return
+        self.nobs -= 1
+        if self.nobs:
+            prev_mean = self.mean - self.comp_remove
+            y = x - self.comp_remove
+            t = y - self.mean
+            self.comp_remove = t + self.mean - y
+            self.mean = self.mean - t / self.nobs
+            self.ssq = self.ssq - (x - prev_mean) * (x - self.mean)
+        else:
+            self.mean = self.ssq = 0.0
+
+    def _step(self, x):
+        if self.count == 0 or self.N == 1:
+            self._reset(x)
+        old = self._slide(x)
+        if old is not None:
+            self._remove(old)
+        self._add(x)
+        if self.nobs < self.N or self.nobs == 0:
+            return NAN
+        if self.nobs == 1 or self.same >= self.nobs:
+            return np.float64(0.0)
+        var = self.ssq / self.nobs
+        return np.sqrt(var) if var >= 0 else np.float64(0.0)
+
+
+class _Extreme(_Window):  # 单调队列求窗口最值, 窗口内有nan时输出nan
+    def __init__(self, N, better):
+        super().__init__(N)
+        self.better = better
+        self.mono = deque()  # (序号, 值), 值单调
+        self.nans = 0
+
+    def _step(self, x):
+        old = self._slide(x)
+        i = self.count
+        if old is not None and math.isnan(old):
+            self.nans -= 1
+        if math.isnan(x):
+            self.nans += 1
+        else:
+            while self.mono and not self.better(self.mono[-1][1], x):
+                self.mono.pop()
+            self.mono.append((i, x))
+        while self.mono and self.mono[0][0] <= i - self.N:
+            self.mono.popleft()
+        if self.count < self.N or self.nans:
+            return NAN
+        return self.mono[0][1]
+
+
+class StreamHHV(_Extreme):  # HHV(S, N)
+    def __init__(self, N):
+        super().__init__(N, lambda kept, x: kept > x)
+
+
+class StreamLLV(_Extreme):  # LLV(S, N)
+    def __init__(self, N):
+        super().__init__(N, lambda kept, x: kept < x)
+
+
+# ------------------   2级：技术指标(通过0级流式对象组合，运算顺序与MyTT一致) ------------------
+class _Composite(Stream):  # 由多个流式对象组合的指标, 子对象跟随同一个new_bar
+    _new = True
+
+    def update(self, *bar, new_bar=True):
+        self._new = new_bar
+        return super().update(*bar, new_bar=new_bar)
+
+    def _u(self, stream, x):
+        return stream.update(x, new_bar=self._new)
+
+
+class StreamMACD(_Composite):  # MACD(CLOSE, SHORT, LONG, M)
+    def __init__(self, SHORT=12, LONG=26, M=9):
+        self.short, self.long, self.dea = (
+            StreamEMA(SHORT),
+            StreamEMA(LONG),
+            StreamEMA(M),
+        )
+
+    def _step(self, close):
+        DIF = self._u(self.short, close) - self._u(self.long, close)
+        DEA = self._u(self.dea, DIF)
+        return _rd(DIF), _rd(DEA), _rd((DIF - DEA) * 2)
+
+
+class StreamKDJ(_Composite):  # KDJ(CLOSE, HIGH, LOW, N, M1, M2)
+    def __init__(self, N=9, M1=3, M2=3):
+        self.llv, self.hhv = StreamLLV(N), StreamHHV(N)
+        self.k, self.d = StreamEMA(M1 * 2 - 1), StreamEMA(M2 * 2 - 1)
+
+    def _step(self, close, high, low):
+        LLV = self._u(self.llv, low)
+        RSV = (close - LLV) / (self._u(self.hhv, high) - LLV) * 100
+        K = self._u(self.k, RSV)
+        D = self._u(self.d, K)
+        return K, D, K * 3 - D * 2
+
+
+class StreamRSI(_Composite):  # RSI(CLOSE, N)
+    def __init__(self, N=24):
+        self.ref, self.up, self.all = StreamREF(1), StreamSMA(N), StreamSMA(N)
+
+    def _step(self, close):
+        DIF = close - self._u(self.ref, close)
+        return _rd(self._u(self.up, _max(DIF, 0)) / self._u(self.all, abs(DIF)) * 100)
+
+
+class StreamWR(_Composite):  # WR(CLOSE, HIGH, LOW, N, N1)
+    def __init__(self, N=10, N1=6):
+        self.h, self.l = StreamHHV(N), StreamLLV(N)
+        self.h1, self.l1 = StreamHHV(N1), StreamLLV(N1)
+
+    def _step(self, close, high, low):
+        H, H1 = self._u(self.h, high), self._u(self.h1, high)
+        WR = (H - close) / (H - self._u(self.l, low)) * 100
+        WR1 = (H1 - close) / (H1 - self._u(self.l1, low)) * 100
+        return _rd(WR), _rd(WR1)
+
+
+class StreamBIAS(_Composite):  # BIAS(CLOSE, L1, L2, L3)
+    def __init__(self, L1=6, L2=12, L3=24):
+        self.mas = [StreamMA(L1), StreamMA(L2), StreamMA(L3)]
+
+    def _step(self, close):
+        out = []
+        for ma in self.mas:
+            MA = self._u(ma, close)
+            out.append(_rd((close - MA) / MA * 100))
+        return tuple(out)
+
+
+class StreamBOLL(_Composite):  # BOLL(CLOSE, N, P)
+    def __init__(self, N=20, P=2):
+        self.ma, self.std, self.P = StreamMA(N), StreamSTD(N), P
+
+    def _step(self, close):
+        MID = self._u(self.ma, close)
+        STD = self._u(self.std, close)
+        return _rd(MID + STD * self.P), _rd(MID), _rd(MID - STD * self.P)
+
+
+class StreamPSY(_Composite):  # PSY(CLOSE, N, M)
+    def __init__(self, N=12, M=6):
+        self.ref, self.count, self.ma, self.N = (
+            StreamREF(1),
+            StreamSUM(N),
+            StreamMA(M),
+            N,
+        )
+
+    def _step(self, close):
+        up = np.float64(close > self._u(self.ref, close))
+        PSY = self._u(self.count, up) / self.N * 100
+        return _rd(PSY), _rd(self._u(self.ma, PSY))
+
+
+class StreamATR(_Composite):  # ATR(CLOSE, HIGH, LOW, N)
+    def __init__(self, N=20):
+        self.ref, self.ma = StreamREF(1), StreamMA(N)
+
+    def _step(self, close, high, low):
+        LC = self._u(self.ref, close)
+        TR = _max(_max(high - low, abs(LC - high)), abs(LC - low))
+        return self._u(self.ma, TR)
+
+
+class StreamBBI(_Composite):  # BBI(CLOSE, M1, M2, M3, M4)
+    def __init__(self, M1=3, M2=6, M3=12, M4=20):
+        self.mas = [StreamMA(M) for M in (M1, M2, M3, M4)]
+
+    def _step(self, close):
+        a, b, c, d = (self._u(ma, close) for ma in self.mas)
+        return (a + b + c + d) / 4
+
+
+class StreamDMI(_Composite):  # DMI(CLOSE, HIGH, LOW, M1, M2)
+    def __init__(self, M1=14, M2=6):
+        self.rc, self.rh, self.rl = StreamREF(1), StreamREF(1), StreamREF(1)
+        self.tr, self.dmp, self.dmm = StreamSUM(M1), StreamSUM(M1), StreamSUM(M1)
+        self.adx, self.radx = StreamMA(M2), StreamREF(M2)
+
+    def _step(self, close, high, low):
+        LC = self._u(self.rc, close)
+        TR = self._u(self.tr, _max(_max(high - low, abs(high - LC)), abs(low - LC)))
+        HD = high - self._u(self.rh, high)
+        LD = self._u(self.rl, low) - low
+        DMP = self._u(self.dmp, HD if (HD > 0) & (HD > LD) else np.float64(0))
+        DMM = self._u(self.dmm, LD if (LD > 0) & (LD > HD) else np.float64(0))
+        PDI = DMP * 100 / TR
+        MDI = DMM * 100 / TR
+        ADX = self._u(self.adx, abs(MDI - PDI) / (PDI + MDI) * 100)
+        return PDI, MDI, ADX, (ADX + self._u(self.radx, ADX)) / 2
+
+
+class StreamTAQ(_Composite):  # TAQ(HIGH, LOW, N)
+    def __init__(self, N):
+        self.hhv, self.llv = StreamHHV(N), StreamLLV(N)
+
+    def _step(self, high, low):
+        UP, DOWN = self._u(self.hhv, high), self._u(self.llv, low)
+        return UP, (UP + DOWN) / 2, DOWN
+
+
+class StreamKTN(_Composite):  # KTN(CLOSE, HIGH, LOW, N, M)
+    def __init__(self, N=20, M=10):
+        self.mid, self.atr = StreamEMA(N), StreamATR(M)
+
+    def _step(self, close, high, low):
+        MID = self._u(self.mid, (high + low + close) / 3)
+        ATRN = self.atr.update(close, high, low, new_bar=self._new)
+        return MID + 2 * ATRN, MID, MID - 2 * ATRN
+
+
+class StreamTRIX(_Composite):  # TRIX(CLOSE, M1, M2)
+    def __init__(self, M1=12, M2=20):
+        self.emas = [StreamEMA(M1), StreamEMA(M1), StreamEMA(M1)]
+        self.ref, self.ma = StreamREF(1), StreamMA(M2)
+
+    def _step(self, close):
+        TR = close
+        for ema in self.emas:
+            TR = self._u(ema, TR)
+        LT = self._u(self.ref, TR)
+        TRIX = (TR - LT) / LT * 100
+        return TRIX, self._u(self.ma, TRIX)
+
+
+class StreamMTM(_Composite):  # MTM(CLOSE, N, M)
+    def __init__(self, N=12, M=6):
+        self.ref, self.ma = StreamREF(N), StreamMA(M)
+
+    def _step(self, close):
+        MTM = close - self._u(self.ref, close)
+        return MTM, self._u(self.ma, MTM)
+
+
+class StreamROC(_Composite):  # ROC(CLOSE, N, M)
+    def __init__(self, N=12, M=6):
+        self.ref, self.ma = StreamREF(N), StreamMA(M)
+
+    def _step(self, close):
+        LC = self._u(self.ref, close)
+        ROC = 100 * (close - LC) / LC
+        return ROC, self._u(self.ma, ROC)
+
+
+class StreamEXPMA(_Composite):  # EXPMA(CLOSE, N1, N2)
+    def __init__(self, N1=12, N2=50):
+        self.e1, self.e2 = StreamEMA(N1), StreamEMA(N2)
+
+    def _step(self, close):
+        return self._u(self.e1, close), self._u(self.e2, close)
+
+
+class StreamOBV(_Composite):  # OBV(CLOSE, VOL)
+    def __init__(self):
+        self.ref, self.sum = StreamREF(1), StreamSUM(0)
+
+    def _step(self, close, vol):
+        LC = self._u(self.ref, close)
+        v = vol if close > LC else -vol if close < LC else np.float64(0)
+        return self._u(self.sum, v) / 10000
@@ -1,11 +1,62 @@
 # -*- coding:utf-8 -*-
+import gzip
+import hashlib
+import json
+
+import numpy as np
 import pandas as pd
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify
+
+import metrics
+from Ashare import get_price, router
+from frame_store import FrameStore, frame_key
+from MyTT_pipeline import Pipeline
+from quote_cache import QuoteCache
+from quote_feed import QuoteFeed
 
-from Ashare import get_price
-from MyTT import KDJ, MACD, RSI
+try:
+    import brotli  # 可选依赖, 没有安装时只用gzip压缩
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
+quote_cache = QuoteCache(maxsize=256)  # 多个页面自动刷新同一只股票时共用结果
+body_cache = QuoteCache(maxsize=64)  # 列式JSON压缩后的响应体, 按 ETag+编码 缓存
+frame_store = FrameStore()  # 后台批量写入, 请求不再等待写CSV
+CSV_SUFFIX = "_qfq_data_with_indicators.csv"
+FREQUENCIES = ["1d", "1w", "1M", "1m", "5m", "15m", "30m", "60m"]  # get_price支持的周期
+# 页面展示的指标, 展开成一张图, 共用的中间结果只算一次
+indicators = Pipeline(["KDJ(9,3,3)", "MACD(12,26,9)", "RSI(14)"])
+
+
+def load_stock_data(code, count, frequency, end_date=""):
+    """从上游获取行情并计算技术指标，结果由quote_cache缓存"""
+    df = get_price(code, end_date=end_date, count=count, frequency=frequency)
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    # 计算技术指标, 各指标的耗时分别计入 indicator.KDJ / indicator.MACD / indicator.RSI
+    timings = {}
+    with metrics.stage("indicators"):
+        result = indicators.run(df, timings=timings)
+        for spec, seconds in timings.items():
+            metrics.observe(f"indicator.{spec.split('(')[0]}", seconds)
+    K, D, J = result["KDJ(9,3,3)"]
+    DIF, DEA, MACD_BAR = result["MACD(12,26,9)"]
+    RSI_VALUE = result["RSI(14)"]
+
+    # 将技术指标添加到DataFrame
+    df["K"] = K
+    df["D"] = D
+    df["J"] = J
+    df["DIF"] = DIF
+    df["DEA"] = DEA
+    df["MACD"] = MACD_BAR
+    df["RSI"] = RSI_VALUE
+
+    # 交给后台写入, 只追加新增或变化的K线, 下载时再导出CSV; 不同周期分开存
+    frame_store.submit(frame_key(code, frequency), df)
+    return df
 
 
 @app.route("/")
@@ -14,48 +65,138 @@ def index():
     return render_template("index.html")
 
 
-@app.route("/get_stock_data", methods=["POST"])
+def request_params(values):
+    """检查并解析 code/count/frequency/window, 不合法时抛ValueError说明原因"""
+    code = values.get("code", "sh601818")
+    if not code.replace(".", "").isalnum():  # 也接受 600000.XSHG
+        raise ValueError(f"股票代码无效: {code}")
+    frequency = values.get("frequency", "1d")
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"不支持的周期 {frequency}, 可选: {', '.join(FREQUENCIES)}")
+    numbers = {}
+    for name, default in (("count", 120), ("window", 0)):
+        text = values.get(name, str(default))
+        if not text.isdigit():
+            raise ValueError(f"{name} 应为非负整数: {text}")
+        numbers[name] = int(text)
+    if numbers["count"] == 0:
+        raise ValueError("count 应为正整数")
+    return code, numbers["count"] + 1, frequency, numbers["window"]  # count包含今天
+
+
+def columnar(df):
+    """DataFrame -> {列名: 列表}, 时间转成字符串, nan转成null"""
+    columns = {"time": np.datetime_as_string(df.index.values, unit="s").tolist()}
+    for name in df.columns:
+        values = df[name].to_numpy(dtype=float)
+        columns[name] = np.where(np.isnan(values), None, values).tolist()
+    return columns
+
+
+def data_etag(df, *key):
+    """由请求参数和窗口首尾两根K线生成ETag, 最新K线不变时数据就没有变化"""
+    h = hashlib.blake2b(repr(key).encode(), digest_size=8)
+    for i in (0, -1):
+        h.update(str(df.index[i]).encode())
+        h.update(df.iloc[i].to_numpy(dtype=float).tobytes())
+    return h.hexdigest()
+
+
+def encode_body(payload, encoding):
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    if encoding == "br":
+        return brotli.compress(body, quality=5)  # 压缩率接近gzip -9, 速度快得多
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def columns_response(df, code, count, frequency, window):
+    """列式JSON响应: 支持gzip/brotli压缩, If-None-Match命中时返回304"""
+    total_rows = len(df)
+    if window > 0:
+        df = df.tail(window)
+    etag = data_etag(df, code, count, frequency, window)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        encoding = ""
+        if brotli is not None and "br" in request.accept_encodings:
+            encoding = "br"
+        elif "gzip" in request.accept_encodings:
+            encoding = "gzip"
+
+        def render():
+            with metrics.stage("render.columns"):
+                return encode_body(
+                    {
+                        "success": True,
+                        "code": code,
+                        "frequency": frequency,
+                        "filename": frame_key(code, frequency) + CSV_SUFFIX,
+                        "total_rows": total_rows,
+                        "columns": columnar(df),
+                    },
+                    encoding,
+                )
+
+        body = body_cache.get(
+            (etag, encoding), render, ttl=quote_cache.ttl_for(frequency)
+        )
+        response = Response(body, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag, weak=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"  # 每次都带ETag回源校验
+    return response
+
+
+@app.route("/get_stock_data", methods=["GET", "POST"])
 def get_stock_data():
-    """获取股票数据并计算技术指标"""
+    """获取股票数据并计算技术指标; format=columns时返回列式JSON, profile=1时附带分阶段耗时"""
+    if request.values.get("profile") != "1":
+        with metrics.stage("request.get_stock_data"):
+            return stock_data_response()
+
+    with metrics.profile() as prof, metrics.stage("request.get_stock_data"):
+        response = app.make_response(stock_data_response())
+    response.headers["Server-Timing"] = prof.server_timing()
+    data = response.get_json(silent=True) if not response.content_encoding else None
+    if isinstance(data, dict):  # 压缩过的列式JSON只给Server-Timing头
+        data["profile"] = {
+            "total_ms": round(prof.total * 1000, 3),
+            "stages": prof.breakdown(),
+        }
+        response.set_data(json.dumps(data, ensure_ascii=False))
+    return response
+
+
+def stock_data_response():
+    # 获取表单数据(GET时为查询参数), 参数不合法时返回400
     try:
-        # 获取表单数据
-        code = request.form.get("code", "sh601818")
-        count = int(request.form.get("count", 120)) + 1  # 包含今天
-        frequency = request.form.get("frequency", "1d")
+        code, count, frequency, window = request_params(request.values)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # 获取股票数据
-        df = get_price(code, end_date="", count=count, frequency=frequency)
+    try:
+        # 获取股票数据(带缓存)
+        with metrics.stage("cache.stock_data"):
+            df = cached_stock_data((code, frequency, count, ""))
 
         if df.empty:
             return jsonify({"error": "无法获取股票数据，请检查股票代码"}), 400
 
-        # 准备数据用于技术指标计算
-        CLOSE = df["close"].values
-        HIGH = df["high"].values
-        LOW = df["low"].values
-
-        # 计算技术指标
-        K, D, J = KDJ(CLOSE, HIGH, LOW, 9, 3, 3)
-        DIF, DEA, MACD_BAR = MACD(CLOSE, 12, 26, 9)
-        RSI_VALUE = RSI(CLOSE, 14)
-
-        # 将技术指标添加到DataFrame
-        df["K"] = K
-        df["D"] = D
-        df["J"] = J
-        df["DIF"] = DIF
-        df["DEA"] = DEA
-        df["MACD"] = MACD_BAR
-        df["RSI"] = RSI_VALUE
-
-        # 保存数据到CSV文件
-        filename = f"{code}_qfq_data_with_indicators.csv"
-        df.to_csv(filename)
+        if request.values.get("format") == "columns":  # 只返回最后window根K线
+            return columns_response(df, code, count, frequency, window)
+
+        filename = frame_key(code, frequency) + CSV_SUFFIX
 
         # 转换DataFrame为HTML表格
-        table_html = df.tail(10).to_html(
-            classes="table table-striped table-hover", table_id="stock-data-table"
-        )
+        with metrics.stage("render.html"):
+            table_html = df.tail(10).to_html(
+                classes="table table-striped table-hover", table_id="stock-data-table"
+            )
 
         # 获取基本信息
         latest_data = df.iloc[-1]
@@ -83,27 +224,164 @@ def get_stock_data():
             else None,
         }
 
-        return jsonify(
-            {
-                "success": True,
-                "table_html": table_html,
-                "basic_info": basic_info,
-                "filename": filename,
-                "total_rows": len(df),
-            }
-        )
+        with metrics.stage("render.json"):
+            return jsonify(
+                {
+                    "success": True,
+                    "table_html": table_html,
+                    "basic_info": basic_info,
+                    "filename": filename,
+                    "total_rows": len(df),
+                }
+            )
 
     except Exception as e:
         return jsonify({"error": f"发生错误: {str(e)}"}), 500
 
 
+def cached_stock_data(key):
+    code, frequency, count, end_date = key
+    return quote_cache.get(
+        key,
+        lambda: load_stock_data(code, count, frequency, end_date),
+        ttl=quote_cache.ttl_for(frequency),
+    )
+
+
+# 推送: 每个 代码+周期 一个轮询线程, 间隔与缓存TTL一致
+quote_feed = QuoteFeed(
+    loader=cached_stock_data,
+    encode=lambda df: json.dumps(columnar(df), separators=(",", ":")),
+    interval=lambda key: quote_cache.ttl_for(key[1]),
+)
+
+
+@app.route("/stream")
+def stream():
+    """Server-Sent Events推送: 先发快照(snapshot), 之后只发新增或变化的K线(delta)"""
+    try:
+        code, count, frequency, window = request_params(request.args)
+    except ValueError as e:
+        return f"参数错误: {e}", 400
+    sub = quote_feed.subscribe((code, frequency, count, ""), window)
+
+    def events():
+        try:
+            while True:
+                message = sub.get(timeout=15)
+                if message is None:
+                    yield ": keepalive\n\n"  # 定期写入才能发现客户端已断开
+                    continue
+                event, data = message
+                yield f"event: {event}\ndata: {data}\n\n"
+        finally:
+            quote_feed.unsubscribe(sub)
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # 经过nginx时不要缓冲
+    return response
+
+
+@app.route("/cache_stats")
+def cache_stats():
+    """行情缓存命中、未命中、淘汰计数, 推送的轮询线程数和订阅数, 后台写入计数"""
+    return jsonify(
+        dict(quote_cache.stats(), feed=quote_feed.stats(), store=frame_store.stats())
+    )
+
+
+def app_metrics():
+    """导出时读取的缓存、推送、后台写入和线路状态"""
+    caches = {"quote": quote_cache.stats(), "body": body_cache.stats()}
+    families = []
+    for field, kind in [
+        ("hits", "counter"),
+        ("misses", "counter"),
+        ("coalesced", "counter"),
+        ("evictions", "counter"),
+        ("size", "gauge"),
+    ]:
+        samples = [({"cache": name}, st[field]) for name, st in caches.items()]
+        suffix = "_total" if kind == "counter" else ""
+        families.append(
+            (f"apexsignal_cache_{field}{suffix}", kind, f"缓存{field}", samples)
+        )
+    feed, store = quote_feed.stats(), frame_store.stats()
+    families.append(
+        ("apexsignal_feed_pollers", "gauge", "推送轮询线程数", [({}, feed["pollers"])])
+    )
+    families.append(
+        (
+            "apexsignal_feed_subscribers",
+            "gauge",
+            "推送订阅数",
+            [({}, feed["subscribers"])],
+        )
+    )
+    families.append(
+        (
+            "apexsignal_store_pending",
+            "gauge",
+            "等待后台写入的数据份数",
+            [({}, store["pending"])],
+        )
+    )
+    families.append(
+        (
+            "apexsignal_store_rows_total",
+            "counter",
+            "后台写入的K线行数",
+            [({}, store["rows"])],
+        )
+    )
+    status = router.status()
+    families.append(
+        (
+            "apexsignal_provider_open",
+            "gauge",
+            "线路是否处于熔断(1)或半开(0.5)",
+            [
+                ({"provider": name}, {"open": 1, "half_open": 0.5}.get(st["state"], 0))
+                for name, st in status.items()
+            ],
+        )
+    )
+    families.append(
+        (
+            "apexsignal_provider_error_rate",
+            "gauge",
+            "线路最近调用的出错和慢请求比例",
+            [({"provider": name}, st["error_rate"]) for name, st in status.items()],
+        )
+    )
+    return families
+
+
+metrics.REGISTRY.collector(app_metrics)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus文本格式: 分阶段耗时直方图、线路调用和切换次数、缓存统计"""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/download/<filename>")
 def download_file(filename):
-    """下载CSV文件"""
-    try:
-        return send_file(filename, as_attachment=True)
-    except Exception as e:
-        return f"文件下载失败: {str(e)}", 404
+    """下载CSV文件, 从持久化的数据边读边导出"""
+    key = filename.removesuffix(CSV_SUFFIX)
+    code, _, frequency = key.partition("_")  # 与frame_key相反, 日线不带周期
+    frequency = frequency or "1d"
+    valid = code.isalnum() and frequency in FREQUENCIES
+    valid = valid and key != filename and frame_key(code, frequency) == key
+    if not valid or not frame_store.exists(key):
+        return f"文件下载失败: 没有 {filename}", 404
+    return Response(
+        frame_store.iter_csv(key),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
 
 
 if __name__ == "__main__":
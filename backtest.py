@@ -0,0 +1,344 @@
+# -*- coding:utf-8 -*-    --------------参数网格回测( https://github.com/ShiroRikka/ApexSignal )
+# 公式里的大写参数名按网格展开, 全部组合放进同一条指标流水线, 共用的中间结果(如EMA(CLOSE,12))只算一次
+# 每个进程一批股票拼成 (K线数 x 股票数) 面板, 收益、最大回撤、交易次数按面板的列一次算完
+# 收盘出现入场信号即按收盘价买入, 出现出场信号即卖出; 只做多, 同一根K线两种信号都有时以出场为准
+#
+#   python backtest.py "CROSS(MA(C,FAST), MA(C,SLOW))" --exit "CROSS(MA(C,SLOW), MA(C,FAST))" \
+#       --grid FAST=5:30:5 --grid SLOW=20:120:10 --where "FAST < SLOW" --codes-file codes.txt
+#   sweep(dfs, "CROSS(MACD(SHORT,LONG,M)[0], MACD(SHORT,LONG,M)[1])",
+#         grid={"SHORT": [8, 12], "LONG": [26, 30], "M": [9]}, processes=8)
+#   不给出场公式时, 入场公式本身即持仓: "MA(C,FAST) > MA(C,SLOW)"
+import argparse
+import ast
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from lazy import lazy
+
+pd = lazy("pandas")
+
+STATS = ["return", "max_drawdown", "trades", "exposure"]
+BATCH_ELEMENTS = 1 << 20  # 统计时一次拼在一起的 K线数 x 列数 上限, 控制临时数组的大小
+
+_pipelines = {}  # 每个进程按公式和网格缓存展开好的流水线
+_store = None
+
+
+def _init_worker(store_root):
+    global _store
+    from Ashare import set_quiet
+
+    set_quiet()  # 与screener相同, 子进程不打印每次请求的线路
+    if store_root:
+        from bar_store import BarStore
+
+        _store = BarStore(store_root)
+
+
+def expand(grid, where=None):
+    """{参数名: 取值列表} -> [{参数名: 值}], where为只用参数名的表达式(如 "FAST < SLOW")或函数"""
+    from MyTT_pipeline import ALIASES, FUNCS, INPUTS
+
+    for name in grid:
+        if (
+            not name.isidentifier()
+            or name in FUNCS
+            or name in INPUTS
+            or name in ALIASES
+        ):
+            raise ValueError(f"参数名 {name} 无效或与指标、行情重名")
+    points = [dict(zip(grid, v)) for v in itertools.product(*grid.values())]
+    if isinstance(where, str):
+        code = compile(where, "<where>", "eval")
+        return [p for p in points if eval(code, {"__builtins__": {}}, dict(p))]
+    return [p for p in points if where is None or where(p)]
+
+
+def bind(spec, params):
+    """把公式中的参数名换成取值, 如 bind("MA(C,N)", {"N": 5}) -> "MA(C, 5)" """
+
+    class _Bind(ast.NodeTransformer):
+        def visit_Name(self, node):
+            if node.id in params:
+                return ast.copy_location(ast.Constant(params[node.id]), node)
+            return node
+
+    return ast.unparse(_Bind().visit(ast.parse(spec.strip(), mode="eval")))
+
+
+def pipeline(entry, exit, points):
+    """全部参数组合的入场、出场公式放进一条流水线, 返回 (流水线, 入场公式列表, 出场公式列表)"""
+    from MyTT_pipeline import Pipeline
+
+    key = (entry, exit, tuple(tuple(p.items()) for p in points))
+    if key not in _pipelines:
+        entries = [bind(entry, p) for p in points]
+        exits = [bind(exit, p) for p in points] if exit else [None] * len(points)
+        _pipelines.clear()  # 一个进程只跑一组网格, 不必保留旧的
+        # 同一组合的入场、出场相邻, 只有它们用到的中间结果(如DEA)算完即可释放
+        specs = [s for pair in zip(entries, exits) for s in pair if s]
+        pipe = Pipeline(dict.fromkeys(specs))
+        _pipelines[key] = pipe, entries, exits
+    return _pipelines[key]
+
+
+def panel(dfs):
+    """{代码: DataFrame} -> (代码列表, {行情名: 二维数组}), 按时间对齐, 缺的K线为nan"""
+    from MyTT_pipeline import INPUTS
+
+    codes = list(dfs)
+    frames = {
+        name: pd.concat({c: dfs[c][col] for c in codes}, axis=1).sort_index()
+        for name, col in INPUTS.items()
+        if all(col in dfs[c] for c in codes)
+    }
+    return codes, {name: f.to_numpy(dtype=float) for name, f in frames.items()}
+
+
+def _bool(signal, shape):  # 公式结果 -> 布尔面板, nan和0都不算信号
+    signal = np.broadcast_to(np.asarray(signal), shape)
+    if signal.dtype == bool:
+        return signal
+    return np.nan_to_num(signal.astype(float), nan=0) != 0
+
+
+def positions(entry, exit=None):
+    """每根K线收盘后是否持仓; 没有出场信号时入场信号本身即持仓"""
+    if exit is None:
+        return entry
+    event = np.where(exit, 0, np.where(entry, 1, -1))  # -1为没有信号, 沿用之前的状态
+    rows = np.arange(len(event)).reshape((-1,) + (1,) * (event.ndim - 1))
+    last = np.maximum.accumulate(np.where(event >= 0, rows, 0), axis=0)
+    return np.take_along_axis(event, last, axis=0) == 1
+
+
+def evaluate(returns, held, cost=0.0, valid=None):
+    """各列的总收益、最大回撤、买入次数和持仓时间占比; returns为每根K线的涨跌幅, cost为单边费率
+
+    valid标出价格有效的K线, 持仓时间占比只在这些K线里算, 未上市和缺数据的K线不计入分母"""
+    pos = held.astype(float)
+    prev = np.zeros_like(pos)
+    prev[1:] = pos[:-1]  # 第t根的收益属于第t-1根收盘后的持仓
+    strategy = prev * returns - cost * np.abs(pos - prev)
+    equity = np.cumprod(1 + strategy, axis=0)
+    peak = np.maximum.accumulate(equity, axis=0)
+    if valid is None:
+        exposure = prev.mean(axis=0)
+    else:
+        with np.errstate(invalid="ignore", divide="ignore"):  # 整列无效时为nan
+            exposure = (prev * valid).sum(axis=0) / valid.sum(axis=0)
+    return {
+        "return": equity[-1] - 1,
+        "max_drawdown": np.max(1 - equity / peak, axis=0),
+        "trades": np.count_nonzero(pos > prev, axis=0),
+        "exposure": exposure,
+    }
+
+
+def sweep_chunk(dfs, entry, exit, points, cost):
+    """在一个进程中回测一批股票的全部参数组合, 返回 [(组合序号, 代码, 收益, 回撤, 次数, 持仓占比)]"""
+    dfs = {c: df for c, df in dfs.items() if df is not None and not df.empty}
+    if not dfs:
+        return []
+    codes, inputs = panel(dfs)
+    pipe, entries, exits = pipeline(entry, exit, points)
+    out = pipe.run(**inputs)
+    close = inputs["CLOSE"]
+    valid = np.isfinite(close)
+    # 停牌、缺K线时沿用最近的有效收盘价和持仓, 复牌那根的收益相对停牌前的收盘价
+    bars = np.arange(len(close)).reshape(-1, 1)
+    last = np.maximum.accumulate(np.where(valid, bars, 0), axis=0)
+    filled = np.take_along_axis(close, last, axis=0)
+    returns = np.zeros_like(close)
+    returns[1:] = filled[1:] / filled[:-1] - 1
+    # 第一根有效K线之前(未上市)没有价格, 不计收益
+    returns = np.nan_to_num(returns, nan=0, posinf=0, neginf=0)
+    n = len(codes)
+    batch = max(BATCH_ELEMENTS // close.size, 1)  # 多个组合横向拼接后一次统计
+    rows = []
+    for start in range(0, len(points), batch):
+        stop = min(start + batch, len(points))
+        held = np.hstack(
+            [
+                positions(
+                    _bool(out[entries[i]], close.shape),
+                    _bool(out[exits[i]], close.shape) if exits[i] else None,
+                )[last, np.arange(n)]  # 停牌的K线无法交易, 持仓沿用停牌前的状态
+                for i in range(start, stop)
+            ]
+        )
+        tile = stop - start
+        stats = evaluate(np.tile(returns, tile), held, cost, np.tile(valid, tile))
+        for j in range((stop - start) * n):
+            rows.append(
+                (start + j // n, codes[j % n], *(stats[k][j].item() for k in STATS))
+            )
+    return rows
+
+
+def fetch_chunk(codes, frequency, count, threads, *args):  # 子进程里拉取行情后回测
+    from Ashare import get_prices
+
+    dfs = get_prices(
+        codes, count=count, frequency=frequency, max_workers=threads, store=_store
+    )
+    return sweep_chunk(dfs, *args)
+
+
+def table(rows, points):
+    """[(组合序号, 代码, ...)] -> DataFrame, 每行一个 参数组合 x 股票"""
+    df = pd.DataFrame(rows, columns=["point", "code", *STATS])
+    params = pd.DataFrame(points).iloc[df["point"]].reset_index(drop=True)
+    return pd.concat([params, df.drop(columns="point")], axis=1)
+
+
+def summary(result, by):
+    """按参数组合汇总: 平均收益、收益中位数、平均最大回撤、总交易次数, 按平均收益从高到低"""
+    groups = result.groupby(by) if by else result.groupby(lambda _: "全部")
+    return groups.agg(
+        mean_return=("return", "mean"),
+        median_return=("return", "median"),
+        max_drawdown=("max_drawdown", "mean"),
+        trades=("trades", "sum"),
+        symbols=("code", "count"),
+    ).sort_values("mean_return", ascending=False)
+
+
+def sweep(
+    dfs, entry, exit=None, grid=None, where=None, cost=0.0, processes=1, chunk=50
+):
+    """在 {代码: DataFrame} 上回测参数网格的全部组合, 返回每个 参数组合 x 股票 一行的DataFrame
+
+    processes>1 时按chunk只股票一批分给多个进程"""
+    points = expand(grid or {}, where)
+    codes = list(dfs)
+    chunks = [codes[i : i + chunk] for i in range(0, len(codes), chunk)]
+    args = (entry, exit, points, cost)
+    rows = []
+    if processes <= 1:
+        for c in chunks:
+            rows += sweep_chunk({k: dfs[k] for k in c}, *args)
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            for fut in [
+                pool.submit(sweep_chunk, {k: dfs[k] for k in c}, *args) for c in chunks
+            ]:
+                rows += fut.result()
+    return table(rows, points)
+
+
+def parse_grid(items):  # ["FAST=5:30:5", "SLOW=20,60,120"] -> {"FAST": [5,...,30], ...}
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if ":" in values:  # 起:止:步长, 包含止
+            start, stop, step = (float(v) for v in (values.split(":") + ["1"])[:3])
+            values = np.arange(start, stop + step / 2, step)
+        else:
+            values = [float(v) for v in values.split(",")]
+        grid[name.strip()] = [
+            int(v) if float(v).is_integer() else float(v) for v in values
+        ]
+    return grid
+
+
+def main(argv=None):
+    from screener import read_codes
+
+    parser = argparse.ArgumentParser(
+        description="按参数网格回测MyTT公式, 输出各参数组合的收益和回撤"
+    )
+    parser.add_argument(
+        "entry", help='入场公式, 参数用大写名字, 如 "CROSS(MA(C,FAST), MA(C,SLOW))"'
+    )
+    parser.add_argument("codes", nargs="*", help="股票代码, 如 sh601818 sz000001")
+    parser.add_argument("--exit", help="出场公式; 不给时入场公式本身即持仓")
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        help="参数取值, 如 FAST=5:30:5(起:止:步长) 或 SLOW=20,60,120, 可重复",
+    )
+    parser.add_argument("--where", help='参数组合的约束, 如 "FAST < SLOW"')
+    parser.add_argument(
+        "--codes-file", help="股票列表文件, 每行一个代码, - 表示标准输入"
+    )
+    parser.add_argument("--frequency", default="1d", help="K线周期, 默认1d")
+    parser.add_argument("--count", type=int, default=500, help="每只股票拉取的K线数")
+    parser.add_argument("--cost", type=float, default=0.0, help="单边交易费率, 如0.001")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--threads", type=int, default=8, help="每个进程的并发请求数")
+    parser.add_argument("--chunk", type=int, default=50, help="每个任务包含的股票数")
+    parser.add_argument("--store", help="本地K线缓存目录, 重复回测时只拉取新K线")
+    parser.add_argument(
+        "--top", type=int, default=20, help="输出平均收益最高的几组参数"
+    )
+    parser.add_argument("--output", help="每个 参数组合 x 股票 的明细写入CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        grid = parse_grid(args.grid)
+        points = expand(grid, args.where)
+        pipeline(args.entry, args.exit, points)  # 先在主进程里检查公式
+    except (ValueError, SyntaxError, TypeError, NameError) as e:
+        parser.error(f"公式或参数无效: {e}")
+    if not points:
+        parser.error("没有满足约束的参数组合")
+    codes = read_codes(args)
+    if not codes:
+        parser.error("没有股票代码")
+
+    total, done, failed, t0 = len(codes), 0, 0, time.monotonic()
+    chunks = [codes[i : i + args.chunk] for i in range(0, total, args.chunk)]
+    rows = []
+    with ProcessPoolExecutor(
+        args.processes, initializer=_init_worker, initargs=(args.store,)
+    ) as pool:
+        futures = {
+            pool.submit(
+                fetch_chunk,
+                c,
+                args.frequency,
+                args.count,
+                args.threads,
+                args.entry,
+                args.exit,
+                points,
+                args.cost,
+            ): c
+            for c in chunks
+        }
+        for fut in as_completed(futures):
+            chunk = futures.pop(fut)
+            try:
+                got = fut.result()
+            except Exception as e:
+                print(f"Info: {chunk[0]}等{len(chunk)}只回测失败: {e}", file=sys.stderr)
+                got = []
+            rows += got
+            done += len(chunk)
+            failed += len(chunk) - len({r[1] for r in got})
+            print(
+                f"[{done}/{total}] {done / total:.0%}  {len(points)}组参数  失败{failed}",
+                file=sys.stderr,
+                flush=True,
+            )
+    result = table(rows, points)
+    if args.output:
+        result.to_csv(args.output, index=False)
+    if not result.empty:
+        print(summary(result, list(grid)).head(args.top).to_string())
+    print(
+        f"回测完成: {total}只 x {len(points)}组参数, 失败{failed}只, "
+        f"用时{time.monotonic() - t0:.1f}秒",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# -*- coding:utf-8 -*-    --------------本地K线列式存储( https://github.com/ShiroRikka/ApexSignal )
+# 每个 代码+周期 一个定长记录文件, 读取时内存映射只取尾部; get_price 只需拉取缺失的最新几根K线
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+BAR_FIELDS = ["open", "close", "high", "low", "volume"]
+BAR_DTYPE = np.dtype([("time", "M8[ns]")] + [(f, "f8") for f in BAR_FIELDS])
+FREQ_TAGS = {"1M": "month"}  # 1M和1m在Windows/macOS上文件名不区分大小写
+
+
+class RecordFile:  # 定长记录文件: 内存映射读取尾部, 截断后追加写入
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // self.dtype.itemsize
+
+    def read(self, start=0, stop=None):  # 读取[start, stop)记录, 返回普通数组(拷贝)
+        n = len(self)
+        start, stop, _ = slice(start, stop).indices(n)
+        if stop <= start:
+            return np.empty(0, self.dtype)
+        mm = np.memmap(
+            self.path,
+            dtype=self.dtype,
+            mode="r",
+            offset=start * self.dtype.itemsize,
+            shape=(stop - start,),
+        )
+        rec = np.array(mm)  # 拷贝后立即释放映射, 否则Windows下无法截断文件
+        del mm
+        return rec
+
+    def tail(self, n):
+        return self.read(max(len(self) - n, 0))
+
+    def replace_tail(self, records, start):  # 从第start条起截断, 再追加records
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.truncate(start * self.dtype.itemsize)
+            f.write(np.ascontiguousarray(records, dtype=self.dtype).tobytes())
+
+
+def to_records(df):  # DataFrame(时间索引 + OHLCV) -> 结构化记录
+    rec = np.empty(len(df), BAR_DTYPE)
+    rec["time"] = df.index.values.astype("M8[ns]")
+    for f in BAR_FIELDS:
+        rec[f] = df[f].values
+    return rec
+
+
+def to_frame(rec, index_name=""):  # 结构化记录 -> 与get_price一致的DataFrame
+    df = pd.DataFrame(
+        {f: rec[f] for f in BAR_FIELDS}, index=pd.DatetimeIndex(rec["time"])
+    )
+    df.index.name = index_name
+    return df
+
+
+def missing_bars(last, frequency, now=None):  # 估算last之后缺了多少根K线, 宁多勿少
+    now = now or datetime.datetime.now()
+    last = pd.Timestamp(last).to_pydatetime()
+    days = int(np.busday_count(last.date(), now.date()))  # 只数工作日
+    if frequency == "1d":
+        return days + 1
+    if frequency == "1w":
+        return (now - last).days // 7 + 2
+    if frequency == "1M":
+        return (now.year - last.year) * 12 + now.month - last.month + 1
+    ts = int(frequency[:-1]) if frequency[:-1].isdigit() else 1  # 分钟线每天240分钟
+    if days == 0:
+        return int((now - last).total_seconds() // 60) // ts + 1
+    return (days + 1) * (240 // ts + 1)
+
+
+class BarStore:  # get_price的本地K线缓存, 有历史时只拉取尾部并追加
+    def __init__(self, root="bar_store", overlap=2):
+        self.root = root
+        # 至少多拉overlap根已有K线用于校验, 前复权遇到除权会整体改写历史
+        self.overlap = overlap
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def file(self, code, frequency):
+        tag = FREQ_TAGS.get(frequency, frequency)
+        return RecordFile(os.path.join(self.root, f"{code}_{tag}.bars"), BAR_DTYPE)
+
+    def _lock(self, path):
+        with self._guard:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def get_price(self, code, count, frequency, fetch):  # fetch(code, count=n)
+        f = self.file(code, frequency)
+        with self._lock(f.path):
+            n = len(f)
+            if n >= count:
+                last = f.read(n - 1)["time"][0]
+                want = missing_bars(last, frequency) + self.overlap
+                if want < count:
+                    df = fetch(code, count=want)
+                    if df is None or df.empty:
+                        return df
+                    if self._merge(f, to_records(df)):
+                        return to_frame(f.tail(count), df.index.name)
+            df = fetch(code, count=count)  # 首次或校验失败: 全量拉取并重写
+            if df is not None and not df.empty:
+                f.replace_tail(to_records(df), 0)
+            return df
+
+    def _merge(self, f, new):  # 新数据须与已有尾部重叠且已收盘K线一致
+        old = f.tail(len(new) + 1)
+        pos = int(np.searchsorted(old["time"], new["time"][0]))
+        k = len(old) - pos  # 重叠的根数
+        if k == 0 or k > len(new):
+            return False  # 没有重叠, 中间可能缺K线
+        if not np.array_equal(old["time"][pos:], new["time"][:k]):
+            return False
+        closed_old, closed_new = old[pos:-1], new[: k - 1]  # 最后一根可能还未收盘
+        for name in BAR_FIELDS:
+            if not np.array_equal(closed_old[name], closed_new[name], equal_nan=True):
+                return False  # 除权除息后前复权价格整体变化
+        f.replace_tail(new, len(f) - k)
+        return True
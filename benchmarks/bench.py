@@ -0,0 +1,542 @@
+# -*- coding:utf-8 -*-    --------------MyTT指标与Ashare解析性能基准( https://github.com/ShiroRikka/ApexSignal )
+# mytt: 0/1/2级全部函数在不同序列长度和面板宽度下的耗时, 并记录固定输入下输出的摘要
+# ashare: 用fixtures里的腾讯/新浪接口响应替换网络请求, 测JSON解析到DataFrame的耗时
+# imports: 在新的解释器里导入各入口模块的耗时, 摘要为导入时顺带加载的重量级依赖
+# 结果写成JSON, 与基线比较: 耗时变慢超过阈值或输出摘要变化时退出码为1
+#
+#   python benchmarks/bench.py --quick                  # 小规模跑一遍并与基线比较
+#   python benchmarks/bench.py --sizes 1e2,1e7 -k "MA|EMA"
+#   python benchmarks/bench.py --save-baseline          # 确认无误后更新基线
+import argparse
+import functools
+import hashlib
+import inspect
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import Ashare  # noqa: E402
+import MyTT  # noqa: E402
+from MyTT import *  # noqa: E402,F403
+
+FIXTURES = os.path.join(HERE, "fixtures")
+BASELINE = os.path.join(HERE, "baseline.json")
+SIZES = [100, 1000, 10_000, 100_000, 1_000_000, 10_000_000]
+WIDTHS = [1, 10, 100]
+PARSE_SIZES = [100, 1000, 10_000, 100_000]
+SMALL = 5e-3  # 换算后基线耗时低于该秒数的用例算小用例, 受缓存和调度影响大, 用--small-threshold
+DIGEST_ROWS = 1000  # 输出摘要用的固定长度, 面板摘要用 DIGEST_ROWS x 10
+IMPORTS = [
+    "MyTT",
+    "MyTT_pipeline",
+    "MyTT_formula",
+    "Ashare",
+    "resample",
+    "screener",
+    "backtest",
+    "app",
+]
+HEAVY = ["pandas", "requests", "flask"]  # 核心模块导入时不应顺带加载, 用到时才导入
+
+# ------------------ mytt --------------------------------------------
+# 0/1级函数的参数需要指定, d为行情数据: C O H L V, B为布尔条件, A为(0,1)内的平滑序列
+CASES = {
+    0: {
+        "RD": lambda d: RD(d.C),
+        "RET": lambda d: RET(d.C),
+        "ABS": lambda d: ABS(d.C - d.O),
+        "LN": lambda d: LN(d.C),
+        "POW": lambda d: POW(d.C, 2),
+        "SQRT": lambda d: SQRT(d.C),
+        "SIN": lambda d: SIN(d.C),
+        "COS": lambda d: COS(d.C),
+        "TAN": lambda d: TAN(d.C),
+        "MAX": lambda d: MAX(d.O, d.C),
+        "MIN": lambda d: MIN(d.O, d.C),
+        "IF": lambda d: IF(d.B, d.H, d.L),
+        "REF": lambda d: REF(d.C, 1),
+        "DIFF": lambda d: DIFF(d.C, 1),
+        "STD": lambda d: STD(d.C, 20),
+        "SUM": lambda d: SUM(d.V, 20),
+        "CONST": lambda d: CONST(d.C),
+        "HHV": lambda d: HHV(d.H, 20),
+        "LLV": lambda d: LLV(d.L, 20),
+        "HHVBARS": lambda d: HHVBARS(d.H, 20),
+        "LLVBARS": lambda d: LLVBARS(d.L, 20),
+        "MA": lambda d: MA(d.C, 20),
+        "EMA": lambda d: EMA(d.C, 20),
+        "SMA": lambda d: SMA(d.C, 20, 1),
+        "WMA": lambda d: WMA(d.C, 20),
+        "DMA": lambda d: DMA(d.C, 0.2),
+        "DMA_SERIES": lambda d: DMA(d.C, d.A),
+        "AVEDEV": lambda d: AVEDEV(d.C, 20),
+        "SLOPE": lambda d: SLOPE(d.C, 20),
+        "FORCAST": lambda d: FORCAST(d.C, 20),
+        "LAST": lambda d: LAST(d.B, 10, 5),
+    },
+    1: {
+        "COUNT": lambda d: COUNT(d.B, 10),
+        "EVERY": lambda d: EVERY(d.B, 3),
+        "EXIST": lambda d: EXIST(d.B, 10),
+        "FILTER": lambda d: FILTER(d.B, 5),
+        "BARSLAST": lambda d: BARSLAST(d.B),
+        "BARSLASTCOUNT": lambda d: BARSLASTCOUNT(d.B),
+        "BARSSINCEN": lambda d: BARSSINCEN(d.B, 10),
+        "CROSS": lambda d: CROSS(d.MA5, d.MA20),
+        "LONGCROSS": lambda d: LONGCROSS(d.MA5, d.MA20, 5),
+        "VALUEWHEN": lambda d: VALUEWHEN(d.B, d.C),
+        "BETWEEN": lambda d: BETWEEN(d.C, d.L, d.H),
+        "TOPRANGE": lambda d: TOPRANGE(d.H),
+        "LOWRANGE": lambda d: LOWRANGE(d.L),
+    },
+}
+ARGS = {"CLOSE": "C", "OPEN": "O", "HIGH": "H", "LOW": "L", "VOL": "V"}
+LEVEL2 = "MACD KDJ RSI WR BIAS BOLL PSY CCI ATR BBI DMI TAQ KTN TRIX VR CR EMV DPO BRAR DFMA MTM MASS ROC EXPMA OBV MFI ASI XSII"
+
+
+def level2(f):  # 2级指标按参数名接行情, 其余参数用默认值, 没有默认值的周期参数取20
+    def call(d):
+        kwargs = {}
+        for p in inspect.signature(f).parameters.values():
+            if p.name in ARGS:
+                kwargs[p.name] = getattr(d, ARGS[p.name])
+            elif p.default is inspect.Parameter.empty:
+                kwargs[p.name] = 20
+        return f(**kwargs)
+
+    return call
+
+
+CASES[2] = {name: level2(getattr(MyTT, name)) for name in LEVEL2.split()}
+
+
+def uncovered():  # MyTT里新增了函数却没有加进CASES时提醒
+    names = {n for level in CASES.values() for n in level}
+    public = {
+        n
+        for n, f in vars(MyTT).items()
+        if n.isupper()
+        and not n.startswith("_")
+        and inspect.isfunction(f)
+        and f.__module__ == "MyTT"
+    }
+    return sorted(public - names - {"ROLLING"})  # ROLLING经由HHVBARS/WMA等覆盖
+
+
+def market(rows, width=1, seed=0):  # 随机游走行情, width>1时为 (rows x width) 面板
+    rng = np.random.default_rng(seed)
+    shape = (rows, width) if width > 1 else (rows,)
+    C = 10 * np.exp(np.cumsum(rng.normal(0, 0.01, shape), axis=0))
+    O = C * (1 + rng.normal(0, 0.005, shape))
+    H = np.maximum(O, C) * (1 + np.abs(rng.normal(0, 0.005, shape)))
+    L = np.minimum(O, C) * (1 - np.abs(rng.normal(0, 0.005, shape)))
+    V = rng.integers(1e5, 1e7, shape).astype(float)
+    return SimpleNamespace(
+        C=C,
+        O=O,
+        H=H,
+        L=L,
+        V=V,
+        B=C > O,
+        A=rng.uniform(0.05, 0.5, shape),
+        MA5=MA(C, 5),
+        MA20=MA(C, 20),
+    )
+
+
+# ------------------ ashare --------------------------------------------
+class FixtureSession:  # 代替Ashare.session, 按URL返回录好的响应, 不访问网络
+    def __init__(self, responses):
+        self.responses = responses  # 接口路径片段 -> 响应字节
+
+    def get(self, url, timeout=None):
+        for part, content in self.responses.items():
+            if part in url:
+                return SimpleNamespace(content=content, raise_for_status=lambda: None)
+        raise KeyError(f"没有对应的fixture: {url}")
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def tiled(rows, n):  # 把录好的K线重复到n根, 测解析规模
+    return (rows * (n // len(rows) + 1))[:n]
+
+
+def ashare_cases(n):
+    """返回 {名称: (接口路径, Ashare函数, 周期, 响应字节)}, 每个响应含n根K线"""
+    day, mins, sina = (
+        fixture("tx_day.json"),
+        fixture("tx_min.json"),
+        fixture("sina.json"),
+    )
+    stk = day["data"]["sh601818"]
+    stk["qfqday"] = tiled(stk["qfqday"], n)
+    stk = mins["data"]["sh601818"]
+    stk["m1"] = tiled(stk["m1"], n)
+    encode = lambda obj: json.dumps(obj, ensure_ascii=False).encode()  # noqa: E731
+    return {
+        "tx_day": ("fqkline", Ashare.get_price_day_tx, "1d", encode(day)),
+        "tx_min": ("mkline", Ashare.get_price_min_tx, "1m", encode(mins)),
+        "sina": ("getKLineData", Ashare.get_price_sina, "60m", encode(tiled(sina, n))),
+    }
+
+
+def ashare_call(path, fn, frequency, content, n):
+    Ashare.session = FixtureSession({path: content})
+    Ashare.print = lambda *args, **kwargs: None  # 线路提示会刷屏, 也不计入耗时
+    return lambda: fn("sh601818", count=n, frequency=frequency)
+
+
+# ------------------ imports --------------------------------------------
+def import_probe(module):  # 新解释器里导入module, 返回(CPU秒数, 顺带加载的重量级依赖)
+    code = (
+        f"import sys, time; t = time.process_time(); import {module}; "
+        f"print(time.process_time() - t, *[m for m in {HEAVY!r} if m in sys.modules])"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(HERE),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(out[0]), out[1:]
+
+
+def import_time(module, repeat=3):  # 每次都是冷启动, 磁盘缓存在第一次后就热了
+    return [import_probe(module)[0] for _ in range(repeat)]
+
+
+# ------------------ 计时与比较 --------------------------------------------
+def measure(fn, min_time=0.02, repeat=3):
+    """返回每轮单次调用的耗时(秒)列表: 先定循环次数使每轮不少于min_time, 再跑repeat轮
+
+    计的是本进程的CPU时间, 不含被其他进程抢占的时间, 共享机器上比墙钟稳定
+    """
+    clock = time.process_time
+    t0 = clock()
+    fn()
+    first = clock() - t0
+    if first > 1:
+        return [first]  # 单次超过1秒的大规模用例只跑一次
+    number = max(1, int(min_time / max(first, 1e-7)))
+    rounds = []
+    for _ in range(repeat):
+        t0 = clock()
+        for _ in range(number):
+            fn()
+        rounds.append((clock() - t0) / number)
+    return rounds
+
+
+def spread(rounds):  # 各轮耗时中位数比最小值多出的比例, 即本机此刻这个用例自身的抖动
+    return float(np.median(rounds) / min(rounds) - 1)
+
+
+_REFERENCE = np.random.default_rng(0).normal(size=2000)
+
+
+def reference():
+    """一段固定的参照计算的耗时: 只用numpy和纯Python, 不经过本仓库任何被测的代码
+
+    每个用例前后各测一次, 用例耗时除以它作比较, 机器此刻的快慢(降频、邻居抢占)就约掉了
+    """
+    S = _REFERENCE
+    work = lambda: (np.convolve(S, np.ones(20)), np.sort(S), sorted(S.tolist()))  # noqa: E731
+    return min(measure(work, min_time=0.005))
+
+
+def calibrate():  # 整次运行的参照耗时, 记在meta里, 基线缺少某个用例的参照时用它换算
+    return float(np.median([reference() for _ in range(5)]))
+
+
+def digest(out):  # 输出逐位摘要, 函数返回的多个序列依次计入
+    h = hashlib.blake2b(digest_size=12)
+    for x in out if isinstance(out, tuple) else (out,):
+        if isinstance(x, pd.DataFrame):
+            h.update(x.index.values.tobytes())
+            x = x.to_numpy()
+        a = np.ascontiguousarray(x)
+        h.update(f"{a.dtype.str}{a.shape}".encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+
+def benchmarks(args):
+    """依次产出 (用例名, setup), setup()返回被计时的无参函数; 数据按需生成, 复查回退时可重建"""
+    data = functools.lru_cache(maxsize=1)(market)  # 相邻用例共用同一份行情
+    responses = functools.lru_cache(maxsize=1)(ashare_cases)
+    if args.suite in ("all", "mytt"):
+        for width in args.widths:
+            for size in args.sizes:
+                rows = size // width  # 面板按总元素数对齐, 宽度越大K线越少
+                if rows < 100:
+                    continue
+                for level, cases in CASES.items():
+                    for name, case in cases.items():
+                        setup = lambda rows=rows, width=width, case=case: (  # noqa: E731
+                            functools.partial(case, data(rows, width))
+                        )
+                        yield f"mytt/L{level}/{name}/n{rows}/w{width}", setup
+    if args.suite in ("all", "ashare"):
+        for n in args.parse_sizes:
+            for name in ("tx_day", "tx_min", "sina"):
+                setup = lambda n=n, name=name: ashare_call(*responses(n)[name], n)  # noqa: E731
+                yield f"ashare/{name}/n{n}", setup
+    if args.suite in ("all", "imports"):
+        for module in IMPORTS:  # setup()返回None: 在子进程里计时, 见timed
+            yield f"import/{module}", lambda: None
+
+
+def digests(args):  # 固定输入下各用例输出的摘要, 用于检查数值是否逐位一致
+    result = {}
+    if args.suite in ("all", "mytt"):
+        for width in (1, 10):
+            d = market(DIGEST_ROWS, width)
+            for cases in CASES.values():
+                for name, case in cases.items():
+                    result[f"mytt/{name}/w{width}"] = digest(case(d))
+    if args.suite in ("all", "ashare"):
+        for name, call in ashare_cases(DIGEST_ROWS).items():
+            result[f"ashare/{name}"] = digest(ashare_call(*call, DIGEST_ROWS)())
+    if args.suite in ("all", "imports"):
+        for (
+            module
+        ) in IMPORTS:  # 加载的依赖列表本身就是摘要, 多了一个即说明有人加了提前导入
+            result[f"import/{module}"] = ",".join(import_probe(module)[1]) or "-"
+    return result
+
+
+def timed(key, fn, repeat=3):  # 返回(用例耗时, 前后两次参照计算中快的一次)
+    before = reference()
+    if key.startswith("import/"):
+        rounds = import_time(key.removeprefix("import/"), repeat)
+    else:
+        rounds = measure(fn, repeat=repeat)
+    return min(rounds), min(before, reference())
+
+
+def typical(pairs):
+    """各遍的(耗时, 参照)中取相对耗时居中的一遍, 抖动为相对耗时的中位数/最小值-1
+
+    不取最快的一遍: 导入耗时等时快时慢, 基线偶尔快一次会让之后每次都像变慢
+    """
+    ratios = [t / ref for t, ref in pairs]
+    return pairs[int(np.argsort(ratios)[(len(ratios) - 1) // 2])], spread(ratios)
+
+
+def run(args):
+    """全部用例轮流跑args.passes遍, 每个用例的各遍分散在整次运行的不同时段,
+    取相对参照计算居中的一遍作结果, 各遍之间的抖动用来放宽该用例的阈值(见compare)"""
+    pattern = re.compile(args.filter) if args.filter else None
+    passes, calibration = {}, calibrate()
+    for i in range(args.passes):
+        if args.passes > 1:
+            print(f"第{i + 1}/{args.passes}遍", flush=True)
+        for key, setup in benchmarks(args):
+            if pattern is None or pattern.search(key):
+                passes.setdefault(key, []).append(timed(key, setup()))
+                seconds, ref = passes[key][-1]
+                print(
+                    f"{key:<36}{seconds * 1e3:>12.3f} ms {seconds / ref:>10.3f}x",
+                    flush=True,
+                )
+    chosen = {key: typical(pairs) for key, pairs in passes.items()}
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": f"{platform.system()} {platform.machine()}",
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "calibration": min(calibration, calibrate()),  # 前后各测一次取快的
+        },
+        "results": {key: pair[0] for key, (pair, _) in chosen.items()},
+        "references": {key: pair[1] for key, (pair, _) in chosen.items()},
+        "spreads": {key: s for key, (_, s) in chosen.items()},
+        "digests": {
+            k: v
+            for k, v in digests(args).items()
+            if pattern is None or pattern.search(k)
+        },
+    }
+
+
+def recheck(args, report, keys):  # 疑似变慢的用例多测几遍再取居中的, 排除偶发的调度抖动
+    setups = dict(benchmarks(args))
+    results, refs = report["results"], report["references"]
+    for key in keys:
+        pairs = [(results[key], refs[key])]
+        pairs += [timed(key, setups[key]()) for _ in range(args.retries)]
+        (results[key], refs[key]), _ = typical(pairs)
+
+
+def compare(report, baseline, threshold, min_delta, small_threshold=None):
+    """返回(变慢的用例, 输出变化的用例); 变慢要求比例超过阈值且绝对差超过min_delta秒
+
+    阈值按用例分别定: 耗时低于SMALL的小用例用small_threshold, 其余用threshold,
+    再加上该用例本次和基线各遍之间的抖动, 抖动大的用例阈值随之放宽
+    基线耗时先按该用例前后的参照计算换算到本机此刻的速度(见speed)再比较
+    """
+    small_threshold = threshold if small_threshold is None else small_threshold
+    slower, changed = [], []
+    base = baseline.get("results", {})
+    spreads, base_spreads = report.get("spreads", {}), baseline.get("spreads", {})
+    for key, seconds in report["results"].items():
+        if key in base:
+            expected = base[key] * speed(report, baseline, key)
+            ratio = seconds / expected
+            limit = threshold if expected >= SMALL else small_threshold
+            limit += 1 + spreads.get(key, 0.0) + base_spreads.get(key, 0.0)
+            if ratio > limit and seconds - expected > min_delta:
+                slower.append((key, expected, seconds, ratio))
+    base = baseline.get("digests", {})
+    for key, value in report["digests"].items():
+        if key in base and base[key] != value:
+            changed.append(key)
+    return slower, changed
+
+
+def speed(report, baseline, key=None):
+    """测key时本机与基线的速度之比, 即两边在该用例前后测的参照计算耗时之比
+
+    参照计算不经过被测代码, 多数用例一起变慢的回退也不会被当成机器变慢约掉;
+    key为None或基线没有该用例的参照时用整次运行的参照, 都没有时不换算
+    """
+    now = report.get("references", {}).get(key)
+    before = baseline.get("references", {}).get(key)
+    if now and before:
+        return now / before
+    now = report["meta"].get("calibration")
+    before = baseline.get("meta", {}).get("calibration")
+    return now / before if now and before else 1.0
+
+
+def write(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+    print(f"结果已写入 {path}")
+
+
+def parse_sizes(text):
+    return [int(float(x)) for x in text.split(",") if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MyTT指标与Ashare解析的性能基准")
+    parser.add_argument(
+        "--suite", choices=["all", "mytt", "ashare", "imports"], default="all"
+    )
+    parser.add_argument(
+        "--sizes", type=parse_sizes, default=SIZES, help="序列长度, 如 1e2,1e4,1e7"
+    )
+    parser.add_argument(
+        "--widths", type=parse_sizes, default=WIDTHS, help="面板宽度, 1为单只股票"
+    )
+    parser.add_argument(
+        "--parse-sizes", type=parse_sizes, default=PARSE_SIZES, help="解析的K线数"
+    )
+    parser.add_argument("--quick", action="store_true", help="只跑 1e2-1e4 和宽度 1,10")
+    parser.add_argument("-k", "--filter", help="只跑名称匹配该正则的用例")
+    parser.add_argument(
+        "--output", default=os.path.join(HERE, "results.json"), help="结果文件"
+    )
+    parser.add_argument("--baseline", default=BASELINE, help="基线文件")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="变慢超过该比例(再加上该用例自身的抖动)算回退",
+    )
+    parser.add_argument(
+        "--small-threshold",
+        type=float,
+        default=0.4,
+        help=f"耗时不到{SMALL * 1e3:g} ms的小用例变慢超过该比例算回退",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=50e-6,
+        help="绝对差小于该秒数时不算回退, 忽略微秒级用例的抖动",
+    )
+    parser.add_argument(
+        "--passes",
+        type=int,
+        default=3,
+        help="全部用例轮流跑的遍数, 机器忽快忽慢时多跑几遍更稳",
+    )
+    parser.add_argument(
+        "--retries", type=int, default=3, help="疑似变慢的用例复查的次数"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="把本次结果合并进基线"
+    )
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes = [s for s in args.sizes if s <= 10_000]
+        args.widths = [w for w in args.widths if w <= 10]
+        args.parse_sizes = [s for s in args.parse_sizes if s <= 10_000]
+
+    if args.suite in ("all", "mytt"):
+        for name in uncovered():
+            print(f"Info: {name} 没有基准用例, 请加入 CASES", file=sys.stderr)
+    report = run(args)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.save_baseline:  # 合并而不是覆盖, 只跑部分用例时不丢掉其他基线
+        baseline["results"] = dict(baseline.get("results", {}), **report["results"])
+        refs = baseline.get("references", {})  # 旧用例连同各自的参照一起保留
+        baseline["references"] = dict(refs, **report["references"])
+        baseline["spreads"] = dict(baseline.get("spreads", {}), **report["spreads"])
+        baseline["digests"] = dict(baseline.get("digests", {}), **report["digests"])
+        baseline["meta"] = report["meta"]
+        write(baseline, args.baseline)
+        return 0
+    if not baseline:
+        write(report, args.output)
+        print("没有基线, 用 --save-baseline 生成")
+        return 0
+
+    slower, changed = compare(
+        report, baseline, args.threshold, args.min_delta, args.small_threshold
+    )
+    if slower and args.retries:
+        print(f"复查{len(slower)}个疑似变慢的用例...")
+        recheck(args, report, [key for key, *_ in slower])
+        slower, changed = compare(
+            report, baseline, args.threshold, args.min_delta, args.small_threshold
+        )
+    write(report, args.output)
+    for key, before, after, ratio in sorted(slower, key=lambda x: -x[3]):
+        print(
+            f"变慢 {key}: {before * 1e3:.3f} ms -> {after * 1e3:.3f} ms ({ratio:.2f}x)"
+        )
+    for key in changed:
+        print(f"输出变化 {key}: 与基线的摘要不一致")
+    common = len(set(report["results"]) & set(baseline.get("results", {})))
+    print(
+        f"比较了{common}个用例(整体机器速度 {speed(report, baseline):.2f}x): "
+        f"变慢{len(slower)}个, 输出变化{len(changed)}个"
+    )
+    return 1 if slower or changed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
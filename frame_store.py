@@ -0,0 +1,195 @@
+# -*- coding:utf-8 -*-    --------------带指标行情的写后持久化( https://github.com/ShiroRikka/ApexSignal )
+# 请求线程只登记最新的DataFrame, 后台线程合并后批量写入定长记录文件, 只追加新增或变化的K线
+# CSV在下载时按需导出, 不再每次请求都整文件重写
+import atexit
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BAR_FIELDS, RecordFile
+from metrics import stage
+
+
+def frame_dtype(columns):
+    return np.dtype([("time", "M8[ns]")] + [(c, "f8") for c in columns])
+
+
+def frame_records(df):  # DataFrame(时间索引 + 数值列) -> 结构化记录
+    rec = np.empty(len(df), frame_dtype(df.columns))
+    rec["time"] = df.index.values.astype("M8[ns]")
+    for c in df.columns:
+        rec[c] = df[c].to_numpy(dtype=float)
+    return rec
+
+
+def frame_key(code, frequency):  # 同一代码不同周期分开存, 日线沿用代码本身
+    return code if frequency == "1d" else f"{code}_{frequency}"
+
+
+def changed_range(old, new, fields):
+    """比较文件尾部old和新数据new, 返回(old中开始改写的位置, new中对应的位置)
+
+    old中早于new第一根K线的记录总是保留, 只改写与new重叠且有变化的部分, 历史不会因窗口变短而丢失
+    只按行情字段判断变化: 指标随取数窗口起点变化会有微小差异, 已收盘K线的指标保持首次写入的值
+    """
+    k = int(np.searchsorted(old["time"], new["time"][0]))
+    if k == len(old):
+        return len(old), 0  # 全部是新K线, 直接追加
+    m = min(len(old) - k, len(new))
+    if not np.array_equal(old["time"][k : k + m], new["time"][:m]):
+        return k, 0  # K线时间对不上(中间缺数据), 从重叠处起用new改写
+    same = np.ones(m, dtype=bool)
+    for name in fields:
+        a, b = old[name][k : k + m], new[name][:m]
+        same &= (a == b) | (np.isnan(a) & np.isnan(b))
+    # 除权后前复权的价格整体变化时j为0, 同样从重叠处起改写, 更早的历史保留
+    j = int(np.argmin(same)) if not same.all() else m
+    return k + j, j
+
+
+class FrameStore:
+    def __init__(self, root="frame_store", delay=1.0):
+        self.root = root
+        self.delay = delay  # 收到第一份数据后等待delay秒, 把这段时间的写入合并成一批
+        self._pending = {}  # key -> (代数, 最新的DataFrame), 同一key只写最后一份
+        self._generation = {}  # key -> 最近一次submit的代数
+        self._written = {}  # key -> 已写入文件的最新代数, 更旧的数据不再写
+        self._cond = threading.Condition()
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.batches = self.writes = self.coalesced = self.rows = 0
+        atexit.register(self.close)
+
+    def _paths(self, key):
+        base = os.path.join(self.root, key)
+        return base + ".frame", base + ".json"
+
+    def _lock(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def submit(self, key, df):  # 登记一份待写入的数据, 立即返回
+        with self._cond:
+            if key in self._pending:
+                self.coalesced += 1
+            generation = self._generation.get(key, 0) + 1
+            self._generation[key] = generation
+            self._pending[key] = generation, df
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return  # close()会同步写完剩下的数据
+            time.sleep(self.delay)
+            self.flush()
+
+    def flush(self, key=None):  # 同步写入待写数据, key为None时写入全部
+        with self._cond:
+            if key is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {key: self._pending.pop(key)} if key in self._pending else {}
+        if batch:
+            self.batches += 1
+        for k, (generation, df) in batch.items():
+            try:
+                with stage("store.write"):
+                    self._write(k, df, generation)
+            except Exception as e:
+                print(f"Info: {k} 持久化失败: {e}")
+
+    def _write(self, key, df, generation=0):
+        if df is None or df.empty:
+            return
+        path, meta_path = self._paths(key)
+        columns = [str(c) for c in df.columns]
+        new = frame_records(df.set_axis(columns, axis=1))
+        with self._lock(key):
+            # 后台线程取走旧数据后, 请求线程flush写入了更新的, 旧的不能再覆盖回去
+            if generation and generation < self._written.get(key, 0):
+                return
+            self._written[key] = max(generation, self._written.get(key, 0))
+            meta = self._meta(key)
+            f = RecordFile(path, frame_dtype(columns))
+            pos = None
+            if meta is not None and meta["columns"] == columns and len(f):
+                old = f.tail(len(new))
+                if new["time"][0] < old["time"][0]:
+                    old = f.read()  # new比尾部更早, 在全部记录里找重叠的位置
+                fields = [c for c in BAR_FIELDS if c in columns] or columns
+                k, j = changed_range(old, new, fields)
+                pos = (len(f) - len(old) + k, j)
+            if pos is None:  # 新文件或列变了, 整体重写
+                pos = (0, 0)
+                os.makedirs(self.root, exist_ok=True)
+                with open(meta_path, "w", encoding="utf-8") as fp:
+                    json.dump({"columns": columns, "index": df.index.name}, fp)
+            if pos[1] < len(new):
+                f.replace_tail(new[pos[1] :], pos[0])
+                self.writes += 1
+                self.rows += len(new) - pos[1]
+
+    def _meta(self, key):
+        meta_path = self._paths(key)[1]
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def exists(self, key):
+        return key in self._pending or self._meta(key) is not None
+
+    def read(self, key):  # 读取已持久化的全部数据, 先写入该key待写的数据
+        self.flush(key)
+        with self._lock(key):
+            meta = self._meta(key)
+            if meta is None:
+                return None
+            rec = RecordFile(self._paths(key)[0], frame_dtype(meta["columns"])).read()
+        index = pd.DatetimeIndex(rec["time"], name=meta["index"])
+        return pd.DataFrame({c: rec[c] for c in meta["columns"]}, index=index)
+
+    def iter_csv(self, key, chunk=5000):  # 分块导出CSV文本, 供下载接口流式返回
+        df = self.read(key)
+        if df is None:
+            return
+        yield df.iloc[:0].to_csv()
+        for i in range(0, len(df), chunk):
+            with stage("csv.write"):  # 只计格式化, 不含客户端接收的时间
+                text = df.iloc[i : i + chunk].to_csv(header=False)
+            yield text
+
+    def write_csv(self, key, path):
+        with open(path, "w", encoding="utf-8", newline="") as fp:
+            for text in self.iter_csv(key):
+                fp.write(text)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "batches": self.batches,
+            "writes": self.writes,
+            "rows": self.rows,
+            "coalesced": self.coalesced,
+        }
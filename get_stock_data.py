@@ -1,53 +1,154 @@
 # -*- coding:utf-8 -*-
-import time
+# 按交易时段轮询自选股的前复权行情并计算技术指标, 休市时不请求上游
+#
+#   python get_stock_data.py                                  # 默认只跟踪光大银行sh601818的日线
+#   python get_stock_data.py sh601818 sz000001 --cadence 1d=60,5m=30
+#   python get_stock_data.py --codes-file watchlist.txt --workers 8
+import argparse
+
+import numpy as np
 
 from Ashare import get_price
-from MyTT import KDJ, MACD, RSI
+from bar_store import BarStore
+from frame_store import FrameStore, frame_key
+from MyTT_stream import StreamKDJ, StreamMACD, StreamRSI
+from scheduler import Scheduler, parse_cadence
+from screener import read_codes
+from trading_calendar import HOLIDAYS_FILE, TradingCalendar
+
+store = BarStore()  # 本地K线缓存，之后每轮只拉取最新几根K线
+persist = FrameStore()  # 后台写入，只追加新增或变化的K线
+INDICATORS = ["K", "D", "J", "DIF", "DEA", "MACD", "RSI"]
+PRICES = ["close", "high", "low"]
+tracked = {}  # (代码, 周期) -> IndicatorStream; 同一任务同一时刻只有一个在跑, 不用加锁
+
+
+class IndicatorStream:
+    """一只股票一个周期的KDJ/MACD/RSI流式状态, 每轮只递推新增或修正的K线
 
-# 1. 获取光大银行sh601818的前复权行情数据
-count = 120 + 1  # 包含今天
-frequency = "1d"  # 日线数据
-code = "sh601818"
+    第一次, 或窗口里已算过的K线变了(除权后前复权价格整体变化、中间缺了K线)时,
+    按本轮的窗口从头递推, 结果与对这个窗口批量计算逐位一致
+    """
 
-while True:
-    # 使用修复版的腾讯接口获取前复权数据
-    df = get_price(code, end_date="", count=count, frequency=frequency)
-    print(f"获取到 {code} 的 {count} 天前复权数据:")
-    print(df.head())
-    print("...")
-    print(df.tail())
+    def __init__(self):
+        self.times = self.bars = self.values = None  # 上一轮的时间、价格和指标
 
-    # 2. 计算技术指标: KDJ, MACD, RSI
-    # 准备数据
-    CLOSE = df["close"].values
-    HIGH = df["high"].values
-    LOW = df["low"].values
+    def _reset(self):
+        self.kdj = StreamKDJ(9, 3, 3)
+        self.macd = StreamMACD(12, 26, 9)
+        self.rsi = StreamRSI(14)
 
-    # 计算KDJ (需要至少9天数据)
-    K, D, J = KDJ(CLOSE, HIGH, LOW, 9, 3, 3)
+    def _step(self, close, high, low, new_bar=True):
+        K, D, J = self.kdj.update(close, high, low, new_bar=new_bar)
+        DIF, DEA, MACD_BAR = self.macd.update(close, new_bar=new_bar)
+        return K, D, J, DIF, DEA, MACD_BAR, self.rsi.update(close, new_bar=new_bar)
 
-    # 计算MACD (需要至少26天数据)
-    DIF, DEA, MACD_BAR = MACD(CLOSE, 12, 26, 9)
+    # 本轮窗口接得上上一轮时返回 (上一轮最后一根在本轮的位置, 本轮首根在上一轮的位置)
+    def _resume(self, times, bars):
+        if self.times is None:
+            return None
+        i = times.searchsorted(self.times[-1])
+        j = self.times.searchsorted(times[0])
+        if i == len(times) or j == len(self.times) or len(self.times) - j != i + 1:
+            return None
+        same_times = (self.times[j:] == times[: i + 1]).all()
+        if not same_times or not np.array_equal(
+            self.bars[j:-1], bars[:i], equal_nan=True
+        ):
+            return None
+        return i, j
 
-    # 计算RSI (需要至少14天数据)
-    RSI_VALUE = RSI(CLOSE, 14)
+    def update(self, df):
+        """返回与df逐行对齐的指标数组, 列依次为INDICATORS"""
+        times, bars = df.index, df[PRICES].to_numpy(dtype=float)
+        out = np.empty((len(df), len(INDICATORS)))
+        resume = self._resume(times, bars)
+        if resume is None:
+            self._reset()
+            start = 0
+        else:
+            i, j = resume
+            out[:i] = self.values[j:-1]  # 已算过的K线沿用上一轮的结果
+            if np.array_equal(bars[i], self.bars[-1], equal_nan=True):
+                out[i] = self.values[-1]
+            else:  # 盘中未收盘的K线价格变了, 回到它之前的状态重算
+                out[i] = self._step(*bars[i], new_bar=False)
+            start = i + 1
+        for k in range(start, len(df)):
+            out[k] = self._step(*bars[k])
+        self.times, self.bars, self.values = times, bars, out
+        return out
 
-    # 将计算得到的技术指标添加到原始DataFrame中
+
+def update(code, frequency, df):
+    """一只股票的数据到达后立即更新技术指标: KDJ(至少9天数据), MACD(26天), RSI(14天)"""
+    # 流式计算: 只递推本轮新增或修正的K线, 不再每轮对整个窗口重算
     # 注意：由于技术指标计算需要历史数据，前期会有NaN值，这是正常现象
-    df["K"] = K
-    df["D"] = D
-    df["J"] = J
-    df["DIF"] = DIF
-    df["DEA"] = DEA
-    df["MACD"] = MACD_BAR
-    df["RSI"] = RSI_VALUE
-
-    # 打印带有技术指标的DataFrame的最后几行
-    print("\n技术指标的最后几行数据:")
-    print(df.tail())
-
-    # 可选：保存数据到CSV文件
-    df.to_csv(f"{code}_qfq_data_with_indicators.csv")
-    print(f"\n前复权数据已保存到 {code}_qfq_data_with_indicators.csv")
-
-    time.sleep(60)
+    stream = tracked.setdefault((code, frequency), IndicatorStream())
+    df[INDICATORS] = stream.update(df)
+
+    # 打印最新一根K线和指标
+    last = df.iloc[-1]
+    print(
+        f"{code} {frequency} {df.index[-1]} 收盘{last['close']:.2f} "
+        f"K{last['K']:.2f} D{last['D']:.2f} J{last['J']:.2f} "
+        f"MACD{last['MACD']:.3f} RSI{last['RSI']:.2f}"
+    )
+
+    # 交给后台写入，不阻塞下一只股票
+    persist.submit(frame_key(code, frequency), df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按交易时段轮询自选股并计算技术指标")
+    parser.add_argument("codes", nargs="*", help="股票代码, 默认 sh601818")
+    parser.add_argument("--codes-file", help="自选股文件, 每行一个代码, - 表示标准输入")
+    parser.add_argument(
+        "--cadence", default="1d=60", help="各周期的轮询间隔秒数, 如 1d=60,5m=30"
+    )
+    parser.add_argument("--count", type=int, default=120 + 1, help="每次取的K线数")
+    parser.add_argument("--workers", type=int, default=4, help="同时进行的请求数上限")
+    parser.add_argument(
+        "--jitter", type=float, default=0.1, help="轮询间隔的随机抖动比例"
+    )
+    parser.add_argument("--holidays", default=HOLIDAYS_FILE, help="节假日文件")
+    args = parser.parse_args(argv)
+
+    codes = read_codes(args) or ["sh601818"]
+    cadence = parse_cadence(args.cadence)
+    if not cadence:
+        parser.error("没有轮询周期")
+
+    def fetch(code, frequency):
+        # 使用修复版的腾讯接口获取前复权数据
+        return get_price(code, count=args.count, frequency=frequency, store=store)
+
+    scheduler = Scheduler(
+        codes,
+        cadence,
+        fetch,
+        update,
+        calendar=TradingCalendar(args.holidays),
+        max_workers=args.workers,
+        jitter=args.jitter,
+    )
+    print(f"Info: 跟踪{len(codes)}只股票, 周期 {args.cadence}, 并发{args.workers}")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 退出时导出CSV
+        persist.close()
+        for code in codes:
+            for frequency in cadence:
+                key = frame_key(code, frequency)
+                if persist.exists(key):
+                    csv_path = f"{key}_qfq_data_with_indicators.csv"
+                    persist.write_csv(key, csv_path)
+                    print(f"前复权数据已保存到 {csv_path}")
+        print(f"Info: {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+# -*- coding:utf-8 -*-    --------------延迟导入( https://github.com/ShiroRikka/ApexSignal )
+# pd = lazy("pandas"): 第一次用到 pd.xxx 时才真正导入模块, 只走numpy路径的代码不再为pandas付启动时间
+# 扫描时大量短命的子进程各自导入一遍, 省下的启动时间按进程数累计
+import importlib
+import sys
+
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):  # 实例上没有的属性才会走到这里, 取到后缓存在实例上
+        value = getattr(importlib.import_module(self._name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        state = "loaded" if self._name in sys.modules else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy(name):
+    return LazyModule(name)
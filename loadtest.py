@@ -0,0 +1,181 @@
+# -*- coding:utf-8 -*-    --------------Web接口压测( https://github.com/ShiroRikka/ApexSignal )
+# 多个线程各用一个长连接循环请求 /get_stock_data, 统计吞吐量和 p50/p95/p99 延迟
+# 同时给出压测期间的缓存命中和上游请求数, 区分瓶颈在上游、缓存还是接口本身
+#
+#   python upstream_stub.py --latency 30 &
+#   ASHARE_BASE_URL=http://127.0.0.1:8800 flask --app app run &
+#   python loadtest.py --concurrency 32 --duration 30 --synthetic 500 --upstream http://127.0.0.1:8800
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from screener import read_codes
+
+
+def synthetic_codes(n):  # 替身对任意代码都返回数据, 用大量不同代码压穿缓存
+    return [f"sh6{i:05d}" for i in range(n)]
+
+
+def fetch_json(url):  # 压测前后的计数快照, 取不到时返回空字典
+    try:
+        return requests.get(url, timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return {}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+        self.bytes = 0
+        self.end = None  # 最后一次请求完成的时间, 吞吐量不计入收尾的空闲
+
+    def add(self, latency, status, size):
+        with self.lock:
+            self.end = time.monotonic()
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.bytes += size
+
+
+def worker(args, codes, deadline, remaining, recorder):
+    session = requests.Session()
+    params = {"count": args.count, "frequency": args.frequency}
+    if args.format:
+        params["format"] = args.format
+    if args.window:
+        params["window"] = args.window
+    url = args.url.rstrip("/") + "/get_stock_data"
+    while time.monotonic() < deadline and next(remaining) > 0:
+        params["code"] = next(codes)
+        t0 = time.perf_counter()
+        try:
+            r = session.get(url, params=params, timeout=args.timeout)
+            status, size = r.status_code, len(r.content)
+        except requests.RequestException as e:
+            status, size = type(e).__name__, 0  # 连接失败和超时按异常名统计
+        recorder.add(time.perf_counter() - t0, status, size)
+
+
+def summarize(recorder, elapsed):
+    lat = np.array(recorder.latencies) * 1000
+    ok = recorder.statuses.get(200, 0) + recorder.statuses.get(304, 0)
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99]) if len(lat) else (np.nan,) * 3
+    return {
+        "requests": len(lat),
+        "ok": ok,
+        "statuses": {str(k): v for k, v in sorted(recorder.statuses.items(), key=str)},
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(lat) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "mean": round(float(lat.mean()), 2) if len(lat) else None,
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "p99": round(float(p99), 2),
+            "max": round(float(lat.max()), 2) if len(lat) else None,
+        },
+        "avg_bytes": round(recorder.bytes / len(lat)) if len(lat) else 0,
+    }
+
+
+def delta(after, before, keys):
+    return {k: after[k] - before.get(k, 0) for k in keys if k in after}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="压测 /get_stock_data 的吞吐和延迟")
+    parser.add_argument("codes", nargs="*", help="股票代码, 默认 sh601818")
+    parser.add_argument(
+        "--codes-file", help="股票列表文件, 每行一个代码, - 表示标准输入"
+    )
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="改用N个生成的代码, 配合上游替身使用"
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="app.py的地址")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发连接数")
+    parser.add_argument("--duration", type=float, default=10, help="压测秒数")
+    parser.add_argument("--requests", type=int, default=0, help="总请求数, 先到为止")
+    parser.add_argument("--count", type=int, default=120)
+    parser.add_argument("--frequency", default="1d")
+    parser.add_argument(
+        "--format", default="columns", help="columns为列式JSON, 空字符串为表格HTML"
+    )
+    parser.add_argument("--window", type=int, default=0, help="列式JSON只取最后N根")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--upstream", help="上游替身地址, 给出压测期间的上游请求数")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args(argv)
+
+    codes = synthetic_codes(args.synthetic) if args.synthetic else read_codes(args)
+    codes = itertools.cycle(codes or ["sh601818"])  # 多线程共享, next()在GIL下是原子的
+    remaining = (
+        itertools.count(args.requests, -1) if args.requests else itertools.repeat(1)
+    )
+    stats_url = args.url.rstrip("/") + "/cache_stats"
+    upstream_url = args.upstream.rstrip("/") + "/__stats" if args.upstream else None
+    cache_before = fetch_json(stats_url)
+    upstream_before = fetch_json(upstream_url) if upstream_url else {}
+
+    recorder = Recorder()
+    t0 = time.monotonic()
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(args, codes, t0 + args.duration, remaining, recorder),
+            daemon=True,
+        )
+        for _ in range(args.concurrency)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            while t.is_alive():  # 每秒刷新一次进度
+                t.join(1)
+                done, elapsed = len(recorder.latencies), time.monotonic() - t0
+                print(
+                    f"\r{elapsed:5.1f}s  {done}次  {done / elapsed:.1f}次/秒",
+                    end="",
+                    file=sys.stderr,
+                )
+    except KeyboardInterrupt:
+        pass
+    print(file=sys.stderr)
+
+    report = summarize(recorder, (recorder.end or time.monotonic()) - t0)
+    report["cache"] = delta(
+        fetch_json(stats_url), cache_before, ["hits", "misses", "coalesced"]
+    )
+    if upstream_url:
+        report["upstream"] = delta(
+            fetch_json(upstream_url), upstream_before, ["requests", "errors", "slow"]
+        )
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=1))
+        return
+    lat = report["latency_ms"]
+    print(
+        f"请求 {report['requests']}次, 成功 {report['ok']}次, 状态 {report['statuses']}"
+    )
+    print(f"吞吐 {report['throughput']}次/秒, 平均响应 {report['avg_bytes']}字节")
+    print(
+        f"延迟(ms) 平均{lat['mean']} p50 {lat['p50']} p95 {lat['p95']} "
+        f"p99 {lat['p99']} 最大{lat['max']}"
+    )
+    if report["cache"]:
+        print(f"缓存 {report['cache']}")
+    if upstream_url:
+        up = report["upstream"]
+        per = up.get("requests", 0) / max(report["requests"], 1)
+        print(f"上游 {up}, 平均每次请求 {per:.2f}次上游调用")
+
+
+if __name__ == "__main__":
+    main()
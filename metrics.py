@@ -0,0 +1,218 @@
+# -*- coding:utf-8 -*-    --------------分阶段耗时统计与Prometheus指标( https://github.com/ShiroRikka/ApexSignal )
+# with stage("名称"): 计时一段代码, 计入直方图 apexsignal_stage_seconds{stage="名称"}
+# with profile() as p: 收集当前线程内各阶段的耗时, 用于单个请求的分解
+# REGISTRY.render() 输出Prometheus文本格式, 不依赖prometheus_client
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(v):
+    v = float(v)
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(v)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, n=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # 标签 -> [各桶计数(不累计), 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(labels)
+            if v is None:
+                v = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            v[0][i] += 1
+            v[1] += value
+            v[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted(
+                (k, [list(v[0]), v[1], v[2]]) for k, v in self._values.items()
+            )
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                yield f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # 导出时才取值的指标, 如缓存统计
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """fn() -> [(名称, 类型, 说明, [(标签字典, 值)])], 类型为gauge或counter"""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for fn in self.collectors:
+            try:
+                families = fn()
+            except Exception as e:  # 某个统计出错不影响其他指标
+                print(f"Info: 指标采集失败: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(
+                        f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGES = REGISTRY.histogram(
+    "apexsignal_stage_seconds", "各处理阶段的耗时(秒)", ["stage"]
+)
+UPSTREAM = REGISTRY.counter(
+    "apexsignal_upstream_requests_total",
+    "各行情线路的调用次数(ok/error/invalid)",
+    ["provider", "result"],
+)
+FALLBACKS = REGISTRY.counter(
+    "apexsignal_upstream_fallbacks_total",
+    "主线路出错、熔断或对冲落后时改用备用线路的次数",
+    ["from", "to", "reason"],
+)
+# 用ContextVar而不是线程局部变量: 线程池任务用 contextvars.copy_context().run 提交时,
+# 在其他线程里的阶段也能记到同一个请求的profile里
+_depth = ContextVar("stage_depth", default=0)
+_profile = ContextVar("stage_profile", default=None)
+
+
+def observe(name, seconds):  # 记录一段已经算好的耗时, 如流水线里各运算的累计
+    STAGES.observe(seconds, name)
+    current = _profile.get()
+    if current is not None:
+        start = time.perf_counter() - seconds - current.origin
+        current.records.append((start, name, seconds, _depth.get()))
+
+
+@contextmanager
+def stage(name):
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        _depth.reset(token)
+        STAGES.observe(seconds, name)
+        current = _profile.get()
+        if current is not None:
+            current.records.append((t0 - current.origin, name, seconds, depth))
+
+
+@contextmanager
+def profile():
+    """收集当前上下文内的阶段耗时, 返回的Profile在with结束后可读"""
+    result = Profile()
+    token = _profile.set(result)
+    try:
+        yield result
+    finally:
+        result.total = time.perf_counter() - result.origin
+        _profile.reset(token)
+
+
+class Profile:
+    def __init__(self):
+        self.records = []  # (开始时刻, 阶段, 耗时, 嵌套深度), list.append是线程安全的
+        self.origin = time.perf_counter()
+        self.total = 0.0
+
+    def breakdown(self):  # 按开始时间排列, 嵌套阶段的耗时包含在外层之内
+        return [
+            {"stage": name, "ms": round(seconds * 1000, 3), "depth": depth}
+            for start, name, seconds, depth in sorted(
+                self.records, key=lambda r: (r[0], r[3])
+            )
+        ]
+
+    def server_timing(self):  # HTTP Server-Timing 头, 浏览器开发者工具里可以直接看
+        parts = [
+            f"{name};dur={seconds * 1000:.3f}"
+            for _, name, seconds, _ in sorted(self.records)
+        ]
+        return ", ".join(parts + [f"total;dur={self.total * 1000:.3f}"])
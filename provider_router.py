@@ -0,0 +1,214 @@
+# -*- coding:utf-8 -*-    --------------行情线路健康检查与熔断( https://github.com/ShiroRikka/ApexSignal )
+# 每条线路记录最近N次调用的成败和耗时; 出错率或慢请求过多时熔断, 冷却期内直接走备用线路
+# 只有网络错误、超时和HTTP 5xx算线路故障; 返回内容有误(解析失败、缺字段、代码不存在)时
+# 不重试也不计入熔断统计, 但仍换下一条线路, 全部失败才抛给调用方
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import FALLBACKS, UPSTREAM
+
+
+def is_transient(e):  # 线路本身的故障: 网络错误、超时(requests的异常都是OSError)和5xx
+    response = getattr(e, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return status >= 500
+    return isinstance(e, OSError)
+
+
+class ProviderHealth:  # 单条线路最近window次调用的滚动统计
+    def __init__(self, window=50, slow_call=None):
+        self.calls = deque(maxlen=window)  # (是否成功, 耗时秒)
+        self.slow_call = slow_call  # 超过该耗时的成功请求也算作不健康
+        self.open_until = 0.0  # 熔断截止时间, 0表示未熔断
+        self.probing = False  # 冷却期结束后只放行一个试探请求
+
+    def record(self, ok, latency):
+        self.calls.append((ok, latency))
+
+    def error_rate(self):
+        if not self.calls:
+            return 0.0
+        slow = self.slow_call or float("inf")
+        return sum(1 for ok, t in self.calls if not ok or t > slow) / len(self.calls)
+
+    def latency(self, q=0.95):  # 成功请求耗时的分位数, 无数据返回None
+        lat = sorted(t for ok, t in self.calls if ok)
+        if not lat:
+            return None
+        return lat[min(int(q * len(lat)), len(lat) - 1)]
+
+    def state(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.open_until == 0.0:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+
+class ProviderRouter:  # 按健康状况排序线路, 失败重试(指数退避)后切换到下一条
+    def __init__(
+        self,
+        retries=1,
+        backoff=0.2,
+        window=50,
+        error_threshold=0.5,
+        slow_call=5.0,
+        min_calls=5,
+        cooldown=30.0,
+        transient=is_transient,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.window = window
+        self.error_threshold = error_threshold  # 出错率达到该值即熔断
+        self.slow_call = slow_call
+        self.min_calls = min_calls  # 样本太少时不熔断
+        self.cooldown = cooldown
+        self.transient = transient  # 判断异常是否算线路故障
+        self.health = {}
+        self._lock = threading.Lock()
+        self._pool = None  # 对冲请求线程池, 首次使用时创建
+
+    def _health(self, name):
+        with self._lock:
+            if name not in self.health:
+                self.health[name] = ProviderHealth(self.window, self.slow_call)
+            return self.health[name]
+
+    def _acquire(self, name, force=False):  # 冷却期满时只放行一个试探请求
+        h = self._health(name)
+        with self._lock:
+            state = h.state()
+            if state == "closed":
+                return True
+            if force or (state == "half_open" and not h.probing):
+                h.probing = True
+                return True
+            return False
+
+    def record(self, name, ok, latency):
+        UPSTREAM.inc(name, "ok" if ok else "error")
+        h = self._health(name)
+        with self._lock:
+            if h.probing:  # 试探请求决定恢复还是继续熔断
+                h.probing = False
+                if ok:
+                    h.open_until = 0.0
+                    h.calls.clear()  # 恢复后重新统计
+                else:
+                    h.open_until = time.monotonic() + self.cooldown
+            h.record(ok, latency)
+            if (
+                h.open_until == 0.0
+                and len(h.calls) >= self.min_calls
+                and h.error_rate() >= self.error_threshold
+            ):
+                h.open_until = time.monotonic() + self.cooldown
+
+    def discard(self, name):  # 数据错误: 不计入健康统计, 试探请求的名额还回去
+        UPSTREAM.inc(name, "invalid")
+        h = self._health(name)
+        with self._lock:
+            h.probing = False
+
+    def call(self, providers):  # providers: [(线路名, 无参函数)], 按优先级排列
+        ready = [p for p in providers if self._health(p[0]).state() != "open"]
+        force = not ready  # 全部熔断时仍按原顺序尝试
+        error = failed = None
+        for name, fn in ready or providers:
+            if not self._acquire(name, force):
+                continue
+            if name != providers[0][0]:  # 记录切换原因: 前一条线路出错, 或主线路已熔断
+                FALLBACKS.inc(
+                    failed or providers[0][0], name, "error" if failed else "open"
+                )
+            for attempt in range(self.retries + 1):
+                t0 = time.monotonic()
+                try:
+                    result = fn()
+                except Exception as e:
+                    error = e
+                    if not self.transient(e):  # 数据错误不重试, 不计入熔断, 但仍换线路
+                        self.discard(name)
+                        failed = name
+                        break
+                    self.record(name, False, time.monotonic() - t0)
+                    if (
+                        attempt < self.retries
+                        and self._health(name).state() == "closed"
+                    ):
+                        time.sleep(self.backoff * 2**attempt)
+                        continue
+                    failed = name
+                    break
+                self.record(name, True, time.monotonic() - t0)
+                return result
+        if error is None:
+            raise RuntimeError("没有可用的行情线路")
+        raise error
+
+    def hedge_delay(self, name, q=0.95, default=1.0, floor=0.05):  # 按分位耗时发起对冲
+        lat = self._health(name).latency(q)
+        return default if lat is None else max(lat, floor)
+
+    def hedged_call(
+        self, providers, delay=None, q=0.95
+    ):  # 主线路超时未返回时同时请求备用线路
+        ready = [p for p in providers if self._health(p[0]).state() == "closed"]
+        if len(ready) < 2:
+            return self.call(providers)  # 有线路熔断时没必要对冲
+        (n1, f1), (n2, f2) = ready[:2]
+        delay = self.hedge_delay(n1, q) if delay is None else delay
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=16)
+        futures = [self._submit(n1, f1)]
+        done, _ = wait(futures, timeout=delay)
+        if not done or futures[0].exception() is not None:
+            futures.append(self._submit(n2, f2))
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    for other in pending:
+                        other.cancel()  # 已经在跑的请求无法中断, 结果直接丢弃
+                    if fut is not futures[0]:
+                        reason = "error" if futures[0].done() else "hedge"
+                        FALLBACKS.inc(n1, n2, reason)
+                    return fut.result()
+                error = fut.exception()
+        raise error
+
+    def _submit(self, name, fn):  # 带上调用方的上下文, 请求的分阶段耗时不丢
+        return self._pool.submit(contextvars.copy_context().run, self._timed, name, fn)
+
+    def _timed(self, name, fn):
+        t0 = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            if self.transient(e):
+                self.record(name, False, time.monotonic() - t0)
+            else:
+                self.discard(name)
+            raise
+        self.record(name, True, time.monotonic() - t0)
+        return result
+
+    def status(self):  # 各线路当前状态, 供监控使用
+        with self._lock:
+            items = list(self.health.items())
+        return {
+            name: {
+                "state": h.state(),
+                "calls": len(h.calls),
+                "error_rate": round(h.error_rate(), 3),
+                "p95": h.latency(0.95),
+            }
+            for name, h in items
+        }
@@ -0,0 +1,92 @@
+# -*- coding:utf-8 -*-    --------------进程内行情缓存( https://github.com/ShiroRikka/ApexSignal )
+# 按周期设置TTL, LRU淘汰; 同一个key并发未命中时只发起一次上游请求, 其余请求等待结果
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = {  # 秒, 分钟线变化快, 周线月线几乎不变
+    "1m": 10,
+    "5m": 30,
+    "15m": 60,
+    "30m": 60,
+    "60m": 60,
+    "1d": 30,
+    "1w": 300,
+    "1M": 600,
+}
+
+
+class _Call:  # 正在进行中的一次加载, 供并发请求等待
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QuoteCache:
+    def __init__(self, maxsize=256, ttl=None, default_ttl=30):
+        self.maxsize = maxsize
+        self.ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (过期时间, 值), 末尾为最近使用
+        self._calls = {}  # key -> _Call
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.coalesced = 0
+
+    def ttl_for(self, frequency):
+        return self.ttl.get(frequency, self.default_ttl)
+
+    def get(self, key, loader, ttl):  # 命中直接返回, 否则调用loader()并缓存ttl秒
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = loader()
+        except Exception as e:
+            call.error = e  # 失败不缓存, 等待中的请求一起收到异常
+            raise
+        else:
+            self._put(key, call.value, ttl)
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def _put(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
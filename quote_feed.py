@@ -0,0 +1,136 @@
+# -*- coding:utf-8 -*-    --------------行情推送分发( https://github.com/ShiroRikka/ApexSignal )
+# 每个 代码+周期 只有一个后台轮询线程: 拉取一次、计算一次, 把变化的K线推给所有订阅者
+# 最后一个订阅者离开时轮询线程退出, 上游请求数只随不同股票数增长, 与打开的页面数无关
+import queue
+import threading
+
+import numpy as np
+
+
+class _Subscriber:
+    def __init__(self, key, window, maxsize):
+        self.key = key
+        self.window = window  # 首次推送的K线根数, 0表示全部
+        self.queue = queue.Queue(maxsize)
+
+    def get(self, timeout=None):  # 返回 (事件名, 数据) , 超时返回None
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _Poller:
+    def __init__(self, key):
+        self.key = key
+        self.subscribers = set()
+        self.stop = threading.Event()
+        self.df = None  # 最近一次的结果, 供后来的订阅者取快照
+        self.thread = None
+
+
+def changed_from(old, new):
+    """new中第一根新增或数值变化的K线的位置, 与old完全相同时返回len(new)"""
+    if old is None or len(old) == 0 or list(old.columns) != list(new.columns):
+        return 0
+    pos = old.index.get_indexer(new.index)  # new的每根K线在old中的位置, 没有为-1
+    a = new.to_numpy(dtype=float)
+    b = old.to_numpy(dtype=float)[pos]
+    same = (pos >= 0) & np.all((a == b) | (np.isnan(a) & np.isnan(b)), axis=1)
+    changed = np.flatnonzero(~same)
+    return int(changed[0]) if len(changed) else len(new)
+
+
+class QuoteFeed:
+    def __init__(self, loader, encode, interval, maxsize=100):
+        self.loader = loader  # loader(key) -> 带指标的DataFrame
+        self.encode = encode  # encode(df) -> 推送的字符串, 每条消息只编码一次
+        self.interval = interval  # interval(key) -> 轮询间隔秒数
+        self.maxsize = maxsize  # 单个订阅者积压的消息数上限
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key, window=0):
+        sub = _Subscriber(key, window, self.maxsize)
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None:
+                poller = self._pollers[key] = _Poller(key)
+                poller.thread = threading.Thread(
+                    target=self._run, args=(poller,), daemon=True
+                )
+                poller.thread.start()
+            poller.subscribers.add(sub)
+            if poller.df is not None:
+                self._send(sub, "snapshot", self._snapshot(poller.df, window))
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            poller = self._pollers.get(sub.key)
+            if poller is None:
+                return
+            poller.subscribers.discard(sub)
+            if not poller.subscribers:  # 最后一个订阅者离开, 停止轮询
+                poller.stop.set()
+                del self._pollers[sub.key]
+
+    def _run(self, poller):
+        while not poller.stop.is_set():
+            try:
+                df = self.loader(poller.key)
+            except Exception as e:
+                self._broadcast(poller, "failure", str(e))
+            else:
+                if df is not None and not df.empty:
+                    self._publish(poller, df)
+            poller.stop.wait(self.interval(poller.key))
+
+    def _publish(self, poller, df):
+        start = changed_from(poller.df, df)
+        if start == len(df):
+            return  # 没有变化不推送
+        with self._lock:
+            first = poller.df is None
+            poller.df = df
+            if first or start == 0:  # 历史被改写(如除权)时重新发送快照
+                snapshots = {}  # 同样窗口的订阅者共用一次编码
+                for sub in poller.subscribers:
+                    if sub.window not in snapshots:
+                        snapshots[sub.window] = self._snapshot(df, sub.window)
+                    self._send(sub, "snapshot", snapshots[sub.window])
+                return
+        self._broadcast(poller, "delta", self.encode(df.iloc[start:]))
+
+    def _snapshot(self, df, window):
+        return self.encode(df.tail(window) if window > 0 else df)
+
+    def _broadcast(self, poller, event, data):
+        with self._lock:
+            subscribers = list(poller.subscribers)
+            df = poller.df
+        for sub in subscribers:
+            if not self._send(sub, event, data) and df is not None:
+                self._resync(sub, df)
+
+    def _send(self, sub, event, data):
+        try:
+            sub.queue.put_nowait((event, data))
+            return True
+        except queue.Full:
+            return False
+
+    def _resync(self, sub, df):  # 订阅者跟不上时丢掉积压的消息, 改发一次完整快照
+        while True:
+            try:
+                sub.queue.get_nowait()
+            except queue.Empty:
+                break
+        self._send(sub, "snapshot", self._snapshot(df, sub.window))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pollers": len(self._pollers),
+                "subscribers": sum(len(p.subscribers) for p in self._pollers.values()),
+            }
@@ -0,0 +1,161 @@
+# -*- coding:utf-8 -*-    --------------由1分钟K线本地合成多周期K线( https://github.com/ShiroRikka/ApexSignal )
+# 5m/15m/30m/60m和当天的日线都由1分钟K线在本地合成, 同一只股票多个周期只需请求一次上游
+# K线按结束时间标记, 与腾讯分钟线一致: 5m为09:35...11:30、13:05...15:00, 60m为10:30、11:30、14:00、15:00
+# 09:30集合竞价那根并入第一根, 合成的K线不跨午休也不跨日; 成交量单位与1分钟K线相同
+#
+#   df1 = get_price("sh601818", frequency="1m", count=240, store=store)
+#   df5 = resample(df1, "5m")
+#   book = Resampler(["5m", "60m", "1d"])
+#   book.update(df1)        # 之后每次只传新到的(可与已有的重叠)1分钟K线
+#   book.get("5m", count=48)
+#   join_daily(get_price("sh601818", count=120, store=store), book.get("1d", count=1))
+import numpy as np
+
+from lazy import lazy
+from trading_calendar import SESSIONS
+
+pd = lazy("pandas")
+
+BAR_FIELDS = ["open", "close", "high", "low", "volume"]
+FREQUENCIES = {"5m": 5, "15m": 15, "30m": 30, "60m": 60, "1d": 240}  # 每根的交易分钟数
+
+
+def _minutes(t):  # datetime.time -> 当天的第几分钟
+    return t.hour * 60 + t.minute
+
+
+# 时钟分钟 <-> 交易分钟(0-240)的分段线性对应, 午休期间停在上午收盘的120
+CLOCK = np.array([_minutes(t) for session in SESSIONS for t in session], dtype=float)
+TRADING = np.concatenate(
+    ([0.0], np.cumsum([_minutes(e) - _minutes(s) for s, e in SESSIONS]))
+).repeat(2)[1:-1]
+
+
+def trading_minute(times):  # 每根K线结束时是当天的第几个交易分钟, 时段外的夹到边界
+    times = np.asarray(times, dtype="M8[ns]")
+    clock = (times - times.astype("M8[D]")).astype("m8[m]").astype(float)
+    return np.interp(clock, CLOCK, TRADING)
+
+
+def labels(times, frequency):  # 每根1分钟K线所属的合成K线的时间标记
+    times = np.asarray(times, dtype="M8[ns]")
+    day = times.astype("M8[D]").astype("M8[ns]")
+    if frequency == "1d":
+        return day
+    n = FREQUENCIES[frequency]
+    # 所在那根的结束交易分钟, 09:30集合竞价(第0分钟)并入第一根
+    end = np.maximum(np.ceil(trading_minute(times) / n), 1) * n
+    clock = np.zeros_like(end)
+    for i, (s, e) in enumerate(SESSIONS):  # 交易分钟换回时钟, 正好在上午收盘时取11:30
+        lo, hi = TRADING[2 * i], TRADING[2 * i + 1]
+        inside = (end > lo) & (end <= hi)
+        clock[inside] = _minutes(s) + end[inside] - lo
+    return day + clock.astype("m8[m]").astype("m8[ns]")
+
+
+def aggregate(bars, label):  # 按已排序的标记合并相邻K线, bars为含time和OHLCV的numpy列
+    if len(label) == 0:
+        return {k: v[:0] for k, v in bars.items()}
+    start = np.flatnonzero(np.r_[True, label[1:] != label[:-1]])
+    end = np.r_[start[1:], len(label)] - 1
+    return {
+        "time": label[start],
+        "open": bars["open"][start],
+        "close": bars["close"][end],
+        "high": np.maximum.reduceat(bars["high"], start),
+        "low": np.minimum.reduceat(bars["low"], start),
+        "volume": np.add.reduceat(bars["volume"], start),
+    }
+
+
+def frame_columns(df):  # get_price的DataFrame -> numpy列
+    cols = {"time": df.index.values.astype("M8[ns]")}
+    cols.update((f, df[f].to_numpy()) for f in BAR_FIELDS)
+    return cols
+
+
+def columns_frame(cols):
+    return pd.DataFrame(
+        {f: cols[f] for f in BAR_FIELDS}, index=pd.DatetimeIndex(cols["time"], name="")
+    )
+
+
+def resample(df, frequency):
+    """1分钟K线DataFrame -> frequency周期的K线, 最后一根可能还没走完"""
+    cols = frame_columns(df)
+    return columns_frame(aggregate(cols, labels(cols["time"], frequency)))
+
+
+def join_daily(daily, today):  # 日线历史接上本地合成的日线, 重叠的日期以合成的为准
+    if today is None or today.empty:
+        return daily
+    return pd.concat([daily[daily.index < today.index[0]], today])
+
+
+class _Columns:  # 按时间追加的K线列, 容量翻倍增长, 尾部可以截断重写
+    def __init__(self):
+        self.n = 0
+        self.cols = None
+
+    def __len__(self):
+        return self.n
+
+    def truncate(self, t):  # 去掉时间>=t的K线
+        if self.n:
+            self.n = int(np.searchsorted(self.cols["time"][: self.n], t))
+
+    def append(self, cols):
+        m = len(cols["time"])
+        if self.cols is None:
+            self.cols = {k: np.empty(max(m, 1024), v.dtype) for k, v in cols.items()}
+        capacity = len(self.cols["time"])
+        if self.n + m > capacity:
+            size = max(capacity * 2, self.n + m)
+            for k, v in self.cols.items():
+                grown = np.empty(size, v.dtype)
+                grown[: self.n] = v[: self.n]
+                self.cols[k] = grown
+        for k, v in self.cols.items():
+            v[self.n : self.n + m] = cols[k]
+        self.n += m
+
+    def view(self, start=0):
+        if self.cols is None:
+            return {
+                k: np.empty(0, "M8[ns]" if k == "time" else float)
+                for k in ["time"] + BAR_FIELDS
+            }
+        return {k: v[start : self.n] for k, v in self.cols.items()}
+
+
+class Resampler:  # 一只股票的1分钟K线和合成的各周期, 新K线到达时只重算受影响的那一天
+    def __init__(self, frequencies=("5m", "15m", "30m", "60m", "1d")):
+        unknown = set(frequencies) - FREQUENCIES.keys()
+        if unknown:
+            raise ValueError(f"不支持合成的周期: {sorted(unknown)}")
+        self.frequencies = list(frequencies)
+        self.minutes = _Columns()
+        self.frames = {f: _Columns() for f in self.frequencies}
+
+    def update(self, df):
+        """加入新的1分钟K线; 与已有的重叠时以新的为准(最后一根会随成交更新)"""
+        if df is None or len(df) == 0:
+            return
+        new = frame_columns(df)
+        start = new["time"][0]
+        self.minutes.truncate(start)
+        self.minutes.append(new)
+        times = self.minutes.view()["time"]
+        # 合成的K线不跨日, 从start所在交易日的第一根开始重算
+        tail = self.minutes.view(int(np.searchsorted(times, start.astype("M8[D]"))))
+        for f in self.frequencies:
+            label = labels(tail["time"], f)
+            first = int(np.searchsorted(label, labels(new["time"][:1], f)[0]))
+            bars = aggregate({k: v[first:] for k, v in tail.items()}, label[first:])
+            self.frames[f].truncate(bars["time"][0])
+            self.frames[f].append(bars)
+
+    def get(self, frequency, count=None):  # 最后count根, 1m为缓存的1分钟K线
+        store = self.minutes if frequency == "1m" else self.frames[frequency]
+        start = 0 if count is None else max(len(store) - count, 0)
+        return columns_frame({k: v.copy() for k, v in store.view(start).items()})
@@ -0,0 +1,126 @@
+# -*- coding:utf-8 -*-    --------------按交易时段调度的多股票行情轮询( https://github.com/ShiroRikka/ApexSignal )
+# 每个 代码+周期 是一个任务, 按周期各自的间隔轮询; 同一周期的任务在间隔内错开并加随机抖动
+# 休市(午休、收盘后、周末、节假日)时不请求上游, 等到下次开盘再按间隔重新排开
+# 线程池限制并发请求数, 每只股票的数据一到就在同一线程里交给handler计算指标
+import datetime
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from trading_calendar import TradingCalendar
+
+
+def parse_cadence(text):  # "1d=60,5m=30" -> {"1d": 60.0, "5m": 30.0}
+    cadence = {}
+    for item in text.split(","):
+        if item.strip():
+            frequency, _, seconds = item.partition("=")
+            cadence[frequency.strip()] = float(seconds)
+    return cadence
+
+
+class _Job:
+    def __init__(self, code, frequency, interval, offset, slot):
+        self.code = code
+        self.frequency = frequency
+        self.interval = interval
+        self.offset = offset  # 开盘后第一次请求相对开盘的延迟, 把同周期的任务错开
+        self.slot = slot  # 相邻两个任务的间距
+        self.running = False
+
+
+class Scheduler:
+    def __init__(
+        self,
+        codes,
+        cadence,
+        fetch,
+        handler,
+        calendar=None,
+        max_workers=4,
+        jitter=0.1,
+        grace=120,
+    ):
+        self.fetch = fetch  # fetch(code, frequency) -> DataFrame
+        self.handler = handler  # handler(code, frequency, df), 在取数的线程里立即执行
+        self.calendar = calendar or TradingCalendar()
+        self.max_workers = max_workers
+        self.jitter = jitter  # 每次间隔随机伸缩的比例, 避免请求总落在同一时刻
+        self.grace = grace  # 收盘后再轮询grace秒, 拿到最后一根K线
+        self.jobs = []
+        for frequency, interval in cadence.items():
+            for i, code in enumerate(codes):
+                slot = interval / len(codes)
+                self.jobs.append(_Job(code, frequency, interval, slot * i, slot))
+        self._heap = []
+        self._seq = itertools.count()
+        self.fetched = self.failed = self.busy = self.closed = 0
+
+    def _delay(self, job):
+        return job.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _plan(self, start):  # 从start起把所有任务按各自的错开量重新排队
+        self._heap = []
+        for job in self.jobs:
+            due = start + job.offset + random.uniform(0, self.jitter) * job.slot
+            self._heap.append((due, next(self._seq), job))
+        heapq.heapify(self._heap)
+
+    def run(self, stop=None):
+        """阻塞运行直到stop被设置, stop为None时一直运行"""
+        stop = stop or threading.Event()
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            self._plan(time.time())
+            while not stop.is_set():
+                now = datetime.datetime.now()
+                if not self.calendar.is_open(now, self.grace):
+                    opening = self.calendar.next_open(now)
+                    self.closed += 1
+                    print(f"Info: 休市中, 下次开盘 {opening:%Y-%m-%d %H:%M}")
+                    while not stop.is_set():
+                        wait = (opening - datetime.datetime.now()).total_seconds()
+                        if wait <= 0:
+                            break
+                        stop.wait(
+                            min(wait, 60)
+                        )  # 分段等待, 系统休眠或改时间后能及时醒来
+                    self._plan(time.time())
+                    continue
+                self._dispatch(pool, time.time())
+                wait = self._heap[0][0] - time.time() if self._heap else 60
+                stop.wait(min(max(wait, 0), 30))
+
+    def _dispatch(self, pool, now):
+        while self._heap and self._heap[0][0] <= now:
+            due, _, job = heapq.heappop(self._heap)
+            if job.running:
+                self.busy += 1  # 上一次还没返回, 这一轮跳过, 不在池里排队堆积
+            else:
+                job.running = True
+                pool.submit(self._work, job)
+            due = max(due + self._delay(job), now)
+            heapq.heappush(self._heap, (due, next(self._seq), job))
+
+    def _work(self, job):
+        try:
+            df = self.fetch(job.code, job.frequency)
+            self.fetched += 1
+            if df is not None and not df.empty:
+                self.handler(job.code, job.frequency, df)
+        except Exception as e:
+            self.failed += 1
+            print(f"Info: {job.code} {job.frequency} 更新失败: {e}")
+        finally:
+            job.running = False
+
+    def stats(self):
+        return {
+            "jobs": len(self.jobs),
+            "fetched": self.fetched,
+            "failed": self.failed,
+            "busy": self.busy,
+            "closed": self.closed,
+        }
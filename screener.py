@@ -0,0 +1,153 @@
+# -*- coding:utf-8 -*-    --------------全市场选股扫描( https://github.com/ShiroRikka/ApexSignal )
+# 股票列表分块交给多个进程, 每个进程用线程池并发拉取行情, 用MyTT公式判断信号, 命中即输出
+#
+#   python screener.py "CROSS(MA(C,5), MA(C,20))" --codes-file codes.txt
+#   python screener.py "RSI < 30" sh601818 sz000001 --frequency 1d --count 120
+#   python screener.py "DIF:=EMA(C,12)-EMA(C,26); DEA:=EMA(DIF,9); XG:CROSS(DIF,DEA);" sh601818
+#   含分号的公式按通达信公式编译, 最后一个输出为选股条件
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+_pipelines = {}  # 每个进程按公式缓存展开好的流水线
+_store = None
+
+
+def _init_worker(store_root):
+    global _store
+    from Ashare import set_quiet
+
+    set_quiet()  # 多个进程同时拉取, 线路提示会刷屏
+    if store_root:
+        from bar_store import BarStore
+
+        _store = BarStore(store_root)
+
+
+def pipeline(formula):
+    from MyTT_pipeline import Pipeline
+
+    if ";" in formula:
+        from MyTT_formula import compile_formula
+
+        return compile_formula(formula)
+    return Pipeline([formula])
+
+
+def scan_chunk(codes, formula, frequency, count, lookback, threads):
+    """在子进程中扫描一批股票, 返回 [(代码, 是否命中, 最后时间, 收盘价)], 获取失败的不返回"""
+    from Ashare import get_prices
+
+    if formula not in _pipelines:
+        _pipelines[formula] = pipeline(formula)
+    pipe = _pipelines[formula]
+    dfs = get_prices(
+        codes, count=count, frequency=frequency, max_workers=threads, store=_store
+    )
+    rows = []
+    for code, df in dfs.items():
+        if df is None or df.empty:
+            continue
+        *_, signal = pipe.run(df).values()  # 只有一个公式时即为它的结果
+        signal = np.atleast_1d(np.asarray(signal, dtype=float))
+        recent = signal[-lookback:]
+        hit = bool(np.any(recent[~np.isnan(recent)] != 0))  # nan不算命中
+        rows.append((code, hit, str(df.index[-1]), float(df["close"].iloc[-1])))
+    return rows
+
+
+def read_codes(args):
+    codes = list(args.codes)
+    if args.codes_file:
+        if args.codes_file == "-":
+            lines = sys.stdin.readlines()
+        else:
+            with open(args.codes_file, encoding="utf-8") as f:
+                lines = f.readlines()
+        codes += [line.split("#")[0].strip() for line in lines]  # 支持#注释
+    return list(dict.fromkeys(c for c in codes if c))  # 去重, 保持顺序
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="用MyTT公式扫描股票列表, 实时输出命中的股票"
+    )
+    parser.add_argument(
+        "formula",
+        help='选股公式, 如 "CROSS(MA(C,5), MA(C,20))"、"RSI < 30" 或含分号的通达信公式',
+    )
+    parser.add_argument("codes", nargs="*", help="股票代码, 如 sh601818 sz000001")
+    parser.add_argument(
+        "--codes-file", help="股票列表文件, 每行一个代码, - 表示标准输入"
+    )
+    parser.add_argument("--frequency", default="1d", help="K线周期, 默认1d")
+    parser.add_argument("--count", type=int, default=120, help="每只股票拉取的K线数")
+    parser.add_argument(
+        "--lookback", type=int, default=1, help="最近几根K线内出现信号即算命中"
+    )
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--threads", type=int, default=8, help="每个进程的并发请求数")
+    parser.add_argument("--chunk", type=int, default=50, help="每个任务包含的股票数")
+    parser.add_argument(
+        "--store", help="本地K线缓存目录, 每日收盘后重复扫描时只拉取新K线"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        pipeline(args.formula)  # 先在主进程里检查公式, 免得每个子进程都报错
+    except (ValueError, SyntaxError, TypeError) as e:
+        parser.error(f"公式无效: {e}")
+    codes = read_codes(args)
+    if not codes:
+        parser.error("没有股票代码")
+
+    total, done, hits, failed, t0 = len(codes), 0, 0, 0, time.monotonic()
+    chunks = [codes[i : i + args.chunk] for i in range(0, total, args.chunk)]
+    with ProcessPoolExecutor(
+        args.processes, initializer=_init_worker, initargs=(args.store,)
+    ) as pool:
+        futures = {
+            pool.submit(
+                scan_chunk,
+                c,
+                args.formula,
+                args.frequency,
+                args.count,
+                args.lookback,
+                args.threads,
+            ): c
+            for c in chunks
+        }
+        for fut in as_completed(futures):
+            chunk = futures.pop(fut)
+            try:
+                rows = fut.result()
+            except Exception as e:
+                print(f"Info: {chunk[0]}等{len(chunk)}只扫描失败: {e}", file=sys.stderr)
+                rows = []
+            for code, hit, last, close in rows:
+                if hit:
+                    hits += 1
+                    print(f"{code}\t{last}\t{close:.2f}", flush=True)
+            done += len(chunk)
+            failed += len(chunk) - len(rows)
+            rate = done / (time.monotonic() - t0)
+            print(
+                f"[{done}/{total}] {done / total:.0%}  {rate:.1f}只/秒  "
+                f"命中{hits}  失败{failed}",
+                file=sys.stderr,
+                flush=True,
+            )
+    print(
+        f"扫描完成: {total}只, 命中{hits}只, 失败{failed}只, "
+        f"用时{time.monotonic() - t0:.1f}秒",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("flask")
+
+import app as web  # noqa: E402
+from frame_store import FrameStore  # noqa: E402
+
+
+class Upstream:  # 代替get_price, bars根K线, 可以追加新K线
+    def __init__(self, bars=150):
+        self.bars = bars
+
+    def __call__(self, code, end_date="", count=10, frequency="1d"):
+        step = "D" if frequency == "1d" else "5min"
+        index = pd.date_range("2024-01-01", periods=self.bars, freq=step, name="time")
+        close = 10 + np.sin(np.arange(self.bars) / 5)
+        df = pd.DataFrame(
+            {
+                "open": close - 0.1,
+                "close": close,
+                "high": close + 0.2,
+                "low": close - 0.2,
+                "volume": np.full(self.bars, 1e6),
+            },
+            index=index,
+        )
+        return df.tail(count)
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    upstream = Upstream()
+    store = FrameStore(root=str(tmp_path))
+    monkeypatch.setattr(web, "get_price", upstream)
+    monkeypatch.setattr(web, "frame_store", store)
+    web.quote_cache.clear()
+    web.body_cache.clear()
+    with web.app.test_client() as client:
+        client.upstream = upstream
+        yield client
+    store.close()
+
+
+URL = "/get_stock_data?code=sh601818&count=120&format=columns&window=10"
+
+
+def test_columns_and_etag(client):
+    response = client.get(URL)
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and weak
+    assert response.headers["Cache-Control"] == "no-cache"
+    data = response.get_json()
+    assert data["total_rows"] == 121  # 与/download一致, 多取一根
+    assert len(data["columns"]["time"]) == 10
+    assert {"K", "D", "J", "DIF", "DEA", "MACD", "RSI"} <= set(data["columns"])
+
+
+def test_unchanged_data_revalidates_with_304(client):
+    etag = client.get(URL).headers["ETag"]
+    response = client.get(URL, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_new_bar_changes_the_etag(client):
+    etag = client.get(URL).headers["ETag"]
+    client.upstream.bars += 1
+    web.quote_cache.clear()  # 缓存过期后重新取到多一根K线
+    response = client.get(URL, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_etag_depends_on_the_request(client):
+    a = client.get(URL).headers["ETag"]
+    b = client.get(URL.replace("window=10", "window=20")).headers["ETag"]
+    assert a != b
+
+
+def test_gzip_body_matches_plain(client):
+    plain = client.get(URL).get_json()
+    response = client.get(URL, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.data)) == plain
+
+
+def test_frequencies_are_stored_and_downloaded_separately(client):
+    daily = client.get(URL).get_json()
+    minute = client.get(URL.replace("code=", "frequency=5m&code=")).get_json()
+    assert daily["filename"] != minute["filename"]
+    web.frame_store.flush()
+    rows = {}
+    for name in (daily["filename"], minute["filename"]):
+        response = client.get(f"/download/{name}")
+        assert response.status_code == 200
+        rows[name] = response.data.decode().splitlines()
+    for name, step in ((daily["filename"], "1 days"), (minute["filename"], "5min")):
+        assert len(rows[name]) == 122  # 表头 + 121根, 两个周期没有混在一个文件里
+        times = pd.to_datetime([line.split(",")[0] for line in rows[name][1:]])
+        assert set(np.diff(times.values)) == {pd.Timedelta(step).to_timedelta64()}
+
+
+def test_download_rejects_unknown_keys(client):
+    client.get(URL)
+    web.frame_store.flush()
+    for name in ("sh601818_1d", "sh601818_2h", "../x"):
+        response = client.get(f"/download/{name}{web.CSV_SUFFIX}")
+        assert response.status_code == 404
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import sweep
+
+DATES = pd.date_range("2024-01-01", periods=10, name="time")
+
+
+def stock(close, dates=DATES):
+    close = np.asarray(close, dtype=float)
+    return pd.DataFrame(
+        {"open": close, "close": close, "high": close, "low": close, "volume": 1e6},
+        index=dates,
+    )
+
+
+def run(dfs):  # 一直持有: 收益即首尾价格之比
+    return sweep(dfs, "C > 0").set_index("code")
+
+
+def test_move_across_a_suspension_is_kept():
+    close = [10, 10.5, 11, 10, 9, 8, 7, 8, 8.5, 9]
+    gap = DATES.delete([4, 5, 6])  # 停牌三天, 面板里这几根为nan
+    result = run(
+        {
+            "full": stock(close),
+            "gap": stock([c for i, c in enumerate(close) if i not in (4, 5, 6)], gap),
+        }
+    )
+    assert result.loc["gap", "return"] == pytest.approx(9 / 10 - 1)
+    assert result.loc["full", "return"] == pytest.approx(9 / 10 - 1)
+    # 停牌前11, 复牌8: 跨缺口的下跌计入回撤
+    assert result.loc["gap", "max_drawdown"] == pytest.approx(1 - 8 / 11)
+    assert result.loc["gap", "trades"] == 1  # 停牌期间信号为nan, 不会平仓再买回
+    assert result.loc["gap", "exposure"] == pytest.approx(6 / 7)  # 第一根收盘才买入
+
+
+def test_bars_before_listing_do_not_count():
+    close = [20, 21, 22, 23, 24, 25, 26, 27, 28, 29]
+    result = run({"old": stock(close), "new": stock([5, 6, 5.5, 6.6], DATES[6:])})
+    assert result.loc["new", "return"] == pytest.approx(6.6 / 5 - 1)
+    assert result.loc["old", "return"] == pytest.approx(29 / 20 - 1)
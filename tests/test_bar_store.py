@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_store import BarStore
+
+# 最近的工作日, 测试的K线都截至这一天
+LAST = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=1)[0]
+
+
+def bars(n, end=LAST, scale=1.0):  # 截至end的n根日线
+    index = pd.bdate_range(end=end, periods=n).as_unit("ns")
+    close = scale * (10 + np.arange(n, dtype=float))
+    df = pd.DataFrame(
+        {
+            "open": close - 0.5,
+            "close": close,
+            "high": close + 1,
+            "low": close - 1,
+            "volume": 1000.0 + np.arange(n),
+        },
+        index=index,
+    )
+    df.index.name = "time"
+    return df
+
+
+class Upstream:  # 代替get_price, 记录每次请求的根数
+    def __init__(self, df):
+        self.df = df
+        self.counts = []
+
+    def __call__(self, code, count):
+        self.counts.append(count)
+        return self.df.iloc[-count:].copy()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(root=str(tmp_path))
+
+
+def test_first_call_fetches_everything_then_only_the_tail(store):
+    upstream = Upstream(bars(50))
+    first = store.get_price("sh600000", 30, "1d", upstream)
+    pd.testing.assert_frame_equal(first, upstream.df.iloc[-30:])
+    assert len(store.file("sh600000", "1d")) == 30
+
+    again = store.get_price("sh600000", 30, "1d", upstream)
+    assert upstream.counts[0] == 30
+    assert upstream.counts[1] < 30  # 只拉缺失的尾部加重叠校验的几根
+    pd.testing.assert_frame_equal(again, upstream.df.iloc[-30:], check_freq=False)
+
+
+def test_new_bar_is_appended(store):
+    upstream = Upstream(bars(40, end=LAST - pd.offsets.BDay(1)))
+    store.get_price("sh600000", 30, "1d", upstream)
+
+    upstream.df = bars(41)  # 多了一根, 之前的K线不变
+    df = store.get_price("sh600000", 30, "1d", upstream)
+    assert upstream.counts[-1] < 30
+    assert len(store.file("sh600000", "1d")) == 31
+    pd.testing.assert_frame_equal(df, upstream.df.iloc[-30:], check_freq=False)
+
+
+def test_unclosed_last_bar_is_revised_in_place(store):
+    upstream = Upstream(bars(40))
+    store.get_price("sh600000", 30, "1d", upstream)
+
+    upstream.df = upstream.df.copy()
+    upstream.df.iloc[-1, upstream.df.columns.get_loc("close")] += 0.25
+    df = store.get_price("sh600000", 30, "1d", upstream)
+    assert upstream.counts[-1] < 30
+    assert len(store.file("sh600000", "1d")) == 30
+    assert df["close"].iloc[-1] == upstream.df["close"].iloc[-1]
+
+
+def test_changed_history_triggers_a_full_refetch(store):
+    upstream = Upstream(bars(40))
+    store.get_price("sh600000", 30, "1d", upstream)
+
+    upstream.df = bars(40, scale=0.9)  # 除权后前复权价格整体改写
+    df = store.get_price("sh600000", 30, "1d", upstream)
+    assert upstream.counts[1] < 30 and upstream.counts[2] == 30  # 尾部校验失败后全量
+    pd.testing.assert_frame_equal(df, upstream.df.iloc[-30:])
+    stored = store.file("sh600000", "1d").read()
+    np.testing.assert_array_equal(stored["close"], upstream.df["close"].values[-30:])
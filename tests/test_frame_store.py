@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from frame_store import FrameStore, changed_range, frame_records
+
+FIELDS = ["open", "close", "high", "low", "volume"]
+
+
+def frame(start, stop, scale=1.0, k=0.0):  # 第start到stop-1根K线, 带一个指标列K
+    n = np.arange(start, stop, dtype=float)
+    close = scale * (10 + n)
+    index = pd.date_range("2024-01-01", periods=stop, name="time").as_unit("ns")
+    return pd.DataFrame(
+        {
+            "open": close,
+            "close": close,
+            "high": close + 1,
+            "low": close - 1,
+            "volume": 100 + n,
+            "K": n + k,
+        },
+        index=index[start:],
+    )
+
+
+def records(start, stop, **kwargs):
+    return frame_records(frame(start, stop, **kwargs))
+
+
+def test_changed_range_appends_new_bars():
+    old = records(0, 10)
+    assert changed_range(old, records(10, 12), FIELDS) == (10, 0)  # 全部是新K线
+    assert changed_range(old, records(5, 11), FIELDS) == (10, 5)  # 重叠部分不变
+
+
+def test_changed_range_rewrites_from_the_first_change():
+    old, new = records(0, 10), records(5, 11)
+    new["close"][4] += 0.5  # 第9根(未收盘)的价格变了
+    assert changed_range(old, new, FIELDS) == (9, 4)
+
+
+def test_changed_range_ignores_indicator_drift():
+    old, new = records(0, 10), records(5, 11, k=1e-9)
+    assert changed_range(old, new, FIELDS) == (10, 5)
+
+
+def test_changed_range_after_ex_dividend_keeps_older_history():
+    old, new = records(0, 10), records(5, 11, scale=0.9)
+    assert changed_range(old, new, FIELDS) == (5, 0)  # 第0-4根保留, 从重叠处改写
+
+
+def test_changed_range_with_misaligned_times():
+    old, new = records(0, 10), records(5, 11)
+    new["time"][2] += np.timedelta64(1, "h")
+    assert changed_range(old, new, FIELDS) == (5, 0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FrameStore(root=str(tmp_path), delay=60)  # 只在测试里手动flush
+    yield store
+    store.close()
+
+
+def test_sliding_window_appends_and_keeps_history(store):
+    store.submit("a", frame(0, 100))
+    store.flush()
+    store.submit("a", frame(1, 101))  # 取数窗口向后滑一根
+    store.flush()
+    df = store.read("a")
+    assert len(df) == 101
+    assert store.stats()["rows"] == 101
+    pd.testing.assert_frame_equal(df, frame(0, 101), check_freq=False)
+
+
+def test_ex_dividend_rewrites_only_the_window(store):
+    store.submit("a", frame(0, 100))
+    store.flush()
+    store.submit("a", frame(30, 101, scale=0.9))
+    df = store.read("a")
+    assert len(df) == 101
+    pd.testing.assert_frame_equal(df.iloc[:30], frame(0, 30), check_freq=False)
+    pd.testing.assert_frame_equal(
+        df.iloc[30:], frame(30, 101, scale=0.9), check_freq=False
+    )
+
+
+def test_only_the_latest_submit_is_written(store):
+    store.submit("a", frame(0, 50))
+    store.submit("a", frame(0, 60))
+    store.flush()
+    assert store.stats()["coalesced"] == 1
+    assert len(store.read("a")) == 60
+
+
+def test_older_generation_does_not_overwrite_newer(store):
+    store._write("a", frame(0, 60, k=2.0), generation=2)
+    store._write("a", frame(0, 50, k=1.0), generation=1)  # 后台线程晚到的旧数据
+    df = store.read("a")
+    assert len(df) == 60
+    assert df["K"].iloc[0] == 2.0
+
+
+def test_csv_export(store, tmp_path):
+    store.submit("a", frame(0, 20))
+    path = tmp_path / "a.csv"
+    store.write_csv("a", path)
+    df = pd.read_csv(path, index_col="time", parse_dates=True)
+    np.testing.assert_array_equal(df["close"].values, frame(0, 20)["close"].values)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import MyTT
+
+
+def loop_dma(S, A):  # 原来逐行循环的DMA, 作为逐位一致的参照
+    A = np.array(A, dtype=float)
+    A[np.isnan(A)] = 1.0
+    Y = np.zeros(len(S))
+    Y[0] = S[0]
+    for i in range(1, len(S)):
+        Y[i] = A[i] * S[i] + (1 - A[i]) * Y[i - 1]
+    return Y
+
+
+def test_dma_series_matches_the_loop():
+    rng = np.random.default_rng(4)
+    S, A = rng.normal(10, 1, (300, 3)), rng.uniform(0.05, 0.5, (300, 3))
+    S[100, 0], A[50, 1] = np.nan, np.nan
+    panel = MyTT.DMA(S, A)
+    for j in range(S.shape[1]):
+        expected = loop_dma(S[:, j], A[:, j])
+        np.testing.assert_array_equal(MyTT.DMA(S[:, j], A[:, j]), expected)
+        np.testing.assert_array_equal(panel[:, j], expected)
+
+
+ROLLING_CASES = {  # 经ROLLING按窗口求值的函数
+    "HHVBARS": lambda S, B: MyTT.HHVBARS(S, 20),
+    "LLVBARS": lambda S, B: MyTT.LLVBARS(S, 20),
+    "WMA": lambda S, B: MyTT.WMA(S, 20),
+    "AVEDEV": lambda S, B: MyTT.AVEDEV(S, 20),
+    "SLOPE": lambda S, B: MyTT.SLOPE(S, 20),
+    "FORCAST": lambda S, B: MyTT.FORCAST(S, 20),
+    "LAST": lambda S, B: MyTT.LAST(B, 10, 5),
+    "BARSSINCEN": lambda S, B: MyTT.BARSSINCEN(B, 10),
+    "CCI": lambda S, B: MyTT.CCI(S, S * 1.01, S * 0.99),
+}
+
+
+@pytest.mark.parametrize("name", ROLLING_CASES)
+def test_panel_matches_single_stocks(name):
+    rng = np.random.default_rng(5)
+    S = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (600, 7)), axis=0))
+    S[30:35, 2] = np.nan
+    B = S > np.roll(S, 1, axis=0)
+    f = ROLLING_CASES[name]
+    panel = f(S, B)
+    for j in range(S.shape[1]):
+        single = f(np.ascontiguousarray(S[:, j]), np.ascontiguousarray(B[:, j]))
+        np.testing.assert_array_equal(panel[:, j], single)  # 逐位一致, nan位置也相同
+        np.testing.assert_array_equal(f(S[:, j], B[:, j]), single)  # 不连续的列也一样
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import MyTT
+import MyTT_formula
+from MyTT_formula import compile_formula, evaluate, formula_hash, parse, tokens
+
+KDJ = "RSV:=(C-LLV(L,9))/(HHV(H,9)-LLV(L,9))*100; K:SMA(RSV,3,1); D:SMA(K,3,1);"
+
+
+def frame(n=300, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame(
+        {
+            "open": close * (1 + rng.normal(0, 0.005, n)),
+            "close": close,
+            "high": close * (1 + np.abs(rng.normal(0, 0.01, n))),
+            "low": close * (1 - np.abs(rng.normal(0, 0.01, n))),
+            "volume": rng.integers(1e5, 1e7, n).astype(float),
+        }
+    )
+
+
+def test_tokens_drop_comments_and_upper_names():
+    text = "rsv:=(c-llv(l,9)) {注释} // 行尾注释\n; k:sma(rsv,3,1);"
+    assert tokens(text) == (
+        "RSV := ( C - LLV ( L , 9 ) ) ; K : SMA ( RSV , 3 , 1 ) ;".split()
+    )
+
+
+def test_parse_statements():
+    text = "N:=9; K:MA(C,N),COLORRED; CROSS(K,50) AND C<>O OR NOT C=O;"
+    assert parse(text) == [
+        ("N", "9", False),  # := 是中间变量
+        ("K", "MA ( C , N )", True),  # 逗号后的画线属性忽略
+        (
+            "CROSS(K,50) AND C<>O OR NOT C=O",
+            "CROSS ( K , 50 ) and C != O or not C == O",
+            True,
+        ),
+    ]
+
+
+def test_results_match_mytt():
+    df = frame()
+    C, H, L = df["close"].values, df["high"].values, df["low"].values
+    result = evaluate(KDJ, df)
+    assert list(result) == ["K", "D"]
+    rsv = (C - MyTT.LLV(L, 9)) / (MyTT.HHV(H, 9) - MyTT.LLV(L, 9)) * 100
+    K = MyTT.SMA(rsv, 3, 1)
+    np.testing.assert_array_equal(result["K"], K)
+    np.testing.assert_array_equal(result["D"], MyTT.SMA(K, 3, 1))
+
+
+def test_logical_operators():
+    df = frame()
+    C, O = df["close"].values, df["open"].values
+    result = evaluate("UP:C>O AND C>REF(C,1); FLAT:C=O OR NOT C<>O;", df)
+    np.testing.assert_array_equal(result["UP"], (C > O) & (C > MyTT.REF(C, 1)))
+    np.testing.assert_array_equal(result["FLAT"], C == O)
+
+
+def test_constant_variables_and_shared_nodes_are_folded():
+    f = compile_formula("N:=9; A:LLV(L,N); B:HHV(H,N)-LLV(L,9);")
+    plan = f.describe()
+    assert plan.count("'min')") == 1  # 两处LLV(L,9)只算一次
+    assert "N" not in f.run(frame())  # 中间变量不输出
+
+
+def test_same_formula_shares_one_compiled_plan():
+    a = compile_formula(KDJ)
+    b = compile_formula(KDJ.lower().replace(";", " ;\n") + "{ 排版不同 }")
+    assert a is b
+    assert formula_hash(KDJ) == formula_hash(KDJ.replace(";", "; "))
+    assert formula_hash(KDJ) != formula_hash(KDJ.replace("9", "6"))
+
+
+def test_plan_cache_drops_the_oldest(monkeypatch):
+    monkeypatch.setattr(MyTT_formula, "PLAN_CACHE", 2)
+    monkeypatch.setattr(MyTT_formula, "_plans", {})
+    first = compile_formula("MA(C,5);")
+    compile_formula("MA(C,10);")
+    compile_formula("MA(C,20);")
+    assert len(MyTT_formula._plans) == 2
+    assert compile_formula("MA(C,5);") is not first  # 最早的已被丢掉, 重新编译
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("K:C#O;", "无法识别"),
+        ("MA:=C;", "重名"),
+        ("K:,COLORRED;", "没有表达式"),
+        ("N:=9;", "没有输出"),
+    ],
+)
+def test_errors(text, message):
+    with pytest.raises(ValueError, match=message):
+        compile_formula(text)
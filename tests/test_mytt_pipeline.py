@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+import MyTT
+from MyTT_pipeline import Pipeline, compute
+
+
+def frame(n=300, seed=2):
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    return pd.DataFrame(
+        {
+            "open": close * (1 + rng.normal(0, 0.005, n)),
+            "close": close,
+            "high": close * (1 + np.abs(rng.normal(0, 0.01, n))),
+            "low": close * (1 - np.abs(rng.normal(0, 0.01, n))),
+            "volume": rng.integers(1e5, 1e7, n).astype(float),
+        }
+    )
+
+
+def assert_identical(got, expected):
+    got = got if isinstance(got, tuple) else (got,)
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        np.testing.assert_array_equal(g, e)
+
+
+def test_results_match_direct_calls():
+    df = frame()
+    C, H, L = df["close"].values, df["high"].values, df["low"].values
+    result = Pipeline(["KDJ(9,3,3)", "MACD(12,26,9)", "RSI(14)", "BOLL(20,2)"]).run(df)
+    assert_identical(result["KDJ(9,3,3)"], MyTT.KDJ(C, H, L, 9, 3, 3))
+    assert_identical(result["MACD(12,26,9)"], MyTT.MACD(C, 12, 26, 9))
+    assert_identical(result["RSI(14)"], MyTT.RSI(C, 14))
+    assert_identical(result["BOLL(20,2)"], MyTT.BOLL(C, 20, 2))
+
+
+def test_shared_subexpressions_are_computed_once():
+    pipe = Pipeline(["KDJ(9,3,3)", "WR(9,6)", "RSI(14)", "PSY(12,6)"])
+    stats = pipe.stats()
+    assert stats["nodes"] < stats["calls"]  # KDJ和WR共用LLV(L,9)/HHV(H,9)
+    ops = [line.split(" = ", 1)[1] for line in pipe.describe().splitlines()]
+    ops = ops[: -len(pipe.specs)]  # 最后几行是各输出对应的节点
+    assert len(ops) == len(set(ops))  # 计划里没有重复的运算
+
+
+def test_spellings_of_the_same_call_share_a_node():
+    pipe = Pipeline(["MA(C,5)", "MA(CLOSE,5)", "MA(CLOSE,N=5)"])
+    assert pipe.describe().count("= MA(") == 1
+
+
+def test_unused_outputs_are_not_computed():
+    full, first = Pipeline(["MACD(12,26,9)"]), Pipeline(["MACD(12,26,9)[0]"])
+    assert first.stats()["computed"] < full.stats()["computed"]
+    df = frame()
+    np.testing.assert_array_equal(
+        first.run(df)["MACD(12,26,9)[0]"], MyTT.MACD(df["close"].values)[0]
+    )
+
+
+def test_formulas():
+    df = frame()
+    C = df["close"].values
+    result = compute(["CROSS(MA(C,5), MA(C,20))", "20 < RSI(14) < 80"], df)
+    expected = MyTT.CROSS(MyTT.MA(C, 5), MyTT.MA(C, 20))
+    np.testing.assert_array_equal(result["CROSS(MA(C,5), MA(C,20))"], expected)
+    rsi = MyTT.RSI(C, 14)
+    np.testing.assert_array_equal(result["20 < RSI(14) < 80"], (20 < rsi) & (rsi < 80))
+
+
+def test_panel_columns_match_single_stocks():
+    frames = [frame(seed=s) for s in range(3)]
+    panel = {
+        name: np.column_stack([f[col].values for f in frames])
+        for name, col in [("CLOSE", "close"), ("HIGH", "high"), ("LOW", "low")]
+    }
+    result = Pipeline(["KDJ(9,3,3)", "MACD(12,26,9)"]).run(**panel)
+    for j, f in enumerate(frames):
+        single = Pipeline(["KDJ(9,3,3)", "MACD(12,26,9)"]).run(f)
+        for spec, out in single.items():
+            assert_identical(tuple(x[:, j] for x in result[spec]), out)
+
+
+def test_timings_are_recorded_per_requested_spec():
+    specs = ["KDJ(9,3,3)", "MACD(12,26,9)", "RSI(14)"]
+    timings = {}
+    Pipeline(specs).run(frame(), timings=timings)
+    assert set(timings) == set(specs)
+    assert all(t > 0 for t in timings.values())
@@ -0,0 +1,169 @@
+import inspect
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import MyTT
+import MyTT_stream
+from get_stock_data import IndicatorStream
+from MyTT_stream import (
+    StreamEMA,
+    StreamHHV,
+    StreamLLV,
+    StreamMA,
+    StreamREF,
+    StreamSMA,
+    StreamSTD,
+    StreamSUM,
+)
+
+INPUTS = {"close": "C", "high": "H", "low": "L", "vol": "V"}  # _step参数名 -> 行情
+COMPOSITES = "MACD KDJ RSI WR BIAS BOLL PSY ATR BBI DMI TAQ KTN TRIX MTM ROC EXPMA OBV"
+
+
+def market(n=400, seed=1):
+    rng = np.random.default_rng(seed)
+    C = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.02, n))), 2)
+    C[150:160] = C[150]  # 一段停牌似的常数序列
+    H = np.round(C * (1 + np.abs(rng.normal(0, 0.01, n))), 2)
+    L = np.round(C * (1 - np.abs(rng.normal(0, 0.01, n))), 2)
+    V = rng.integers(1e5, 1e7, n).astype(float)
+    return {"C": C, "H": H, "L": L, "V": V}
+
+
+def with_gaps(S):  # 核心函数要处理nan: 开头和中间各缺几根
+    S = S.copy()
+    S[:3] = np.nan
+    S[200:205] = np.nan
+    return S
+
+
+def stack(out):  # 每根K线的结果 -> 序列, 多个输出时按输出分开
+    if isinstance(out[0], tuple):
+        return tuple(np.array(col, dtype=float) for col in zip(*out))
+    return np.array(out, dtype=float)
+
+
+def run(stream, *series):  # 逐根K线update
+    return stack([stream.update(*bar) for bar in zip(*series)])
+
+
+def run_revised(stream, *series):  # 每根K线先按未收盘的价格更新, 再修正成收盘价
+    out = []
+    for bar in zip(*series):
+        stream.update(*(x * 1.01 for x in bar))
+        stream.update(*(x * 0.99 for x in bar), new_bar=False)
+        out.append(stream.update(*bar, new_bar=False))
+    return stack(out)
+
+
+def assert_identical(got, expected):
+    got = got if isinstance(got, tuple) else (got,)
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        np.testing.assert_array_equal(g, np.asarray(e, dtype=float))  # 逐位一致
+
+
+CORE = [
+    ("EMA", lambda: StreamEMA(12), lambda S: MyTT.EMA(S, 12)),
+    ("SMA", lambda: StreamSMA(9, 2), lambda S: MyTT.SMA(S, 9, 2)),
+    ("SUM", lambda: StreamSUM(10), lambda S: MyTT.SUM(S, 10)),
+    ("CUMSUM", lambda: StreamSUM(0), lambda S: MyTT.SUM(S, 0)),
+    ("MA", lambda: StreamMA(20), lambda S: MyTT.MA(S, 20)),
+    ("STD", lambda: StreamSTD(20), lambda S: MyTT.STD(S, 20)),
+    ("HHV", lambda: StreamHHV(14), lambda S: MyTT.HHV(S, 14)),
+    ("LLV", lambda: StreamLLV(14), lambda S: MyTT.LLV(S, 14)),
+    ("REF", lambda: StreamREF(3), lambda S: MyTT.REF(S, 3)),
+]
+
+
+@pytest.mark.parametrize("name, stream, batch", CORE, ids=[c[0] for c in CORE])
+@pytest.mark.parametrize("gaps", [False, True], ids=["dense", "nan"])
+def test_core_matches_batch(name, stream, batch, gaps):
+    S = market()["C"]
+    S = with_gaps(S) if gaps else S
+    assert_identical(run(stream(), S), batch(S))
+
+
+@pytest.mark.parametrize("name, stream, batch", CORE, ids=[c[0] for c in CORE])
+def test_core_revisions_match_batch(name, stream, batch):
+    S = market()["C"]
+    assert_identical(run_revised(stream(), S), batch(S))
+
+
+def composite(name):  # 流式类和批量函数用相同参数, 没有默认值的周期取20
+    cls = getattr(MyTT_stream, f"Stream{name}")
+    params = [
+        20 if p.default is inspect.Parameter.empty else p.default
+        for p in inspect.signature(cls).parameters.values()
+    ]
+    inputs = [INPUTS[p] for p in inspect.signature(cls._step).parameters if p != "self"]
+    return cls, params, inputs
+
+
+@pytest.mark.parametrize("name", COMPOSITES.split())
+def test_indicators_match_batch(name):
+    cls, params, inputs = composite(name)
+    d = market()
+    series = [d[k] for k in inputs]
+    assert_identical(run(cls(*params), *series), getattr(MyTT, name)(*series, *params))
+
+
+@pytest.mark.parametrize("name", COMPOSITES.split())
+def test_indicator_revisions_match_batch(name):
+    cls, params, inputs = composite(name)
+    d = market()
+    series = [d[k] for k in inputs]
+    expected = getattr(MyTT, name)(*series, *params)
+    assert_identical(run_revised(cls(*params), *series), expected)
+
+
+def test_feed_then_update_continues_the_series():
+    d = market()
+    m = MyTT_stream.StreamMACD(12, 26, 9)
+    m.feed(d["C"][:-1])
+    last = m.update(d["C"][-1])
+    expected = MyTT.MACD(d["C"], 12, 26, 9)
+    assert [float(x) for x in last] == [float(e[-1]) for e in expected]
+
+
+def poll_window(d, stop, length=121):  # 轮询每次取到的最后length根K线
+    index = pd.date_range("2024-01-01", periods=len(d["C"]))
+    df = pd.DataFrame({"close": d["C"], "high": d["H"], "low": d["L"]}, index=index)
+    return df.iloc[max(stop - length, 0) : stop].copy()
+
+
+def batch_indicators(df):
+    C, H, L = (df[k].to_numpy() for k in ("close", "high", "low"))
+    return np.column_stack(
+        [*MyTT.KDJ(C, H, L, 9, 3, 3), *MyTT.MACD(C, 12, 26, 9), MyTT.RSI(C, 14)]
+    )
+
+
+def test_polling_streams_only_new_bars():
+    d, stream = market(), IndicatorStream()
+    first = poll_window(d, 121)
+    np.testing.assert_array_equal(stream.update(first), batch_indicators(first))
+
+    for stop in range(122, 160):  # 窗口每轮向后滑一根, 结果等于从第一根起的全量计算
+        out = stream.update(poll_window(d, stop))
+    full = batch_indicators(poll_window(d, stop, length=stop))
+    np.testing.assert_array_equal(out, full[-121:])
+
+    revised = poll_window(d, stop)  # 盘中最后一根的价格变了
+    revised.iloc[-1, 0] += 0.05
+    out = stream.update(revised)
+    full = batch_indicators(
+        pd.concat([poll_window(d, stop - 1, stop - 1), revised[-1:]])
+    )
+    np.testing.assert_array_equal(out, full[-121:])
+
+
+def test_polling_rebuilds_when_history_changes():
+    d, stream = market(), IndicatorStream()
+    stream.update(poll_window(d, 200))
+    adjusted = poll_window(d, 201)
+    adjusted[["close", "high", "low"]] *= 0.9  # 除权后前复权价格整体改写
+    np.testing.assert_array_equal(stream.update(adjusted), batch_indicators(adjusted))
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from provider_router import ProviderRouter
+
+
+def bad_json():  # 腾讯返回200但内容是HTML或被截断
+    return json.loads("<html>")
+
+
+def missing_key():
+    return {}["data"]
+
+
+def timeout():
+    raise TimeoutError("上游超时")
+
+
+@pytest.mark.parametrize("fail", [bad_json, missing_key, timeout])
+def test_falls_back_to_the_next_provider(fail):
+    router = ProviderRouter(backoff=0)
+    assert router.call([("tx", fail), ("sina", lambda: "ok")]) == "ok"
+    assert router.hedged_call([("tx", fail), ("sina", lambda: "ok")]) == "ok"
+
+
+def test_data_errors_do_not_trip_the_breaker():
+    router, calls = ProviderRouter(backoff=0, min_calls=2), []
+
+    def fail():
+        calls.append(1)
+        return bad_json()
+
+    for _ in range(5):
+        router.call([("tx", fail), ("sina", lambda: "ok")])
+    assert len(calls) == 5  # 不重试
+    assert router.status()["tx"]["state"] == "closed"
+    assert router.status()["tx"]["calls"] == 0
+
+
+def test_transient_errors_trip_the_breaker():
+    router = ProviderRouter(backoff=0, min_calls=2)
+    for _ in range(2):
+        router.call([("tx", timeout), ("sina", lambda: "ok")])
+    assert router.status()["tx"]["state"] == "open"
+
+
+def test_raises_the_last_error_when_every_provider_fails():
+    router = ProviderRouter(backoff=0)
+    with pytest.raises(KeyError):
+        router.call([("tx", bad_json), ("sina", missing_key)])
+    with pytest.raises(ValueError):
+        router.hedged_call([("tx", missing_key), ("sina", bad_json)], delay=1)
@@ -0,0 +1,109 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import quote_cache
+from quote_cache import QuoteCache
+
+
+class Clock:  # 代替time.monotonic, 手动推进
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(quote_cache, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.001)
+
+
+def test_hit_within_ttl_and_reload_after_expiry(clock):
+    cache, calls = QuoteCache(), []
+    load = lambda: calls.append(1) or len(calls)  # noqa: E731
+    assert cache.get("a", load, ttl=30) == 1
+    clock.now += 29
+    assert cache.get("a", load, ttl=30) == 1
+    clock.now += 2
+    assert cache.get("a", load, ttl=30) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_ttl_by_frequency():
+    cache = QuoteCache(ttl={"1d": 5}, default_ttl=7)
+    assert cache.ttl_for("1d") == 5
+    assert cache.ttl_for("1m") == quote_cache.DEFAULT_TTL["1m"]
+    assert cache.ttl_for("2h") == 7
+
+
+def test_lru_eviction(clock):
+    cache = QuoteCache(maxsize=2)
+    cache.get("a", lambda: "A", 30)
+    cache.get("b", lambda: "B", 30)
+    cache.get("a", lambda: "A2", 30)  # a变成最近使用
+    cache.get("c", lambda: "C", 30)
+    assert cache.get("a", lambda: "A3", 30) == "A"
+    assert cache.get("b", lambda: "B2", 30) == "B2"  # b被淘汰后重新加载
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_concurrent_misses_share_one_load():
+    cache, release, calls = QuoteCache(), threading.Event(), []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("k", load, 30)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    wait_for(lambda: cache.stats()["coalesced"] == 7)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_errors_reach_waiters_and_are_not_cached():
+    cache, release = QuoteCache(), threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ConnectionError("上游超时")
+
+    errors = []
+
+    def request():
+        try:
+            cache.get("k", fail, 30)
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for t in threads:
+        t.start()
+    wait_for(lambda: cache.stats()["coalesced"] == 2)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(errors) == 3
+    assert cache.get("k", lambda: "ok", 30) == "ok"
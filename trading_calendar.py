@@ -0,0 +1,54 @@
+# -*- coding:utf-8 -*-    --------------A股交易时段与节假日( https://github.com/ShiroRikka/ApexSignal )
+# 交易时段 09:30-11:30, 13:00-15:00; 周末和节假日文件里的日期休市
+import datetime
+import os
+
+SESSIONS = [
+    (datetime.time(9, 30), datetime.time(11, 30)),
+    (datetime.time(13, 0), datetime.time(15, 0)),
+]
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "holidays.txt")
+
+
+def load_holidays(path):  # 每行一个 YYYY-MM-DD, #后为注释
+    holidays = set()
+    if not path or not os.path.exists(path):
+        return holidays
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if line:
+                holidays.add(datetime.date.fromisoformat(line))
+    return holidays
+
+
+class TradingCalendar:
+    def __init__(self, holidays_file=HOLIDAYS_FILE, sessions=SESSIONS):
+        self.holidays = load_holidays(holidays_file)
+        self.sessions = sessions
+
+    def is_trading_day(self, day):
+        return day.weekday() < 5 and day not in self.holidays
+
+    def is_open(self, now=None, grace=0):  # grace秒: 收盘后再放行一会儿, 取到收盘价
+        now = now or datetime.datetime.now()
+        if not self.is_trading_day(now.date()):
+            return False
+        for start, end in self.sessions:
+            begin = datetime.datetime.combine(now.date(), start)
+            close = datetime.datetime.combine(now.date(), end)
+            if begin <= now < close + datetime.timedelta(seconds=grace):
+                return True
+        return False
+
+    def next_open(self, now=None):  # now之后(含)最近一次开盘的时间
+        now = now or datetime.datetime.now()
+        day = now.date()
+        for _ in range(366):
+            if self.is_trading_day(day):
+                for start, _end in self.sessions:
+                    begin = datetime.datetime.combine(day, start)
+                    if begin >= now:
+                        return begin
+            day += datetime.timedelta(days=1)
+        raise ValueError("一年内没有交易日, 请检查节假日文件")
@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-    --------------本地上游行情接口替身( https://github.com/ShiroRikka/ApexSignal )
+# 回放录制的腾讯 fqkline/get、kline/mkline 和新浪 getKLineData 响应, 任意股票代码都返回同一份K线
+# 可以设置延迟、随机错误和慢尾, 压测 app.py 时不再请求真实接口; /__stats 返回请求计数
+#
+#   python upstream_stub.py --latency 30 --error-rate 0.01 --tail-rate 0.02 --tail-latency 2000
+#   ASHARE_BASE_URL=http://127.0.0.1:8800 flask --app app run
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmarks", "fixtures"
+)
+CACHE_SIZE = 4096  # 缓存的响应数, 超过时丢掉最早的
+
+
+def tail(rows, n):  # 最后n根K线, 录制的不够时循环补足
+    if n <= len(rows):
+        return rows[len(rows) - n :]
+    return (rows * (n // len(rows) + 1))[-n:]
+
+
+def to_int(text, default):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return default
+
+
+class Replay:
+    def __init__(self, root=FIXTURES):
+        def load(name):
+            with open(os.path.join(root, name), encoding="utf-8") as f:
+                return json.load(f)
+
+        day, mins = load("tx_day.json"), load("tx_min.json")
+        stk = next(iter(day["data"].values()))
+        self.day = stk.get("qfqday") or stk["day"]
+        stk = next(iter(mins["data"].values()))
+        self.mins = next(v for k, v in stk.items() if k.startswith("m"))
+        self.sina = load("sina.json")
+        self._cache = {}  # (路径, 查询串) -> 编码好的响应, 每个实例各自一份
+        self._lock = threading.Lock()
+
+    def respond(self, path, query):  # 同样的请求直接返回编码好的响应, 替身不成为瓶颈
+        key = (path, query)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        body = self.build(path, query)
+        with self._lock:
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = body
+        return body
+
+    def build(self, path, query):
+        q = parse_qs(query)
+        if path.endswith("/fqkline/get"):
+            data = {}  # param=代码,day,起始日期,结束日期,根数,qfq, 打包请求时有多个param
+            for param in q.get("param", []):
+                code, unit, start, end, count, *_ = (param.split(",") + [""] * 6)[:6]
+                if start or end:  # 按日期取时只返回录制范围内的, 不循环补足
+                    rows = [r for r in self.day if start <= r[0] <= (end or "9999")]
+                    rows = rows[len(rows) - min(to_int(count, 10), len(rows)) :]
+                else:
+                    rows = tail(self.day, to_int(count, 10))
+                data[code] = {"qfq" + (unit or "day"): rows, "qt": {}}
+            return self.encode({"code": 0, "msg": "", "data": data})
+        if path.endswith("/kline/mkline"):  # param=代码,m5,,根数
+            code, ts, _, count = (q.get("param", [""])[0].split(",") + [""] * 4)[:4]
+            rows = tail(self.mins, to_int(count, 10))
+            quote = [rows[-1][2] if i == 3 else "" for i in range(10)]  # 最新价在第3位
+            stk = {ts: rows, "qt": {code: quote}}
+            return self.encode({"code": 0, "msg": "", "data": {code: stk}})
+        if path.endswith("getKLineData"):
+            return self.encode(tail(self.sina, to_int(q.get("datalen", [10])[0], 10)))
+        return None
+
+    @staticmethod
+    def encode(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class Faults:
+    def __init__(
+        self, latency=0, jitter=0, error_rate=0, tail_rate=0, tail_latency=0, seed=None
+    ):
+        self.latency = latency / 1000  # 毫秒 -> 秒
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate  # 按比例返回503
+        self.tail_rate = tail_rate  # 按比例慢响应, 模拟上游的长尾
+        self.tail_latency = tail_latency / 1000
+        self.random = random.Random(seed)
+
+    def draw(self):  # 返回(本次延迟秒数, 是否返回错误)
+        r = self.random.random()
+        if r < self.error_rate:
+            return self.latency, True
+        if r < self.error_rate + self.tail_rate:
+            return self.tail_latency, False
+        return self.latency + self.random.uniform(0, self.jitter), False
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, replay, faults):
+        super().__init__(address, Handler)
+        self.replay = replay
+        self.faults = faults
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "slow": 0, "not_found": 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 保持长连接, 与Ashare的连接池一致
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == "/__stats":
+            return self.send(200, json.dumps(server.stats()).encode())
+        server.count("requests")
+        delay, error = server.faults.draw()
+        if delay > server.faults.latency + server.faults.jitter:
+            server.count("slow")
+        time.sleep(delay)
+        if error:
+            server.count("errors")
+            return self.send(503, b"Service Unavailable", "text/plain")
+        body = server.replay.respond(url.path, url.query)
+        if body is None:
+            server.count("not_found")
+            return self.send(404, b"Not Found", "text/plain")
+        self.send(200, body)
+
+    def send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # 压测时逐条访问日志会拖慢替身
+        pass
+
+
+def serve(host="127.0.0.1", port=8800, fixtures=FIXTURES, **faults):
+    """创建替身服务器, 调用方负责 serve_forever() 和 shutdown()"""
+    return StubServer((host, port), Replay(fixtures), Faults(**faults))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回放录制行情的本地上游替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--fixtures", default=FIXTURES, help="录制响应所在目录")
+    parser.add_argument("--latency", type=float, default=0, help="每个响应的延迟毫秒数")
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="延迟额外随机增加的毫秒数上限"
+    )
+    parser.add_argument("--error-rate", type=float, default=0, help="返回503的比例")
+    parser.add_argument("--tail-rate", type=float, default=0, help="慢响应的比例")
+    parser.add_argument(
+        "--tail-latency", type=float, default=2000, help="慢响应的延迟毫秒数"
+    )
+    parser.add_argument("--seed", type=int, help="随机种子, 固定后错误和慢响应可复现")
+    args = parser.parse_args(argv)
+
+    server = serve(
+        args.host,
+        args.port,
+        args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        tail_rate=args.tail_rate,
+        tail_latency=args.tail_latency,
+        seed=args.seed,
+    )
+    print(f"Info: 上游替身 http://{args.host}:{args.port}  统计 /__stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Info: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()